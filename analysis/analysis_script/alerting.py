@@ -0,0 +1,380 @@
+import os
+import json
+import string
+import sqlite3
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+
+import data_store
+import kpi_aggregates
+
+# Configs
+RULES_PATH = os.path.join("analysis", "alert_rules.yaml")
+OUTBOX_PATH = os.path.join("data", "warehouse", "alerts_outbox.sqlite")
+SEVERITIES = ["info", "warning", "critical"]
+OPERATORS = {"lt": "<", "le": "<=", "gt": ">", "ge": ">=", "eq": "=", "ne": "<>", "in": "IN"}
+FIRING_BATCH_ROWS = 50000  # rows per executemany when copying matches into the outbox
+# Shared thresholds the rules file may reference as ${NAME}
+RULE_CONSTANTS = {name: getattr(kpi_aggregates, name) for name in [
+    "RISK_THRESHOLD_DAYS", "CRITICAL_DAYS", "SLA_DELAY_DAYS", "SEVERE_DELAY_DAYS", "LOW_SUPPLY_DAYS", "OVERSPEND_THRESHOLD_PCT"]}
+
+# Alert sources: the relation rules filter, the columns identifying an
+# alert's entity, and the store table whose changes trigger evaluation.
+# Sources with a ``changed`` predicate are narrowed to the rows touched by
+# the incremental batches since the last evaluation (order_ids staged in
+# _alert_changes); the others are snapshots, re-evaluated when re-ingested.
+SOURCES = {
+    "inventory": {
+        "table": "base_inventory_supply",
+        "keys": ["base", "supply_category"],
+        "relation": """
+            SELECT base, supply_category, inventory_units, avg_daily_consumption,
+                   days_remaining, inventory_status, last_updated
+            FROM base_inventory_supply
+        """
+    },
+    "delivery": {
+        "table": "supply_deliveries",
+        "keys": ["order_id"],
+        "relation": """
+            SELECT order_id, vendor, base, supply_category, expected_delivery_date,
+                   actual_delivery_date, delay_days, delivery_method, route_risk_level
+            FROM supply_deliveries
+        """,
+        "changed": "order_id IN (SELECT order_id FROM _alert_changes)"
+    },
+    "budget": {
+        "table": "supply_budget",
+        "keys": ["base", "supply_category"],
+        "relation": """
+            SELECT base, supply_category, budget_allocated, budget_spent, budget_variance, percent_spent
+            FROM agg_budget
+        """
+    },
+    "emergency_rate": {
+        "table": "supply_orders",
+        "keys": ["base"],
+        "relation": """
+            SELECT base, SUM(total_orders) AS total_orders, SUM(emergency_orders) AS emergency_orders,
+                   ROUND(100.0 * SUM(emergency_orders) / SUM(total_orders), 2) AS emergency_rate
+            FROM agg_emergency_daily
+            GROUP BY base
+        """,
+        "changed": "base IN (SELECT base FROM supply_orders WHERE order_id IN (SELECT order_id FROM _alert_changes))"
+    }
+}
+
+logger = logging.getLogger(__name__)
+
+def _require_yaml():
+    """Import the YAML parser, which is an optional dependency."""
+    try:
+        import yaml
+    except ImportError as e:
+        raise ImportError("Alert rules are written in YAML: pip install pyyaml") from e
+    return yaml
+
+def _substitute_constants(value):
+    """Replace ${NAME} in rule values; a value that is only a placeholder takes the constant's type."""
+    if isinstance(value, dict):
+        return {key: _substitute_constants(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute_constants(item) for item in value]
+    if isinstance(value, str):
+        if value.startswith("${") and value.endswith("}") and value[2:-1] in RULE_CONSTANTS:
+            return RULE_CONSTANTS[value[2:-1]]
+        return string.Template(value).substitute(RULE_CONSTANTS)
+    return value
+
+def load_rules(path=RULES_PATH):
+    """Read and validate the alert rules file, substituting ${NAME} constants from RULE_CONSTANTS."""
+    yaml = _require_yaml()
+    with open(path) as f:
+        rules = (yaml.safe_load(f) or {}).get("rules") or []
+    try:
+        rules = _substitute_constants(rules)
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Alert rules {path}: unknown or malformed constant {e} (expected one of {list(RULE_CONSTANTS)})") from e
+    names = set()
+    for rule in rules:
+        name = rule.get("name")
+        if not name or name in names:
+            raise ValueError(f"Alert rule names must be present and unique: {name!r}")
+        names.add(name)
+        if rule.get("source") not in SOURCES:
+            raise ValueError(f"Alert rule {name}: unknown source {rule.get('source')!r} (expected one of {list(SOURCES)})")
+        if rule.setdefault("severity", "warning") not in SEVERITIES:
+            raise ValueError(f"Alert rule {name}: severity must be one of {SEVERITIES}")
+        if not isinstance(rule.get("when"), dict) or not rule["when"]:
+            raise ValueError(f"Alert rule {name}: 'when' must map metrics to conditions")
+    return rules
+
+def compile_rule(rule, columns):
+    """Turn a rule's ``when`` mapping into a parameterized SQL predicate."""
+    clauses, params = [], []
+    for metric, conditions in rule["when"].items():
+        if metric not in columns:
+            raise ValueError(f"Alert rule {rule['name']}: {rule['source']} has no metric {metric!r}")
+        if not isinstance(conditions, dict):
+            conditions = {"eq": conditions}
+        for op, value in conditions.items():
+            if op not in OPERATORS:
+                raise ValueError(f"Alert rule {rule['name']}: unknown operator {op!r} (expected one of {list(OPERATORS)})")
+            if op == "in":
+                values = value if isinstance(value, list) else [value]
+                clauses.append(f"{metric} IN ({', '.join('?' for _ in values)})")
+                params.extend(values)
+            else:
+                clauses.append(f"{metric} {OPERATORS[op]} ?")
+                params.append(value)
+    return " AND ".join(clauses), params
+
+def compile_message(rule, columns):
+    """Turn a rule's str.format message template into a parameterized DuckDB format() call."""
+    template, args = [], []
+    for literal, field, spec, conversion in string.Formatter().parse(rule.get("message", rule["name"])):
+        template.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if field not in columns or conversion:
+            raise ValueError(f"Alert rule {rule['name']}: message placeholder {{{field}}} is not a {rule['source']} column")
+        template.append(f"{{:{spec}}}" if spec else "{}")
+        args.append(field)
+    return f"format({', '.join(['?'] + args)})", ["".join(template)]
+
+def connect_outbox(path=OUTBOX_PATH):
+    """Open the SQLite outbox holding alert state, pending events and evaluation markers."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    outbox = sqlite3.connect(path)
+    outbox.executescript("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            dedup_key TEXT PRIMARY KEY,
+            rule TEXT, severity TEXT, source TEXT, entity TEXT, message TEXT,
+            status TEXT, first_seen TEXT, last_seen TEXT, resolved_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS outbox (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedup_key TEXT, event TEXT, rule TEXT, severity TEXT, message TEXT,
+            payload TEXT, created_at TEXT, delivered_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS alerts_open ON alerts (rule, status);
+        CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (delivered_at, event_id);
+        CREATE TABLE IF NOT EXISTS evaluation_state (
+            source TEXT PRIMARY KEY, marker TEXT, rules_hash TEXT, evaluated_at TEXT
+        );
+    """)
+    return outbox
+
+def _source_marker(con, source):
+    """Current change marker of a source: its last logged batch for incremental feeds, else its ingest time."""
+    table = SOURCES[source]["table"]
+    if table in data_store.INCREMENTAL_TABLES:
+        row = con.execute("""
+            SELECT GREATEST((SELECT MAX(batch_id) FROM _change_log WHERE table_name = $1),
+                            (SELECT batch_id FROM _ingest_watermarks WHERE table_name = $1))
+        """, [table]).fetchone()
+        row = row if row[0] is not None else None
+    else:
+        row = con.execute("SELECT ingested_at FROM _ingest_manifest WHERE table_name = ?", [table]).fetchone()
+    return str(row[0]) if row else None
+
+def _stage_changes(con, source, last_marker):
+    """Stage order_ids changed since last_marker; return False when the whole source must be evaluated."""
+    if last_marker is None or "changed" not in SOURCES[source]:
+        return False
+    table = SOURCES[source]["table"]
+    reloaded = con.execute("""
+        SELECT COUNT(*) FROM _change_log WHERE table_name = ? AND batch_id > ? AND change_type = 'reload'
+    """, [table, int(last_marker)]).fetchone()[0]
+    if reloaded:
+        return False
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE _alert_changes AS
+        SELECT DISTINCT order_id FROM _change_log WHERE table_name = ? AND batch_id > ?
+    """, [table, int(last_marker)])
+    return True
+
+def _rules_hash(rules):
+    return hashlib.sha1(json.dumps(rules, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _stage_firing(con, outbox, spec, rules, relation, key_sql):
+    """Copy the rows matching any of the rules into the outbox's _firing temp table."""
+    columns = [row[0] for row in con.execute(f"DESCRIBE {spec['relation']}").fetchall()]
+    entity_sql = ", ".join(f"'{key}', r.{key}" for key in spec["keys"])
+    selects, params = [], []
+    for rule in rules:
+        predicate, predicate_params = compile_rule(rule, columns)
+        message_sql, message_params = compile_message(rule, columns)
+        selects.append(f"""
+            SELECT ? || '|' || {key_sql} AS dedup_key, ? AS rule, ? AS severity, {key_sql} AS entity_key,
+                   json_object({entity_sql}) AS entity,
+                   COALESCE({message_sql}, ? || ': ' || to_json(r)) AS message, to_json(r) AS payload
+            FROM {relation} r WHERE {predicate}
+        """)
+        params += [rule["name"], rule["name"], rule["severity"]] + message_params + [rule["name"]] + predicate_params
+
+    outbox.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS _firing (
+            dedup_key TEXT PRIMARY KEY, rule TEXT, severity TEXT, entity_key TEXT,
+            entity TEXT, message TEXT, payload TEXT
+        )
+    """)
+    outbox.execute("DELETE FROM _firing")
+    cur = con.execute(" UNION ALL ".join(selects), params)
+    while batch := cur.fetchmany(FIRING_BATCH_ROWS):
+        outbox.executemany("INSERT INTO _firing VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+
+def _evaluate_source(con, outbox, source, rules, now, baseline):
+    """Evaluate one source's rules over its changed rows and record opened/resolved alerts.
+
+    Matches are computed in DuckDB and copied to the outbox in batches; the
+    open/resolve transitions are then applied with set-based statements.
+    """
+    spec = SOURCES[source]
+    marker = _source_marker(con, source)
+    rules_hash = _rules_hash(rules)
+    state = outbox.execute("SELECT marker, rules_hash FROM evaluation_state WHERE source = ?", [source]).fetchone()
+    if marker is None or (state is not None and state == (marker, rules_hash)):
+        return {"opened": 0, "resolved": 0, "scoped": None, "baseline": False}
+    if baseline is None:
+        # A source's first evaluation records what is already open rather than paging on history
+        baseline = state is None
+
+    # Changed rules re-evaluate the whole source
+    scoped = state is not None and state[1] == rules_hash and _stage_changes(con, source, state[0])
+    scope_sql = f"WHERE {spec['changed']}" if scoped else ""
+    relation = f"(SELECT * FROM ({spec['relation']}) {scope_sql})"
+    key_sql = " || '|' || ".join(f"COALESCE(r.{key}::VARCHAR, '')" for key in spec["keys"])
+    _stage_firing(con, outbox, spec, rules, relation, key_sql)
+
+    # Open alerts of these rules that no longer match (within the re-evaluated entities)
+    names = [rule["name"] for rule in rules]
+    rule_list = ", ".join("?" for _ in names)
+    scope_filter = ""
+    if scoped:
+        outbox.execute("CREATE TEMP TABLE IF NOT EXISTS _scope (entity_key TEXT PRIMARY KEY)")
+        outbox.execute("DELETE FROM _scope")
+        cur = con.execute(f"SELECT DISTINCT {key_sql} FROM {relation} r")
+        while batch := cur.fetchmany(FIRING_BATCH_ROWS):
+            outbox.executemany("INSERT INTO _scope VALUES (?)", batch)
+        scope_filter = "AND substr(a.dedup_key, length(a.rule) + 2) IN (SELECT entity_key FROM _scope)"
+    outbox.execute("CREATE TEMP TABLE IF NOT EXISTS _resolving (dedup_key TEXT PRIMARY KEY)")
+    outbox.execute("DELETE FROM _resolving")
+    outbox.execute(f"""
+        INSERT INTO _resolving
+        SELECT a.dedup_key FROM alerts a
+        WHERE a.rule IN ({rule_list}) AND a.status = 'open'
+          AND NOT EXISTS (SELECT 1 FROM _firing f WHERE f.dedup_key = a.dedup_key) {scope_filter}
+    """, names)
+    new_firing = "NOT EXISTS (SELECT 1 FROM alerts a WHERE a.dedup_key = f.dedup_key AND a.status = 'open')"
+    resolved = outbox.execute("SELECT COUNT(*) FROM _resolving").fetchone()[0]
+    opened = outbox.execute(f"SELECT COUNT(*) FROM _firing f WHERE {new_firing}").fetchone()[0]
+
+    if not baseline:
+        outbox.execute("""
+            INSERT INTO outbox (dedup_key, event, rule, severity, message, payload, created_at)
+            SELECT dedup_key, 'resolved', rule, severity, message, entity, ? FROM alerts
+            WHERE dedup_key IN (SELECT dedup_key FROM _resolving)
+        """, [now])
+        outbox.execute(f"""
+            INSERT INTO outbox (dedup_key, event, rule, severity, message, payload, created_at)
+            SELECT dedup_key, 'opened', rule, severity, message, payload, ? FROM _firing f WHERE {new_firing}
+        """, [now])
+    outbox.execute("""
+        UPDATE alerts SET status = 'resolved', resolved_at = ?
+        WHERE dedup_key IN (SELECT dedup_key FROM _resolving)
+    """, [now])
+    # An alert stays open (keeping first_seen) while it matches; a resolved one reopens afresh
+    outbox.execute("""
+        INSERT INTO alerts
+        SELECT dedup_key, rule, severity, ?, entity, message, 'open', ?, ?, NULL FROM _firing WHERE true
+        ON CONFLICT (dedup_key) DO UPDATE SET
+            severity = excluded.severity, entity = excluded.entity, message = excluded.message,
+            first_seen = CASE WHEN alerts.status = 'open' THEN alerts.first_seen ELSE excluded.first_seen END,
+            last_seen = excluded.last_seen, status = 'open', resolved_at = NULL
+    """, [source, now, now])
+
+    outbox.execute("INSERT OR REPLACE INTO evaluation_state VALUES (?, ?, ?, ?)", [source, marker, rules_hash, now])
+    return {"opened": opened, "resolved": resolved, "scoped": scoped, "baseline": baseline}
+
+def evaluate_alerts(con, rules_path=RULES_PATH, outbox_path=OUTBOX_PATH, baseline=None):
+    """Evaluate the alert rules against rows changed since the last evaluation.
+
+    Sources whose store table has not changed are skipped. New matches are
+    recorded once per rule and entity (an alert stays open until a later
+    evaluation of that entity no longer matches) and each open/resolve
+    transition is queued in the outbox. With ``baseline`` the current state
+    is recorded without queuing events; by default that happens on a
+    source's first evaluation, so a long history is not paged out as new
+    alerts (pass ``baseline=False`` to queue them anyway). Returns
+    per-source counts.
+    """
+    rules = load_rules(rules_path)
+    by_source = {}
+    for rule in rules:
+        by_source.setdefault(rule["source"], []).append(rule)
+
+    now = datetime.now().isoformat(timespec="seconds")
+    results = {}
+    outbox = connect_outbox(outbox_path)
+    try:
+        with outbox:
+            for source, source_rules in by_source.items():
+                results[source] = _evaluate_source(con, outbox, source, source_rules, now, baseline)
+    finally:
+        outbox.close()
+    evaluated = {source: counts for source, counts in results.items() if counts["scoped"] is not None}
+    if evaluated:
+        logger.info(f"Alert rules evaluated: {evaluated}")
+    return results
+
+def refresh_alerts(con, rules_path=RULES_PATH, outbox_path=OUTBOX_PATH):
+    """Evaluate alerts as part of a store refresh; skipped when no rules file or PyYAML is available."""
+    if not os.path.exists(rules_path):
+        return None
+    try:
+        return evaluate_alerts(con, rules_path, outbox_path)
+    except ImportError as e:
+        logger.warning(f"Alert evaluation skipped: {e}")
+        return None
+
+def pending_events(outbox_path=OUTBOX_PATH, mark_delivered=False):
+    """Outbox events not yet delivered, oldest first; optionally mark them delivered."""
+    outbox = connect_outbox(outbox_path)
+    outbox.row_factory = sqlite3.Row
+    try:
+        with outbox:
+            events = [dict(row) for row in outbox.execute(
+                "SELECT * FROM outbox WHERE delivered_at IS NULL ORDER BY event_id")]
+            if mark_delivered and events:
+                outbox.execute("UPDATE outbox SET delivered_at = ? WHERE delivered_at IS NULL AND event_id <= ?",
+                               [datetime.now().isoformat(timespec="seconds"), events[-1]["event_id"]])
+    finally:
+        outbox.close()
+    return events
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Evaluate alert rules against newly ingested data")
+    parser.add_argument("--rules", default=RULES_PATH, help="YAML alert rules")
+    parser.add_argument("--outbox", default=OUTBOX_PATH, help="SQLite outbox")
+    parser.add_argument("--baseline", dest="baseline", action="store_const", const=True, default=None,
+                        help="record the current alert state without queuing outbox events "
+                             "(the default on a source's first evaluation)")
+    parser.add_argument("--fire-existing", dest="baseline", action="store_const", const=False,
+                        help="queue events for alerts already matching on a source's first evaluation")
+    parser.add_argument("--drain", action="store_true",
+                        help="print pending outbox events as JSON lines and mark them delivered")
+    args = parser.parse_args()
+    if not args.drain:
+        # Upsert new orders/deliveries and patch aggregates, then evaluate only what changed
+        with data_store.connect_store() as con:
+            kpi_aggregates.refresh_store(con, incremental=True)
+            evaluate_alerts(con, args.rules, args.outbox, baseline=args.baseline)
+    for event in pending_events(args.outbox, mark_delivered=args.drain):
+        if args.drain:
+            print(json.dumps(event, default=str))
+    if not args.drain:
+        logger.info(f"{len(pending_events(args.outbox))} alert events pending in {args.outbox}")
@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import data_store
+import kpi_aggregates
+import query_scheduler
+
+# Configs
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "report_templates")
+BASE_REPORT_TEMPLATE = "base_report.md.j2"
+OUTPUT_DIR = os.path.join("analysis", "base_reports")
+MANIFEST_FILE = "manifest.json"
+MAX_VENDORS = 5  # vendors listed per base, lowest on-time rate first
+LIKELY_STOCKOUT = 0.5  # stock-out probability that puts a category in the inventory table
+RENDER_CHUNK = 50  # reports per worker task
+
+# Per-base slices of the shared metrics, each computed once for every base;
+# every query returns a base column that the slices are split on.
+SLICE_QUERIES = {
+    "delivery": """
+        SELECT base,
+            SUM(deliveries)::BIGINT AS deliveries, SUM(delayed_deliveries)::BIGINT AS delayed_deliveries,
+            SUM(severely_delayed)::BIGINT AS severely_delayed, SUM(sla_breaches)::BIGINT AS sla_breaches,
+            ROUND(100.0 * SUM(on_time_deliveries) / SUM(deliveries), 2) AS on_time_pct,
+            ROUND(SUM(total_delay_days) / SUM(delay_samples), 2) AS avg_delay
+        FROM agg_vendor_daily
+        GROUP BY base
+    """,
+    "vendors": """
+        SELECT base, vendor, SUM(deliveries)::BIGINT AS deliveries,
+            ROUND(100.0 * SUM(on_time_deliveries) / SUM(deliveries), 2) AS on_time_pct,
+            ROUND(SUM(total_delay_days) / SUM(delay_samples), 2) AS avg_delay,
+            MAX(worst_delay) AS worst_delay
+        FROM agg_vendor_daily
+        GROUP BY base, vendor
+        ORDER BY base, on_time_pct, vendor
+    """,
+    "inventory": f"""
+        SELECT i.base, i.supply_category, i.inventory_units, i.days_remaining,
+            r.stockout_probability, f.stockout_date_early::DATE::VARCHAR AS stockout_date_early
+        FROM base_inventory_supply i
+        LEFT JOIN stockout_risk r USING (base, supply_category)
+        LEFT JOIN inventory_forecast f USING (base, supply_category)
+        WHERE i.days_remaining < {kpi_aggregates.RISK_THRESHOLD_DAYS} OR r.stockout_probability >= {LIKELY_STOCKOUT}
+        ORDER BY i.base, i.days_remaining, i.supply_category
+    """,
+    "budget": """
+        SELECT base, supply_category, budget_allocated, budget_spent, percent_spent
+        FROM agg_budget
+        ORDER BY base, percent_spent DESC, supply_category
+    """,
+    "emergency": f"""
+        SELECT * REPLACE (total_orders::BIGINT AS total_orders, emergency_orders::BIGINT AS emergency_orders)
+        FROM ({kpi_aggregates.EMERGENCY_ROLLUP_SQL.format(where="")})
+        ORDER BY base, emergency_rate DESC, supply_category
+    """,
+    "risk": """
+        SELECT base, base_risk_index, RANK() OVER (ORDER BY base_risk_index DESC NULLS LAST) AS risk_rank
+        FROM kpi_base_risk
+    """,
+    "transfers": """
+        SELECT from_base AS base, 'Outgoing' AS direction, to_base AS partner_base, supply_category, units, transport_cost
+        FROM redistribution_plan
+        UNION ALL
+        SELECT to_base AS base, 'Incoming' AS direction, from_base AS partner_base, supply_category, units, transport_cost
+        FROM redistribution_plan
+        ORDER BY base, direction, supply_category, partner_base
+    """
+}
+# Single-row slices shown in every report
+SINGLE_ROW_SLICES = ["delivery", "risk"]
+
+# All-base figures every report compares against
+FLEET_SQL = """
+    SELECT
+        COUNT(DISTINCT base) AS bases,
+        ROUND(100.0 * SUM(on_time_deliveries) / SUM(deliveries), 2) AS on_time_pct,
+        ROUND(SUM(total_delay_days) / SUM(delay_samples), 2) AS avg_delay,
+        MIN(actual_delivery_date)::VARCHAR AS earliest_delivery,
+        MAX(actual_delivery_date)::VARCHAR AS latest_delivery
+    FROM agg_vendor_daily
+"""
+
+logger = logging.getLogger(__name__)
+
+_template = None
+
+def _require_jinja2():
+    """Import Jinja2 (installed with Dash/Flask), which is an optional dependency."""
+    try:
+        import jinja2
+    except ImportError as e:
+        raise ImportError("Per-base reports are rendered with Jinja2: pip install jinja2") from e
+    return jinja2
+
+def load_template(template_dir=TEMPLATE_DIR, name=BASE_REPORT_TEMPLATE):
+    """Compile the report template once; Jinja2 turns it into Python code reused for every base."""
+    jinja2 = _require_jinja2()
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir), trim_blocks=True,
+                             lstrip_blocks=True, keep_trailing_newline=True, undefined=jinja2.StrictUndefined)
+    return env.get_template(name)
+
+def template_hash(template_dir=TEMPLATE_DIR, name=BASE_REPORT_TEMPLATE):
+    """Fingerprint of the template source, so template edits re-render every report."""
+    with open(os.path.join(template_dir, name), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+def report_filename(base):
+    """File-system safe report name of a base, suffixed with a hash of the raw name.
+
+    The hash keeps names such as "Camp A-B" and "Camp A B", which slug to
+    the same text, from overwriting each other's report.
+    """
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", base).strip("_").lower()
+    return f"{slug}_{hashlib.sha1(base.encode()).hexdigest()[:8]}.md"
+
+def _records(df):
+    """DataFrame rows as plain dicts with None for missing values."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+def compute_slices(con):
+    """Run the shared metric queries once and split them into one context per base."""
+    queries = {name: (sql, "df") for name, sql in SLICE_QUERIES.items()}
+    queries["fleet"] = (FLEET_SQL, "df")
+    frames, _ = query_scheduler.run_queries(con, queries)
+    fleet = _records(frames.pop("fleet"))[0]
+    grouped = {name: dict(tuple(df.groupby("base", sort=False))) for name, df in frames.items()}
+    bases = sorted(set().union(*(groups.keys() for groups in grouped.values())))
+
+    empty = {name: df.iloc[0:0] for name, df in frames.items()}
+    contexts = {}
+    for base in bases:
+        context = {"base": base, "fleet": fleet}
+        for name, groups in grouped.items():
+            rows = _records(groups.get(base, empty[name]).drop(columns="base"))
+            context[name] = (rows[0] if rows else None) if name in SINGLE_ROW_SLICES else rows
+        contexts[base] = context
+    return contexts
+
+def slice_hash(context, template_digest):
+    """Fingerprint of one base's inputs: its metric slices, the all-base figures and the template."""
+    payload = json.dumps([context, template_digest], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def _template_settings():
+    """Thresholds the template prints next to the metrics."""
+    return {
+        "sla_delay_days": kpi_aggregates.SLA_DELAY_DAYS,
+        "severe_delay_days": kpi_aggregates.SEVERE_DELAY_DAYS,
+        "risk_threshold_days": kpi_aggregates.RISK_THRESHOLD_DAYS,
+        "overspend_threshold_pct": kpi_aggregates.OVERSPEND_THRESHOLD_PCT,
+        "max_vendors": MAX_VENDORS
+    }
+
+def _init_worker(template_dir):
+    """Compile the template once per worker process."""
+    global _template
+    _template = load_template(template_dir)
+
+def render_chunk(jobs, generated, template_dir=TEMPLATE_DIR):
+    """Render and write a batch of (context, path) reports with the compiled template."""
+    if _template is None:
+        _init_worker(template_dir)
+    settings = _template_settings()
+    for context, path in jobs:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(_template.render(**context, **settings, generated=generated))
+    return len(jobs)
+
+def _read_manifest(output_dir):
+    """Input hash per base from the previous run."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def render_base_reports(con, output_dir=OUTPUT_DIR, template_dir=TEMPLATE_DIR, workers=None, force=False):
+    """Render one Markdown report per base from a single shared computation of the metrics.
+
+    A report is only re-rendered when the hash of its input slice (or the
+    template) differs from the manifest of the last run; reports of bases
+    that disappeared are removed. ``workers`` > 1 renders in chunks on
+    worker processes. Returns ``(rendered, skipped)`` counts.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    template_digest = template_hash(template_dir)
+    contexts = compute_slices(con)
+    previous = _read_manifest(output_dir)
+
+    manifest, jobs = {}, []
+    for base, context in contexts.items():
+        path = os.path.join(output_dir, report_filename(base))
+        digest = slice_hash(context, template_digest)
+        manifest[base] = {"file": os.path.basename(path), "input_hash": digest}
+        if force or previous.get(base, {}).get("input_hash") != digest or not os.path.exists(path):
+            jobs.append((context, path))
+
+    generated = datetime.now().strftime("%Y-%m-%d")
+    chunks = [jobs[i:i + RENDER_CHUNK] for i in range(0, len(jobs), RENDER_CHUNK)]
+    workers = workers or 1
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(template_dir,)) as pool:
+            rendered = sum(pool.map(render_chunk, chunks, [generated] * len(chunks)))
+    else:
+        _init_worker(template_dir)
+        rendered = sum(render_chunk(chunk, generated) for chunk in chunks)
+
+    # Reports of bases that disappeared, or written under an earlier file name
+    current_files = {entry["file"] for entry in manifest.values()}
+    for entry in previous.values():
+        path = os.path.join(output_dir, entry["file"])
+        if entry["file"] not in current_files and os.path.exists(path):
+            os.remove(path)
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    skipped = len(contexts) - rendered
+    logger.info(f"Per-base reports: {rendered} rendered, {skipped} unchanged, in {output_dir}")
+    return rendered, skipped
+
+if __name__ == "__main__":
+    import logistics_kpi_analyzer as analyzer
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Render one performance report per base, skipping unchanged bases")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="directory for the per-base Markdown reports")
+    parser.add_argument("--workers", type=int, help="worker processes rendering reports (default: render in-process)")
+    parser.add_argument("--force", action="store_true", help="re-render every report even if its inputs are unchanged")
+    parser.add_argument("--incremental", action="store_true", help="upsert only new or changed orders before rendering")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        analyzer.load_data_sources(con, incremental=args.incremental)
+        render_base_reports(con, args.output_dir, workers=args.workers, force=args.force)
@@ -0,0 +1,220 @@
+import time
+import hashlib
+import logging
+import argparse
+
+import data_store
+
+# Configs
+COST_ROUNDING = 0.005  # unit_cost is rounded to the cent, so total_cost may drift half a cent per unit
+DAYS_REMAINING_TOLERANCE = 1.0  # days of cover allowed between reported and recomputed days_remaining
+SAMPLE_MIN_ROWS = 1_000_000  # in sampled mode only tables larger than this are sampled
+SAMPLE_BUCKETS = 10000
+
+QUARANTINE_TABLE = "dq_quarantine"
+SUMMARY_TABLE = "dq_summary"
+SUMMARY_VERSION = 2  # bump when the summary layout changes so stores rebuild it
+
+# Rules per store table: the row key written to the quarantine, the relation
+# the rules read (with the joins and window counts cross-row rules need) and
+# rule name -> (severity, violation predicate). All rules of a table are
+# evaluated in one fused pass over its relation. {supply_orders} etc. stand
+# for the (possibly sampled) store tables.
+RULES = {
+    "supply_orders": {
+        "key": "order_id",
+        "source": """
+            SELECT o.*,
+                COUNT(*) OVER (PARTITION BY o.order_id) AS key_rows,
+                d.order_id IS NULL AS undelivered
+            FROM {supply_orders} o
+            LEFT JOIN (SELECT DISTINCT order_id FROM {supply_deliveries}) d ON o.order_id = d.order_id
+        """,
+        "rules": {
+            "missing_order_fields": ("Error", """
+                order_id IS NULL OR order_date IS NULL OR base IS NULL OR vendor IS NULL
+                OR supply_category IS NULL OR units_ordered IS NULL OR unit_cost IS NULL OR total_cost IS NULL
+            """),
+            "duplicate_order_ids": ("Error", "order_id IS NOT NULL AND key_rows > 1"),
+            "cost_mismatches": ("Error", f"ABS(total_cost - units_ordered * unit_cost) > ABS(units_ordered) * {COST_ROUNDING} + 0.01"),
+            "orphaned_orders": ("Warning", "undelivered")
+        }
+    },
+    "supply_deliveries": {
+        "key": "order_id",
+        "source": """
+            SELECT d.*,
+                COUNT(*) OVER (PARTITION BY d.order_id) AS key_rows,
+                o.order_date
+            FROM {supply_deliveries} d
+            LEFT JOIN (
+                SELECT order_id, MIN(order_date) AS order_date FROM {supply_orders} GROUP BY order_id
+            ) o ON d.order_id = o.order_id
+        """,
+        "rules": {
+            "missing_delivery_dates": ("Warning", "actual_delivery_date IS NULL OR expected_delivery_date IS NULL"),
+            "duplicate_delivery_ids": ("Error", "order_id IS NOT NULL AND key_rows > 1"),
+            "delivery_before_order": ("Error", "actual_delivery_date < order_date")
+        }
+    },
+    "base_inventory_supply": {
+        "key": "concat_ws('|', base, supply_category)",
+        "source": """
+            SELECT *, COUNT(*) OVER (PARTITION BY base, supply_category) AS key_rows
+            FROM {base_inventory_supply}
+        """,
+        "rules": {
+            "missing_inventory_fields": ("Error", """
+                base IS NULL OR supply_category IS NULL OR inventory_units IS NULL
+                OR avg_daily_consumption IS NULL OR days_remaining IS NULL
+            """),
+            "negative_inventory": ("Error", "inventory_units < 0 OR avg_daily_consumption <= 0"),
+            "days_remaining_mismatch": ("Warning", f"""
+                avg_daily_consumption > 0
+                AND ABS(days_remaining - inventory_units / avg_daily_consumption) > {DAYS_REMAINING_TOLERANCE}
+            """),
+            "duplicate_positions": ("Error", "key_rows > 1")
+        }
+    },
+    "supply_budget": {
+        "key": "concat_ws('|', base, supply_category)",
+        "source": """
+            SELECT *, COUNT(*) OVER (PARTITION BY base, supply_category) AS key_rows
+            FROM {supply_budget}
+        """,
+        "rules": {
+            "missing_budget_data": ("Warning", "budget_allocated IS NULL OR budget_spent IS NULL"),
+            "duplicate_budget_lines": ("Error", "key_rows > 1")
+        }
+    }
+}
+
+logger = logging.getLogger(__name__)
+
+def rules_version():
+    """Fingerprint of the rule set, sampling floor and summary layout, so edited rules re-evaluate a current store."""
+    return hashlib.sha1(repr((RULES, SAMPLE_MIN_ROWS, SUMMARY_VERSION)).encode()).hexdigest()[:16]
+
+def sample_plan(con, sample_percent):
+    """Sampling percent per table: tables over SAMPLE_MIN_ROWS get sample_percent, others are checked in full."""
+    if not sample_percent or sample_percent >= 100:
+        return {table: None for table in RULES}
+    rows = dict(con.execute(f"""
+        SELECT table_name, row_count FROM _ingest_manifest
+        WHERE table_name IN ({", ".join("?" for _ in RULES)})
+    """, list(RULES)).fetchall())
+    return {table: sample_percent if rows.get(table, 0) > SAMPLE_MIN_ROWS else None for table in RULES}
+
+def _relations(table, percent):
+    """Store tables as read by one table's rules, narrowed to its sample when sampled.
+
+    Samples hash the row key, so every row of a key -- duplicates and the
+    same order_id on the other feed -- lands in the same sample and the
+    duplicate and cross-table rules stay exact for the rows checked.
+    """
+    if percent is None:
+        return {name: name for name in RULES}
+    buckets = int(round(percent / 100 * SAMPLE_BUCKETS))
+    return {
+        name: f"(SELECT * FROM {name} WHERE hash({spec['key']}) % {SAMPLE_BUCKETS} < {buckets})"
+        for name, spec in RULES.items()
+    }
+
+def quarantine_sql(table, percent=None):
+    """One fused pass over a table: every violating row with the list of rules it breaks."""
+    spec = RULES[table]
+    flags = ", ".join(
+        f"CASE WHEN {predicate.strip()} THEN '{rule}' END" for rule, (_, predicate) in spec["rules"].items()
+    )
+    return f"""
+        SELECT '{table}' AS table_name, UNNEST(violations) AS rule, row_key
+        FROM (
+            SELECT {spec['key']}::VARCHAR AS row_key, list_filter([{flags}], r -> r IS NOT NULL) AS violations
+            FROM ({spec['source'].format(**_relations(table, percent))})
+        )
+        WHERE len(violations) > 0
+    """
+
+def quality_current(con, sample_percent=None):
+    """Whether the quarantine and summary were built from the store's current data and rules."""
+    if not data_store.table_exists(con, "_quality_version"):
+        return False
+    built = con.execute("SELECT data_version, rules_version, sample_percent FROM _quality_version").fetchone()
+    return built == (data_store.data_version(con), rules_version(), sample_percent)
+
+def evaluate_quality(con, sample_percent=None, force=False):
+    """Evaluate every rule, quarantine violating row keys and summarize violations per rule.
+
+    With ``sample_percent``, tables over SAMPLE_MIN_ROWS are checked on a
+    hash sample of their keys and ``estimated_violations`` scales the
+    sampled count back up. Returns ``(summary, timings)``; the summary has
+    one row per rule, and timings (seconds per table) are empty when the
+    results were already current.
+    """
+    if not force and quality_current(con, sample_percent):
+        return read_summary(con), {}
+
+    plan = sample_plan(con, sample_percent)
+    timings = {}
+    con.execute(f"CREATE OR REPLACE TABLE {QUARANTINE_TABLE} (table_name VARCHAR, rule VARCHAR, row_key VARCHAR)")
+    for table, percent in plan.items():
+        started = time.perf_counter()
+        con.execute(f"INSERT INTO {QUARANTINE_TABLE} {quarantine_sql(table, percent)}")
+        timings[f"quality_{table}"] = time.perf_counter() - started
+
+    checked = " UNION ALL ".join(
+        f"SELECT '{table}' AS table_name, COUNT(*) AS rows_checked, {percent or 'NULL'}::DOUBLE AS sample_percent "
+        f"FROM {_relations(table, percent)[table]}"
+        for table, percent in plan.items()
+    )
+    rules = [(table, rule, severity) for table, spec in RULES.items() for rule, (severity, _) in spec["rules"].items()]
+    values = ", ".join(
+        f"({position}, '{table}', '{rule}', '{severity}')" for position, (table, rule, severity) in enumerate(rules)
+    )
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {SUMMARY_TABLE} AS
+        WITH counts AS (
+            SELECT table_name, rule, COUNT(*) AS violations FROM {QUARANTINE_TABLE} GROUP BY ALL
+        )
+        SELECT r.rule_position, r.table_name, r.rule, r.severity, c.rows_checked, c.sample_percent,
+            COALESCE(v.violations, 0) AS violations,
+            ROUND(COALESCE(v.violations, 0) * 100 / COALESCE(c.sample_percent, 100))::BIGINT AS estimated_violations
+        FROM (VALUES {values}) r(rule_position, table_name, rule, severity)
+        JOIN ({checked}) c USING (table_name)
+        LEFT JOIN counts v USING (table_name, rule)
+        ORDER BY r.rule_position
+    """)
+    con.execute("CREATE OR REPLACE TABLE _quality_version AS SELECT ? AS data_version, ? AS rules_version, ? AS sample_percent",
+                [data_store.data_version(con), rules_version(), sample_percent])
+    summary = read_summary(con)
+    logger.info(f"Data quality rules evaluated: {int(summary['violations'].sum())} violations quarantined"
+                f"{' (sampled)' if any(plan.values()) else ''}")
+    return summary, timings
+
+def read_summary(con):
+    """The per-rule summary, one row per rule in RULES order (tables, then rules within a table)."""
+    return con.execute(f"SELECT * EXCLUDE (rule_position) FROM {SUMMARY_TABLE} ORDER BY rule_position").fetchdf()
+
+def quarantined_rows(con, rule=None, limit=None):
+    """Quarantined row keys, optionally for one rule."""
+    where = "WHERE rule = ?" if rule else ""
+    limit_sql = f"LIMIT {int(limit)}" if limit else ""
+    return con.execute(f"""
+        SELECT * FROM {QUARANTINE_TABLE} {where}
+        ORDER BY table_name, rule, row_key {limit_sql}
+    """, [rule] if rule else []).fetchdf()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Check store tables against the data quality rules and quarantine violations")
+    parser.add_argument("--sample-percent", type=float,
+                        help=f"check tables over {SAMPLE_MIN_ROWS:,} rows on a hash sample of this percent of their keys")
+    parser.add_argument("--show", metavar="RULE", help="print the quarantined row keys of one rule")
+    parser.add_argument("--force", action="store_true", help="re-evaluate even if the store has not changed")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        data_store.sync_store(con)
+        summary, _ = evaluate_quality(con, sample_percent=args.sample_percent, force=args.force)
+        print(summary.to_string(index=False))
+        if args.show:
+            print(quarantined_rows(con, rule=args.show).to_string(index=False))
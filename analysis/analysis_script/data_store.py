@@ -0,0 +1,423 @@
+import duckdb
+import os
+import shutil
+import logging
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+# Configs
+BASE_PATH = os.path.join("data", "dataset")
+STORE_PATH = os.path.join("data", "warehouse", "logistics.duckdb")
+PUBLISHED_SUFFIX = ".published"  # read-only copy next to the store, e.g. logistics.published.duckdb
+THEATERS_PATH = os.path.join("data", "theaters")  # one sub-directory of CSVs per theater
+THEATER_STORE_DIR = os.path.join("data", "warehouse", "theaters")
+
+# Closed vocabularies are stored as ENUMs: one byte per row instead of a
+# repeated string, and ingest fails on any label outside the list.
+# Bump STORE_SCHEMA_VERSION when a type or schema changes so stores re-ingest.
+ENUM_TYPES = {
+    "priority_level": ["Routine", "Urgent", "Emergency"],
+    "delivery_mode": ["Truck", "Helicopter", "Convoy", "Chartered Freight"],
+    "risk_level": ["Low", "Medium", "High"],
+    "stock_status": ["Critical", "Stable"]
+}
+STORE_SCHEMA_VERSION = 2
+
+# Explicit column types so ingest never has to sniff the CSVs
+TABLE_SCHEMAS = {
+    "supply_orders": {
+        "order_id": "VARCHAR",
+        "order_date": "DATE",
+        "base": "VARCHAR",
+        "vendor": "VARCHAR",
+        "supply_category": "VARCHAR",
+        "units_ordered": "INTEGER",
+        "unit_cost": "DOUBLE",
+        "total_cost": "DOUBLE",
+        "priority": "priority_level",
+        "requested_by": "VARCHAR",
+        "expected_delivery_date": "DATE"
+    },
+    "supply_deliveries": {
+        "order_id": "VARCHAR",
+        "vendor": "VARCHAR",
+        "base": "VARCHAR",
+        "supply_category": "VARCHAR",
+        "expected_delivery_date": "DATE",
+        "actual_delivery_date": "DATE",
+        "delay_days": "INTEGER",
+        "delivery_method": "delivery_mode",
+        "route_risk_level": "risk_level"
+    },
+    "base_inventory_supply": {
+        "base": "VARCHAR",
+        "supply_category": "VARCHAR",
+        "inventory_units": "INTEGER",
+        "avg_daily_consumption": "DOUBLE",
+        "days_remaining": "DOUBLE",
+        "inventory_status": "stock_status",
+        "last_updated": "DATE"
+    },
+    "supply_budget": {
+        "base": "VARCHAR",
+        "supply_category": "VARCHAR",
+        "budget_allocated": "DOUBLE",
+        "budget_spent": "DOUBLE",
+        "budget_variance": "DOUBLE"
+    }
+}
+
+# Append-only feeds: watermark column used to bound each incremental read
+INCREMENTAL_TABLES = {
+    "supply_orders": "order_date",
+    "supply_deliveries": "actual_delivery_date"
+}
+LATE_ARRIVAL_DAYS = 7  # corrections accepted this far behind the watermark
+
+# Every inventory ingest is also kept as a dated snapshot for forecasting
+INVENTORY_HISTORY_TABLE = "inventory_snapshots"
+
+logger = logging.getLogger(__name__)
+
+def source_file(table, base_path=BASE_PATH):
+    """Return the CSV path backing a store table."""
+    return os.path.join(base_path, f"{table}.csv")
+
+def source_signature(path):
+    """Return the (size, mtime) pair used to detect a changed source file."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def theater_store_path(theater):
+    """Persistent store of one theater."""
+    return os.path.join(THEATER_STORE_DIR, f"{theater}.duckdb")
+
+def theater_paths(theater, root=THEATERS_PATH):
+    """(dataset directory, store path) of one theater."""
+    return os.path.join(root, theater), theater_store_path(theater)
+
+def connect_store(store_path=STORE_PATH, read_only=False):
+    """Open the persistent DuckDB store, creating its directory if needed."""
+    if not read_only:
+        os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+        con = duckdb.connect(store_path)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS _ingest_manifest (
+                table_name VARCHAR PRIMARY KEY,
+                source_path VARCHAR,
+                file_size BIGINT,
+                file_mtime_ns BIGINT,
+                row_count BIGINT,
+                ingested_at TIMESTAMP
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS _ingest_watermarks (
+                table_name VARCHAR PRIMARY KEY,
+                watermark DATE,
+                batch_id BIGINT,
+                updated_at TIMESTAMP
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS _change_log (
+                batch_id BIGINT,
+                table_name VARCHAR,
+                order_id VARCHAR,
+                change_type VARCHAR
+            )
+        """)
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {INVENTORY_HISTORY_TABLE} (
+                base VARCHAR,
+                supply_category VARCHAR,
+                snapshot_date DATE,
+                inventory_units INTEGER,
+                avg_daily_consumption DOUBLE,
+                days_remaining DOUBLE,
+                recorded_at TIMESTAMP,
+                PRIMARY KEY (base, supply_category, snapshot_date)
+            )
+        """)
+        con.execute("CREATE SEQUENCE IF NOT EXISTS _ingest_batch_seq START 1")
+        _ensure_schema(con)
+        return con
+    return duckdb.connect(store_path, read_only=True)
+
+def _ensure_schema(con):
+    """Create the ENUM types, dropping source and ENUM-typed tables built under an older schema version."""
+    con.execute("CREATE TABLE IF NOT EXISTS _store_schema (version INTEGER)")
+    version = con.execute("SELECT MAX(version) FROM _store_schema").fetchone()[0]
+    if version == STORE_SCHEMA_VERSION:
+        return
+    if version is not None or table_exists(con, "supply_orders"):
+        # Clearing the manifest makes the next sync re-ingest every CSV
+        logger.info(f"Store schema changed ({version} -> {STORE_SCHEMA_VERSION}); source tables will be re-ingested")
+        for table in TABLE_SCHEMAS:
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+        # Derived tables that carry an ENUM column (e.g. agg_vendor_delay_hist)
+        # would keep the old labels; drop them so the next refresh rebuilds them
+        for (table,) in con.execute("""
+            SELECT DISTINCT table_name FROM duckdb_columns()
+            WHERE NOT internal AND data_type LIKE 'ENUM(%'
+        """).fetchall():
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.execute("DELETE FROM _ingest_manifest")
+        con.execute("DELETE FROM _ingest_watermarks")
+    for name, labels in ENUM_TYPES.items():
+        con.execute(f"DROP TYPE IF EXISTS {name}")
+        con.execute(f"CREATE TYPE {name} AS ENUM ({', '.join(repr(label) for label in labels)})")
+    con.execute("DELETE FROM _store_schema")
+    con.execute("INSERT INTO _store_schema VALUES (?)", [STORE_SCHEMA_VERSION])
+
+def _columns_sql(table):
+    """Render a schema as a DuckDB struct literal for read_csv(columns=...)."""
+    columns = ", ".join(f"'{name}': '{dtype}'" for name, dtype in TABLE_SCHEMAS[table].items())
+    return "{" + columns + "}"
+
+def source_changed(con, table, base_path=BASE_PATH):
+    """Check whether a source CSV differs from the copy recorded in the manifest."""
+    path = source_file(table, base_path)
+    size, mtime_ns = source_signature(path)
+    row = con.execute("""
+        SELECT source_path, file_size, file_mtime_ns FROM _ingest_manifest
+        WHERE table_name = ?
+    """, [table]).fetchone()
+    return row is None or row != (os.path.abspath(path), size, mtime_ns)
+
+def ingest_table(con, table, base_path=BASE_PATH):
+    """(Re)load one CSV into its typed store table and record it in the manifest."""
+    path = source_file(table, base_path)
+    size, mtime_ns = source_signature(path)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT * FROM read_csv('{path}', header = true, auto_detect = false,
+                               columns = {_columns_sql(table)})
+    """)
+    if table in INCREMENTAL_TABLES:
+        batch_id = con.execute("SELECT nextval('_ingest_batch_seq')").fetchone()[0]
+        _update_watermark(con, table, batch_id)
+        # A full reload is logged once, without order_ids: every row may have changed
+        con.execute("INSERT INTO _change_log VALUES (?, ?, NULL, 'reload')", [batch_id, table])
+    if table == "base_inventory_supply":
+        append_inventory_history(con, table)
+    return _record_manifest(con, table, path, size, mtime_ns)
+
+def append_inventory_history(con, source):
+    """Upsert inventory rows into the snapshot history, one row per base/category/day.
+
+    ``source`` is any relation with the base_inventory_supply columns; a
+    re-ingest of the same day's snapshot replaces it rather than duplicating it.
+    """
+    con.execute(f"""
+        INSERT OR REPLACE INTO {INVENTORY_HISTORY_TABLE}
+        SELECT base, supply_category, last_updated, inventory_units,
+               avg_daily_consumption, days_remaining, ?
+        FROM {source}
+        WHERE last_updated IS NOT NULL
+    """, [datetime.now()])
+
+def _record_manifest(con, table, path, size, mtime_ns):
+    """Record a source file signature once its rows are in the store."""
+    row_count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    con.execute("""
+        INSERT OR REPLACE INTO _ingest_manifest VALUES (?, ?, ?, ?, ?, ?)
+    """, [table, os.path.abspath(path), size, mtime_ns, row_count, datetime.now()])
+    return row_count
+
+def table_exists(con, table):
+    """Check whether a table is present in the store."""
+    return con.execute("""
+        SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?
+    """, [table]).fetchone()[0] > 0
+
+def stale_tables(con, base_path=BASE_PATH):
+    """List the store tables whose source CSV changed since it was last ingested."""
+    return [table for table in TABLE_SCHEMAS if source_changed(con, table, base_path)]
+
+def _update_watermark(con, table, batch_id):
+    """Advance the watermark of an append-only table to its latest event date."""
+    date_column = INCREMENTAL_TABLES[table]
+    con.execute(f"""
+        INSERT OR REPLACE INTO _ingest_watermarks
+        SELECT ?, MAX({date_column}), ?, ? FROM {table}
+    """, [table, batch_id, datetime.now()])
+
+def _checksum(con, relation, table):
+    """Row count and order-insensitive hash sum of a relation with a store table's columns."""
+    columns = ", ".join(TABLE_SCHEMAS[table])
+    return con.execute(f"SELECT COUNT(*), SUM(hash({columns})::HUGEINT) FROM {relation}").fetchone()
+
+def _untouched(relation, table):
+    """Rows of a relation whose order_id is not in the pending delta."""
+    return f"""(
+        SELECT * FROM {relation}
+        WHERE order_id IS NOT NULL
+          AND order_id NOT IN (SELECT order_id FROM _delta_{table} WHERE order_id IS NOT NULL)
+    )"""
+
+def ingest_incremental(con, table, base_path=BASE_PATH):
+    """Upsert only new or changed rows of an append-only table, keyed on order_id.
+
+    Rows whose order_id is not in the store yet are new whatever their
+    date. Corrections to existing rows are looked for among source rows
+    dated within LATE_ARRIVAL_DAYS of the watermark (or undated); if the
+    rows outside that window no longer match the store, the whole file is
+    compared instead, and order_ids missing from the source raise rather
+    than being recorded as ingested. The CSV is parsed in full on every
+    run; only the changed rows are written. The changed rows and the
+    versions they replaced are left in the temp tables ``_delta_<table>``
+    and ``_replaced_<table>`` so downstream aggregates can be patched from
+    them. Returns the number of rows inserted or updated.
+    """
+    path = source_file(table, base_path)
+    size, mtime_ns = source_signature(path)
+    date_column = INCREMENTAL_TABLES[table]
+    watermark = con.execute("""
+        SELECT watermark FROM _ingest_watermarks WHERE table_name = ?
+    """, [table]).fetchone()
+
+    if not table_exists(con, table) or watermark is None or watermark[0] is None:
+        # First load: everything is new. ingest_table already logs it as one
+        # 'reload' batch, so the order_ids are not logged a second time.
+        ingest_table(con, table, base_path)
+        con.execute(f"CREATE OR REPLACE TEMP TABLE _delta_{table} AS SELECT * FROM {table}")
+        con.execute(f"CREATE OR REPLACE TEMP TABLE _replaced_{table} AS SELECT * FROM {table} LIMIT 0")
+        return con.execute(f"SELECT COUNT(*) FROM _delta_{table}").fetchone()[0]
+
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _source_{table} AS
+        SELECT * FROM read_csv('{path}', header = true, auto_detect = false,
+                               columns = {_columns_sql(table)})
+    """)
+    window = f"{date_column} IS NULL OR {date_column} >= ?::DATE - INTERVAL {LATE_ARRIVAL_DAYS} DAY"
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _delta_{table} AS
+        SELECT s.* FROM _source_{table} s ANTI JOIN {table} t ON s.order_id = t.order_id
+        WHERE s.order_id IS NOT NULL
+        UNION
+        (SELECT * FROM _source_{table} WHERE {window}
+         EXCEPT
+         SELECT * FROM {table} WHERE {window})
+    """, [watermark[0], watermark[0]])
+    if _checksum(con, _untouched(f"_source_{table}", table), table) != _checksum(con, _untouched(table, table), table):
+        # Rows older than the window changed (or vanished): compare the whole file
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _delta_{table} AS
+            SELECT * FROM _source_{table} EXCEPT SELECT * FROM {table}
+        """)
+        changed = con.execute(f"SELECT COUNT(*) FROM _delta_{table}").fetchone()[0]
+        logger.warning(f"{table}: rows outside the {LATE_ARRIVAL_DAYS}-day late-arrival window changed; "
+                       f"compared the whole file ({changed} rows changed)")
+        if _checksum(con, _untouched(f"_source_{table}", table), table) != _checksum(con, _untouched(table, table), table):
+            missing = con.execute(f"""
+                SELECT COUNT(DISTINCT order_id) FROM {table}
+                WHERE order_id NOT IN (SELECT order_id FROM _source_{table} WHERE order_id IS NOT NULL)
+            """).fetchone()[0]
+            raise ValueError(f"{path} no longer holds {missing} order_ids of the stored {table} "
+                             f"(or holds duplicates of them); run a full refresh instead of an incremental one")
+
+    batch_id = con.execute("SELECT nextval('_ingest_batch_seq')").fetchone()[0]
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _replaced_{table} AS
+        SELECT * FROM {table} WHERE order_id IN (SELECT order_id FROM _delta_{table})
+    """)
+    con.execute(f"DELETE FROM {table} WHERE order_id IN (SELECT order_id FROM _delta_{table})")
+    con.execute(f"INSERT INTO {table} SELECT * FROM _delta_{table}")
+    con.execute(f"DROP TABLE _source_{table}")
+
+    con.execute(f"""
+        INSERT INTO _change_log
+        SELECT ?, ?, d.order_id,
+               CASE WHEN r.order_id IS NULL THEN 'insert' ELSE 'update' END
+        FROM (SELECT DISTINCT order_id FROM _delta_{table}) d
+        LEFT JOIN (SELECT DISTINCT order_id FROM _replaced_{table}) r ON d.order_id = r.order_id
+    """, [batch_id, table])
+    _update_watermark(con, table, batch_id)
+    _record_manifest(con, table, path, size, mtime_ns)
+    return con.execute(f"SELECT COUNT(*) FROM _delta_{table}").fetchone()[0]
+
+def sync_store(con, base_path=BASE_PATH, force=False):
+    """Bring the store up to date, re-ingesting only CSVs that have changed."""
+    tables_loaded = {}
+    for table in TABLE_SCHEMAS:
+        if force or source_changed(con, table, base_path):
+            tables_loaded[table] = ingest_table(con, table, base_path)
+            logger.info(f"Ingested {table}: {tables_loaded[table]} rows")
+        else:
+            tables_loaded[table] = con.execute("""
+                SELECT row_count FROM _ingest_manifest WHERE table_name = ?
+            """, [table]).fetchone()[0]
+    return tables_loaded
+
+def sync_store_incremental(con, base_path=BASE_PATH):
+    """Refresh changed sources, upserting append-only feeds instead of reloading them.
+
+    Returns a mapping of each refreshed table to the number of rows that
+    changed; snapshot tables report their full row count.
+    """
+    changes = {}
+    for table in stale_tables(con, base_path):
+        if table in INCREMENTAL_TABLES:
+            changes[table] = ingest_incremental(con, table, base_path)
+        else:
+            changes[table] = ingest_table(con, table, base_path)
+        logger.info(f"Refreshed {table}: {changes[table]} rows changed")
+    return changes
+
+def data_version(con):
+    """Short hash of the ingest manifest and watermarks; changes whenever store data does."""
+    manifest = con.execute("""
+        SELECT table_name, file_size, file_mtime_ns, row_count, ingested_at
+        FROM _ingest_manifest ORDER BY table_name
+    """).fetchall()
+    watermarks = con.execute("""
+        SELECT table_name, watermark, batch_id FROM _ingest_watermarks ORDER BY table_name
+    """).fetchall()
+    return hashlib.sha1(repr((manifest, watermarks)).encode()).hexdigest()[:16]
+
+def open_store(base_path=BASE_PATH, store_path=STORE_PATH):
+    """Open the store and sync it against the source CSVs in one step."""
+    con = connect_store(store_path)
+    sync_store(con, base_path)
+    return con
+
+def published_path(store_path=STORE_PATH):
+    """Path of the read-only copy of a store that readers open."""
+    root, ext = os.path.splitext(store_path)
+    return f"{root}{PUBLISHED_SUFFIX}{ext}"
+
+def publish_store(con, store_path=STORE_PATH):
+    """Publish a consistent copy of the store for readers; returns its path.
+
+    A DuckDB file can only be opened for writing when no other process has
+    it open, so dashboards and exports never open the store itself: they
+    read this copy, and a writer swaps in a new one with a single rename
+    once its changes are checkpointed. Readers that still have the old copy
+    open keep reading it until they close. Nothing is copied when the store
+    has not been written since the last publish.
+    """
+    con.execute("CHECKPOINT")
+    target = published_path(store_path)
+    if os.path.exists(target) and os.stat(target).st_mtime_ns >= os.stat(store_path).st_mtime_ns:
+        return target
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target) or ".", suffix=".tmp")
+    os.close(fd)
+    shutil.copyfile(store_path, tmp_path)
+    os.replace(tmp_path, target)
+    logger.info(f"Published store copy {target}")
+    return target
+
+@contextmanager
+def read_store(store_path=STORE_PATH):
+    """Short-lived read-only connection to the published copy of a store."""
+    path = published_path(store_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No published store at {path}; run the analyzer or a store refresh first")
+    con = duckdb.connect(path, read_only=True)
+    try:
+        yield con
+    finally:
+        con.close()
@@ -0,0 +1,216 @@
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+import data_store
+
+# Configs
+ALPHA = 0.3  # level smoothing
+BETA = 0.1  # trend smoothing
+HORIZON_DAYS = 365  # stock-outs further out are reported as beyond the horizon
+CONFIDENCE_Z = 1.645  # two-sided 90% band
+DEFAULT_CV = 0.15  # consumption std / level assumed until a series has enough residuals
+MIN_RESIDUALS = 2
+FORECAST_CHUNK_SERIES = 4096  # series projected per block, bounds the horizon matrices
+FORECAST_TABLE = "inventory_forecast"
+
+logger = logging.getLogger(__name__)
+
+def load_series(con):
+    """Daily consumption matrix (series x days, NaN where no snapshot) plus per-series keys."""
+    history = con.execute(f"""
+        SELECT base, supply_category, snapshot_date, avg_daily_consumption
+        FROM {data_store.INVENTORY_HISTORY_TABLE}
+        WHERE avg_daily_consumption IS NOT NULL
+        ORDER BY base, supply_category, snapshot_date
+    """).fetchdf()
+    codes, keys = pd.factorize(pd.MultiIndex.from_frame(history[["base", "supply_category"]]))
+    dates = history["snapshot_date"].values.astype("datetime64[D]")
+    start = dates.min() if len(dates) else np.datetime64("today", "D")
+    day = (dates - start).astype(int)
+
+    series = np.full((len(keys), (day.max() + 1) if len(day) else 0), np.nan)
+    series[codes, day] = history["avg_daily_consumption"].to_numpy()
+    last_day = np.full(len(keys), -1)
+    np.maximum.at(last_day, codes, day)
+    keys = pd.DataFrame(list(keys), columns=["base", "supply_category"])
+    return series, keys, start, last_day
+
+def holt_batch(series, last_day, alpha=ALPHA, beta=BETA):
+    """Fit Holt's linear trend model to every row of ``series`` at once.
+
+    The loop runs over days only; each step updates all series with array
+    operations. Days without a snapshot advance the level along the trend,
+    and each series stops updating after its own last snapshot. Returns the
+    final level, daily trend, one-step residual std (NaN with fewer than
+    MIN_RESIDUALS residuals) and the number of observations per series.
+    """
+    n_series, n_days = series.shape
+    level = np.full(n_series, np.nan)
+    trend = np.zeros(n_series)
+    sse = np.zeros(n_series)
+    residuals = np.zeros(n_series, dtype=int)
+    observations = np.zeros(n_series, dtype=int)
+
+    for t in range(n_days):
+        y = series[:, t]
+        active = t <= last_day
+        observed = ~np.isnan(y) & active
+        started = ~np.isnan(level)
+
+        # First observation initialises the level
+        first = observed & ~started
+        level[first] = y[first]
+
+        # Later observations: one-step forecast error, then smoothing update
+        update = observed & started
+        forecast = level + trend
+        error = y - forecast
+        sse[update] += error[update] ** 2
+        residuals[update] += 1
+        new_level = alpha * y + (1 - alpha) * forecast
+        trend = np.where(update, beta * (new_level - level) + (1 - beta) * trend, trend)
+        level = np.where(update, new_level, level)
+
+        # Gaps inside a series carry the trend forward
+        gap = active & started & ~observed
+        level = np.where(gap, forecast, level)
+        observations += observed
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.where(residuals >= MIN_RESIDUALS, np.sqrt(sse / np.maximum(residuals, 1)), np.nan)
+    return level, trend, sigma, observations
+
+def first_crossing(cumulative, threshold):
+    """Day (1-based) each row's cumulative consumption first reaches its stock; NaN if never."""
+    hit = cumulative >= threshold[:, None]
+    days = hit.argmax(axis=1).astype(float) + 1
+    days[~hit.any(axis=1)] = np.nan
+    return days
+
+def project_stockouts(inventory, level, trend, sigma, horizon=HORIZON_DAYS, z=CONFIDENCE_Z):
+    """Days until stock-out (expected, early and late) for each series, vectorized over the horizon.
+
+    Daily consumption follows level + h * trend (floored at zero). The band
+    on cumulative consumption widens with sqrt(h), treating daily forecast
+    errors as independent.
+    """
+    days = np.arange(1, horizon + 1)
+    results = {"expected": [], "early": [], "late": []}
+    for start in range(0, len(inventory), FORECAST_CHUNK_SERIES):
+        block = slice(start, start + FORECAST_CHUNK_SERIES)
+        daily = np.maximum(level[block, None] + trend[block, None] * days, 0)
+        cumulative = np.cumsum(daily, axis=1)
+        spread = z * sigma[block, None] * np.sqrt(days)
+        results["expected"].append(first_crossing(cumulative, inventory[block]))
+        results["early"].append(first_crossing(cumulative + spread, inventory[block]))
+        results["late"].append(first_crossing(cumulative - spread, inventory[block]))
+    return {name: np.concatenate(parts) if parts else np.array([]) for name, parts in results.items()}
+
+def build_forecast(con, horizon=HORIZON_DAYS):
+    """Forecast consumption and stock-out dates for every base x supply category."""
+    series, keys, _, last_day = load_series(con)
+    level, trend, sigma, observations = holt_batch(series, last_day)
+
+    current = con.execute("""
+        SELECT base, supply_category, inventory_units, last_updated AS as_of_date
+        FROM base_inventory_supply
+    """).fetchdf()
+    forecast = current.merge(keys.assign(row=np.arange(len(keys))), on=["base", "supply_category"], how="inner")
+    rows = forecast["row"].to_numpy()
+    level, trend, sigma, observations = level[rows], trend[rows], sigma[rows], observations[rows]
+
+    # Series too short for residuals get a relative default spread
+    sigma = np.where(np.isnan(sigma), DEFAULT_CV * level, sigma)
+    inventory = forecast["inventory_units"].to_numpy(dtype=float)
+    stockout = project_stockouts(inventory, level, trend, sigma, horizon)
+
+    as_of = forecast["as_of_date"].values.astype("datetime64[D]")
+    def to_date(offsets):
+        dates = pd.Series(as_of + np.nan_to_num(offsets).astype("timedelta64[D]"))
+        return dates.where(~np.isnan(offsets))
+
+    forecast = forecast.drop(columns="row").assign(
+        history_points=observations,
+        model=np.where(observations > 2, "holt", np.where(observations == 2, "holt_short", "snapshot")),
+        forecast_daily_consumption=np.round(np.maximum(level + trend, 0), 2),
+        consumption_trend=np.round(trend, 4),
+        consumption_std=np.round(sigma, 2),
+        projected_days_remaining=stockout["expected"],
+        days_remaining_early=stockout["early"],
+        days_remaining_late=stockout["late"],
+        stockout_date=to_date(stockout["expected"]),
+        stockout_date_early=to_date(stockout["early"]),
+        stockout_date_late=to_date(stockout["late"])
+    )
+    return forecast
+
+def _history_version(con):
+    """Size and last write of the snapshot history, which backfills change without a new ingest."""
+    rows, recorded_at = con.execute(f"""
+        SELECT COUNT(*), MAX(recorded_at) FROM {data_store.INVENTORY_HISTORY_TABLE}
+    """).fetchone()
+    return f"{rows}:{recorded_at}"
+
+def forecasts_current(con, horizon=HORIZON_DAYS):
+    """Whether the forecast table was built from the store's current data and history with this horizon."""
+    if not data_store.table_exists(con, "_forecast_version"):
+        return False
+    built = con.execute("SELECT data_version, history_version, horizon FROM _forecast_version").fetchone()
+    return built == (data_store.data_version(con), _history_version(con), horizon)
+
+def refresh_forecasts(con, horizon=HORIZON_DAYS, force=False):
+    """Rebuild the inventory_forecast table from the snapshot history when the store changed.
+
+    Returns the number of series forecast, or None when the table was already current.
+    """
+    if not force and forecasts_current(con, horizon):
+        return None
+    # Stores created before snapshot history existed start from the current snapshot
+    if con.execute(f"SELECT COUNT(*) FROM {data_store.INVENTORY_HISTORY_TABLE}").fetchone()[0] == 0:
+        data_store.append_inventory_history(con, "base_inventory_supply")
+    forecast = build_forecast(con, horizon)
+    con.register("_forecast_df", forecast)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {FORECAST_TABLE} AS
+        SELECT * REPLACE (
+            as_of_date::DATE AS as_of_date, stockout_date::DATE AS stockout_date,
+            stockout_date_early::DATE AS stockout_date_early, stockout_date_late::DATE AS stockout_date_late
+        )
+        FROM _forecast_df
+    """)
+    con.unregister("_forecast_df")
+    con.execute("""
+        CREATE OR REPLACE TABLE _forecast_version AS
+        SELECT ? AS data_version, ? AS history_version, ? AS horizon
+    """, [data_store.data_version(con), _history_version(con), horizon])
+    logger.info(f"Stock-out forecast refreshed for {len(forecast)} series "
+                f"({int((forecast['history_points'] > 2).sum())} with trend history)")
+    return len(forecast)
+
+def backfill_history(con, csv_path):
+    """Load historical inventory snapshots (base_inventory_supply columns) into the history."""
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _inventory_backfill AS
+        SELECT * FROM read_csv('{csv_path}', header = true, auto_detect = false,
+                               columns = {data_store._columns_sql("base_inventory_supply")})
+    """)
+    data_store.append_inventory_history(con, "_inventory_backfill")
+    rows = con.execute("SELECT COUNT(*) FROM _inventory_backfill").fetchone()[0]
+    con.execute("DROP TABLE _inventory_backfill")
+    logger.info(f"Backfilled {rows} inventory snapshot rows from {csv_path}")
+    return rows
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Forecast inventory consumption and stock-out dates")
+    parser.add_argument("--backfill", metavar="CSV",
+                        help="load historical inventory snapshots before forecasting")
+    parser.add_argument("--horizon", type=int, default=HORIZON_DAYS, help="forecast horizon in days")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the store has not changed")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        if args.backfill:
+            backfill_history(con, args.backfill)
+        refresh_forecasts(con, args.horizon, force=args.force)
@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+
+# Configs
+RSS_SAMPLE_INTERVAL_S = 0.005
+METRIC_PREFIX = "logistics"
+
+logger = logging.getLogger(__name__)
+
+def current_rss_bytes():
+    """Resident set size of this process, from /proc where available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No /proc (macOS): fall back to the process high-water mark
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class PeakRssSampler:
+    """Track the peak RSS between start() and stop() on a background thread.
+
+    Sampling catches memory held by DuckDB and NumPy, which tracemalloc
+    cannot see.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL_S):
+        self.interval = interval
+        self.start_bytes = self.peak_bytes = 0
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+    def start(self):
+        self.start_bytes = self.peak_bytes = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+class Span:
+    """Measurements for one pipeline stage; extra attributes are added with set()."""
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.started_at = None
+        self.wall_s = self.cpu_s = 0.0
+        self.rss = PeakRssSampler()
+        self.python_peak_bytes = None
+        self.error = None
+
+    def set(self, **attrs):
+        """Attach counters such as rows_in / rows_out to the span."""
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        record = {
+            "stage": self.name,
+            "started_at": self.started_at,
+            "wall_s": round(self.wall_s, 4),
+            "cpu_s": round(self.cpu_s, 4),
+            "start_rss_mb": round(self.rss.start_bytes / 1024 ** 2, 1),
+            "peak_rss_mb": round(self.rss.peak_bytes / 1024 ** 2, 1),
+            **self.attrs
+        }
+        if self.python_peak_bytes is not None:
+            record["python_peak_mb"] = round(self.python_peak_bytes / 1024 ** 2, 1)
+        if self.error:
+            record["error"] = self.error
+        return record
+
+class Tracer:
+    """Collects stage spans, per-query timings and optional DuckDB query profiles.
+
+    ``explain`` enables EXPLAIN ANALYZE capture for KPI queries (it re-runs
+    each query, so leave it off for routine runs). ``trace_python`` also
+    records the Python heap peak per span via tracemalloc, at a noticeable
+    cost in speed.
+    """
+
+    def __init__(self, explain=False, trace_python=False):
+        self.explain = explain
+        self.trace_python = trace_python
+        self.spans = []
+        self.queries = {}
+        self.profiles = {}
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Measure wall time, CPU time and peak RSS of the enclosed block."""
+        span = Span(name, **attrs)
+        span.started_at = datetime.now().isoformat(timespec="milliseconds")
+        span.rss.start()
+        if self.trace_python:
+            tracemalloc.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.wall_s = time.perf_counter() - wall
+            span.cpu_s = time.process_time() - cpu
+            span.rss.stop()
+            if self.trace_python:
+                span.python_peak_bytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.spans.append(span)
+
+    def record_queries(self, stage, timings):
+        """Keep per-query wall times reported by query_scheduler.run_queries."""
+        for name, seconds in timings.items():
+            self.queries[name] = {"stage": stage, "wall_s": round(seconds, 4)}
+
+    def explain_queries(self, con, queries):
+        """Capture EXPLAIN ANALYZE output for each (sql, fetch) query when enabled."""
+        if not self.explain:
+            return
+        for name, (sql, _) in queries.items():
+            try:
+                plan = con.execute(f"EXPLAIN ANALYZE {sql}").fetchall()[0][1]
+            except Exception as e:
+                logger.warning(f"EXPLAIN ANALYZE failed for {name}: {e}")
+                continue
+            total = re.search(r"Total Time:\s*([0-9.]+)s", plan)
+            self.profiles[name] = {
+                "total_s": float(total.group(1)) if total else None,
+                "plan": plan
+            }
+
+    def to_dict(self):
+        return {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "stages": [span.to_dict() for span in self.spans],
+            "queries": self.queries,
+            "query_profiles": self.profiles
+        }
+
+    def summary(self):
+        """Stage name -> wall seconds, for a one-line log summary."""
+        return {span.name: round(span.wall_s, 3) for span in self.spans}
+
+    def prometheus_text(self):
+        """Render the trace in Prometheus text exposition format."""
+        gauges = {
+            "stage_wall_seconds": ("Wall-clock time per analyzer stage", []),
+            "stage_cpu_seconds": ("Process CPU time per analyzer stage", []),
+            "stage_peak_rss_bytes": ("Peak resident memory during each analyzer stage", []),
+            "stage_rows_in": ("Rows read by each analyzer stage", []),
+            "stage_rows_out": ("Rows produced by each analyzer stage", []),
+            "stage_failed": ("1 if the analyzer stage raised an error", []),
+            "query_seconds": ("Wall-clock time per KPI query", []),
+            "query_profile_seconds": ("DuckDB EXPLAIN ANALYZE total time per KPI query", [])
+        }
+        for span in self.spans:
+            labels = f'stage="{span.name}"'
+            gauges["stage_wall_seconds"][1].append((labels, round(span.wall_s, 6)))
+            gauges["stage_cpu_seconds"][1].append((labels, round(span.cpu_s, 6)))
+            gauges["stage_peak_rss_bytes"][1].append((labels, span.rss.peak_bytes))
+            gauges["stage_failed"][1].append((labels, int(span.error is not None)))
+            for counter in ("rows_in", "rows_out"):
+                if counter in span.attrs:
+                    gauges[f"stage_{counter}"][1].append((labels, span.attrs[counter]))
+        for name, query in self.queries.items():
+            gauges["query_seconds"][1].append((f'query="{name}",stage="{query["stage"]}"', query["wall_s"]))
+        for name, profile in self.profiles.items():
+            if profile["total_s"] is not None:
+                gauges["query_profile_seconds"][1].append((f'query="{name}"', profile["total_s"]))
+
+        lines = []
+        for metric, (help_text, samples) in gauges.items():
+            if not samples:
+                continue
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} gauge")
+            lines.extend(f"{METRIC_PREFIX}_{metric}{{{labels}}} {value}" for labels, value in samples)
+        lines.append(f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Unix time the trace was written")
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        """Write the trace as JSON."""
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2, default=str))
+        logger.info(f"Trace written: {path}")
+
+    def write_prometheus(self, path):
+        """Write a Prometheus textfile-collector file; the rename keeps scrapes consistent."""
+        _write_atomic(path, self.prometheus_text())
+        logger.info(f"Metrics written: {path}")
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
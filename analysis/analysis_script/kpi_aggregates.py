@@ -0,0 +1,270 @@
+import logging
+
+import data_store
+
+# Configs -- the single definition of each KPI threshold used by the
+# analyzer report and the dashboard
+RISK_THRESHOLD_DAYS = 35  # inventory coverage benchmark
+CRITICAL_DAYS = 15  # "Critical" band of the low-stock analysis
+SLA_DELAY_DAYS = 2  # "% Delayed Over 2 Days" SLA indicator
+SEVERE_DELAY_DAYS = 7
+LOW_SUPPLY_DAYS = 30
+OVERSPEND_THRESHOLD_PCT = 115  # 15% overspend threshold
+AGGREGATE_VERSION = 4  # bump when aggregate keys/measures change so stores rebuild
+ROUTE_RISK_SCORE = "CASE route_risk_level WHEN 'Low' THEN 1 WHEN 'Medium' THEN 2 WHEN 'High' THEN 3 END"
+
+# Additive daily rollups: each group can be recomputed on its own, so an
+# incremental refresh only touches the groups its changed rows fall into.
+AGGREGATES = {
+    "agg_vendor_daily": {
+        "source": "supply_deliveries",
+        "keys": ["vendor", "base", "supply_category", "actual_delivery_date"],
+        "measures": f"""
+            COUNT(*) AS deliveries,
+            COUNT(delay_days) AS delay_samples,
+            SUM(CASE WHEN delay_days > 0 THEN 1 ELSE 0 END)::BIGINT AS delayed_deliveries,
+            SUM(CASE WHEN delay_days > {SLA_DELAY_DAYS} THEN 1 ELSE 0 END)::BIGINT AS sla_breaches,
+            SUM(CASE WHEN delay_days > {SEVERE_DELAY_DAYS} THEN 1 ELSE 0 END)::BIGINT AS severely_delayed,
+            SUM(CASE WHEN delay_days <= 0 THEN 1 ELSE 0 END)::BIGINT AS on_time_deliveries,
+            SUM(delay_days)::BIGINT AS total_delay_days,
+            MAX(delay_days) AS worst_delay,
+            COUNT({ROUTE_RISK_SCORE}) AS route_risk_samples,
+            SUM({ROUTE_RISK_SCORE})::BIGINT AS total_route_risk
+        """
+    },
+    "agg_vendor_due_daily": {
+        "source": "supply_deliveries",
+        "keys": ["vendor", "expected_delivery_date"],
+        "measures": """
+            COUNT(delay_days) AS delay_samples,
+            SUM(delay_days)::BIGINT AS total_delay_days,
+            SUM(delay_days * delay_days)::BIGINT AS total_sq_delay_days
+        """
+    },
+    "agg_vendor_delay_hist": {
+        "source": "supply_deliveries",
+        "keys": ["vendor", "route_risk_level", "delivery_method", "delay_days"],
+        "measures": "COUNT(*) AS deliveries"
+    },
+    "agg_emergency_daily": {
+        "source": "supply_orders",
+        "keys": ["base", "vendor", "supply_category", "order_date"],
+        "measures": """
+            COUNT(*) AS total_orders,
+            SUM(CASE WHEN priority = 'Emergency' THEN 1 ELSE 0 END)::BIGINT AS emergency_orders
+        """
+    }
+}
+
+# Lead-time histogram: orders per base, vendor, category, order day and
+# lead time (days from order to delivery; NULL while undelivered). Lead times
+# are whole days, so the histogram is an exact, mergeable quantile sketch --
+# summing its counts over any filter slice or date range gives the same
+# percentiles as the raw orders-to-deliveries join. {orders} is the order
+# relation to build from.
+LEAD_TIME_HIST_GROUP = ["base", "vendor", "supply_category", "order_date"]
+LEAD_TIME_HIST_SQL = """
+    SELECT o.base, o.vendor, o.supply_category, o.order_date,
+        d.actual_delivery_date - o.order_date AS lead_time, COUNT(*) AS orders
+    FROM {orders} o
+    LEFT JOIN supply_deliveries d ON o.order_id = d.order_id
+    GROUP BY ALL
+"""
+
+# Roll-ups over the daily aggregates shared by the report and the dashboard;
+# {where} narrows the aggregate rows before grouping.
+VENDOR_ROLLUP_SQL = """
+    SELECT
+        vendor,
+        SUM(deliveries) AS total_deliveries,
+        SUM(delayed_deliveries) AS delayed_deliveries,
+        SUM(severely_delayed) AS severely_delayed,
+        SUM(sla_breaches) AS sla_breaches,
+        ROUND(SUM(total_delay_days) / SUM(delay_samples), 2) AS avg_delay,
+        ROUND(100.0 * SUM(on_time_deliveries) / SUM(deliveries), 2) AS on_time_percentage,
+        ROUND(100.0 * SUM(sla_breaches) / SUM(deliveries), 2) AS sla_breach_percentage,
+        MAX(worst_delay) AS worst_delay,
+        COUNT(DISTINCT base) AS bases_served
+    FROM agg_vendor_daily
+    {where}
+    GROUP BY vendor
+"""
+
+EMERGENCY_ROLLUP_SQL = """
+    SELECT
+        base,
+        SUM(total_orders) AS total_orders,
+        SUM(emergency_orders) AS emergency_orders,
+        ROUND(100.0 * SUM(emergency_orders) / SUM(total_orders), 2) AS emergency_rate,
+        supply_category
+    FROM agg_emergency_daily
+    {where}
+    GROUP BY base, supply_category
+"""
+
+# Composite base risk index: the mean of the available components per base --
+# average route risk score (1-3), share of categories under LOW_SUPPLY_DAYS of
+# cover, share of budget lines over OVERSPEND_THRESHOLD_PCT and share of
+# emergency orders -- scaled by 100. Each {..._where} narrows one input.
+RISK_COMPONENTS = ["route_risk", "low_supply_ratio", "overspend_ratio", "emergency_ratio"]
+RISK_INDEX_SQL = (
+    f"100 * ({' + '.join(f'COALESCE({c}, 0)' for c in RISK_COMPONENTS)}) / "
+    f"NULLIF({' + '.join(f'({c} IS NOT NULL)::INT' for c in RISK_COMPONENTS)}, 0)"
+)
+BASE_RISK_SQL = f"""
+    WITH route AS (
+        SELECT base, SUM(total_route_risk) / SUM(route_risk_samples) AS route_risk
+        FROM agg_vendor_daily {{delivery_where}} GROUP BY base
+    ), inventory AS (
+        SELECT base, AVG(CASE WHEN days_remaining < {LOW_SUPPLY_DAYS} THEN 1 ELSE 0 END) AS low_supply_ratio
+        FROM base_inventory_supply {{inventory_where}} GROUP BY base
+    ), budget AS (
+        SELECT base, AVG(CASE WHEN budget_spent > budget_allocated * {OVERSPEND_THRESHOLD_PCT / 100} THEN 1 ELSE 0 END) AS overspend_ratio
+        FROM agg_budget {{budget_where}} GROUP BY base
+    ), emergency AS (
+        SELECT base, SUM(emergency_orders) / SUM(total_orders) AS emergency_ratio
+        FROM agg_emergency_daily {{order_where}} GROUP BY base
+    ), components AS (
+        SELECT route.base, route_risk, low_supply_ratio, overspend_ratio, emergency_ratio
+        FROM route
+        LEFT JOIN inventory USING (base)
+        LEFT JOIN budget USING (base)
+        LEFT JOIN emergency USING (base)
+    )
+    SELECT *, {RISK_INDEX_SQL} AS base_risk_index
+    FROM components
+"""
+
+logger = logging.getLogger(__name__)
+
+def histogram_quantile_sql(q, value_column="delay_days"):
+    """Interpolated quantile (as quantile_cont) of a histogram from its cumulative counts.
+
+    Expects ``cumulative`` (running count in value order) and ``samples``
+    (non-NULL count of the group) columns alongside the value column.
+    """
+    position = f"(samples - 1) * {q}"
+    low = f"MIN({value_column}) FILTER (WHERE cumulative > FLOOR({position}))"
+    high = f"MIN({value_column}) FILTER (WHERE cumulative > CEIL({position}))"
+    return f"{low} + ({high} - {low}) * ({position} - FLOOR({position}))"
+
+def _aggregate_sql(name, source):
+    """Render the GROUP BY query that builds an aggregate from a source relation."""
+    spec = AGGREGATES[name]
+    keys = ", ".join(spec["keys"])
+    return f"SELECT {keys}, {spec['measures']} FROM {source} GROUP BY {keys}"
+
+def rebuild_budget_aggregate(con):
+    """Materialize budget utilization per base and supply category."""
+    con.execute("""
+        CREATE OR REPLACE TABLE agg_budget AS
+        SELECT
+            base, supply_category, budget_allocated,
+            budget_spent, budget_variance,
+            ROUND((budget_spent / budget_allocated) * 100, 2) AS percent_spent
+        FROM supply_budget
+    """)
+
+def rebuild_base_risk(con):
+    """Materialize the composite base risk index from the other aggregates."""
+    con.execute(f"CREATE OR REPLACE TABLE kpi_base_risk AS {BASE_RISK_SQL.format(delivery_where='', inventory_where='', budget_where='', order_where='')}")
+
+def rebuild_aggregates(con):
+    """Recompute every KPI aggregate from the full store tables."""
+    for name, spec in AGGREGATES.items():
+        con.execute(f"CREATE OR REPLACE TABLE {name} AS {_aggregate_sql(name, spec['source'])}")
+    con.execute(f"CREATE OR REPLACE TABLE agg_lead_time_hist AS {LEAD_TIME_HIST_SQL.format(orders='supply_orders')}")
+    rebuild_budget_aggregate(con)
+    rebuild_base_risk(con)
+    con.execute("CREATE OR REPLACE TABLE _aggregate_version AS SELECT ? AS version", [AGGREGATE_VERSION])
+    logger.info(f"Rebuilt KPI aggregates: {list(AGGREGATES) + ['agg_lead_time_hist', 'agg_budget', 'kpi_base_risk']}")
+
+def aggregates_exist(con):
+    """Check whether the aggregate tables have been materialized."""
+    names = list(AGGREGATES) + ["agg_lead_time_hist", "agg_budget", "kpi_base_risk", "_aggregate_version"]
+    found = con.execute(f"""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_name IN ({", ".join("?" for _ in names)})
+    """, names).fetchone()[0]
+    if found < len(names):
+        return False
+    return con.execute("SELECT MAX(version) FROM _aggregate_version").fetchone()[0] == AGGREGATE_VERSION
+
+def _patch_aggregate(con, name):
+    """Recompute only the aggregate groups touched by the last incremental ingest."""
+    spec = AGGREGATES[name]
+    source = spec["source"]
+    keys = ", ".join(spec["keys"])
+    match = " AND ".join(f"a.{key} IS NOT DISTINCT FROM k.{key}" for key in spec["keys"])
+
+    # Groups of both the new rows and the versions they replaced
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _affected_{name} AS
+        SELECT DISTINCT {keys} FROM _delta_{source}
+        UNION
+        SELECT DISTINCT {keys} FROM _replaced_{source}
+    """)
+    con.execute(f"DELETE FROM {name} a USING _affected_{name} k WHERE {match}")
+    con.execute(f"""
+        INSERT INTO {name}
+        {_aggregate_sql(name, f"(SELECT a.* FROM {source} a SEMI JOIN _affected_{name} k ON {match})")}
+    """)
+    return con.execute(f"SELECT COUNT(*) FROM _affected_{name}").fetchone()[0]
+
+def _patch_lead_time_hist(con, changes):
+    """Recompute the lead-time histogram for order groups touched by changed orders or deliveries."""
+    keys = ", ".join(LEAD_TIME_HIST_GROUP)
+    match = " AND ".join(f"a.{key} IS NOT DISTINCT FROM k.{key}" for key in LEAD_TIME_HIST_GROUP)
+    sources = []
+    if changes.get("supply_orders"):
+        sources += [f"SELECT {keys} FROM _delta_supply_orders", f"SELECT {keys} FROM _replaced_supply_orders"]
+    if changes.get("supply_deliveries"):
+        # A delivery moves its order's lead time, so patch the order's group
+        sources.append(f"""
+            SELECT {keys} FROM supply_orders WHERE order_id IN (
+                SELECT order_id FROM _delta_supply_deliveries
+                UNION SELECT order_id FROM _replaced_supply_deliveries
+            )
+        """)
+    if not sources:
+        return 0
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _affected_agg_lead_time_hist AS {' UNION '.join(sources)}")
+    con.execute(f"DELETE FROM agg_lead_time_hist a USING _affected_agg_lead_time_hist k WHERE {match}")
+    orders = f"(SELECT a.* FROM supply_orders a SEMI JOIN _affected_agg_lead_time_hist k ON {match})"
+    con.execute(f"INSERT INTO agg_lead_time_hist {LEAD_TIME_HIST_SQL.format(orders=orders)}")
+    return con.execute("SELECT COUNT(*) FROM _affected_agg_lead_time_hist").fetchone()[0]
+
+def apply_incremental_changes(con, changes):
+    """Patch aggregates in place from the output of data_store.sync_store_incremental()."""
+    if not aggregates_exist(con):
+        rebuild_aggregates(con)
+        return
+    for name, spec in AGGREGATES.items():
+        if changes.get(spec["source"]):
+            groups = _patch_aggregate(con, name)
+            logger.info(f"Patched {name}: {groups} groups recomputed")
+    if changes.get("supply_orders") or changes.get("supply_deliveries"):
+        groups = _patch_lead_time_hist(con, changes)
+        logger.info(f"Patched agg_lead_time_hist: {groups} groups recomputed")
+    if "supply_budget" in changes:
+        rebuild_budget_aggregate(con)
+    if changes:
+        rebuild_base_risk(con)
+
+def refresh_store(con, base_path=data_store.BASE_PATH, incremental=False):
+    """Sync the store with its CSVs and bring every KPI aggregate up to date.
+
+    Returns the row count of each store table.
+    """
+    if incremental:
+        # Upsert only new/changed order_ids and patch the affected aggregate groups
+        changes = data_store.sync_store_incremental(con, base_path)
+        apply_incremental_changes(con, changes)
+        return data_store.sync_store(con, base_path)
+
+    # Only CSVs whose size or mtime changed since the last run are re-ingested
+    stale = data_store.stale_tables(con, base_path)
+    tables_loaded = data_store.sync_store(con, base_path)
+    if stale or not aggregates_exist(con):
+        rebuild_aggregates(con)
+    return tables_loaded
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import data_store
+import instrumentation
+import logistics_kpi_analyzer as analyzer
+
+# Configs
+HOST = "127.0.0.1"
+PORT = 8765
+POLL_INTERVAL_S = 5  # how often source CSVs are checked for changes
+REFRESH_INTERVAL_S = 900  # KPIs are recomputed at least this often
+
+logger = logging.getLogger(__name__)
+
+class KpiService:
+    """Serves precomputed KPI results without holding the store.
+
+    A refresh takes the store's write lock only while it syncs the store,
+    recomputes the data quality report and every KPI, and publishes the
+    store for readers; it then swaps in a new immutable snapshot with the
+    JSON responses already serialized, so requests never touch DuckDB.
+    Change checks read the published copy, so the analyzer and dashboard
+    can run alongside the service, and a store the analyzer published is
+    picked up at the next poll. Refreshes and report writes are serialized
+    on a lock; reads never wait for them.
+    """
+
+    def __init__(self, store_path=analyzer.STORE_PATH, incremental=True):
+        self.store_path = store_path
+        self.incremental = incremental
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._snapshot = None
+        self._last_refresh = 0.0
+        self.refresh_count = 0
+        self.last_error = None
+
+    def _published_state(self):
+        """Data version and stale source tables of the published store, or None before its first publish."""
+        if not os.path.exists(data_store.published_path(self.store_path)):
+            return None
+        with data_store.read_store(self.store_path) as con:
+            return data_store.data_version(con), data_store.stale_tables(con, analyzer.BASE_PATH)
+
+    def refresh(self, force=False):
+        """Recompute KPIs if a source or the published store changed (or when forced); return True if refreshed."""
+        with self._lock:
+            try:
+                refreshed = self._refresh(force)
+            except Exception as e:
+                # Keep serving the last good snapshot; health reports the failure
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise
+            self.last_error = None
+            return refreshed
+
+    def _refresh(self, force):
+        """Body of refresh(); runs with the lock held."""
+        state = self._published_state()
+        stale = state[1] if state else list(data_store.TABLE_SCHEMAS)
+        published_elsewhere = (state is not None and self._snapshot is not None
+                               and state[0] != self._snapshot["data_version"])
+        if self._snapshot is not None and not stale and not published_elsewhere and not force:
+            return False
+
+        # The first load of a fresh process always runs a full sync
+        incremental = self.incremental and self._snapshot is not None
+        tracer = instrumentation.Tracer()
+        with data_store.connect_store(self.store_path) as con:
+            with tracer.span("load_data_sources", incremental=incremental) as span:
+                tables_loaded = analyzer.load_data_sources(con, incremental=incremental)
+                span.set(rows_in=sum(tables_loaded.values()))
+            with tracer.span("generate_data_quality_report"):
+                quality_report = analyzer.generate_data_quality_report(con, tracer=tracer)
+            with tracer.span("analyze_performance_metrics") as span:
+                metrics = analyzer.analyze_performance_metrics(con, tracer=tracer)
+                span.set(rows_out=sum(len(df) for df in metrics.values()))
+            with tracer.span("publish_store"):
+                data_store.publish_store(con, self.store_path)
+            version = data_store.data_version(con)
+
+        self._snapshot = {
+            "data_version": version,
+            "refreshed_at": datetime.now().isoformat(timespec="seconds"),
+            "tables": tables_loaded,
+            "metrics": metrics,
+            "quality_report": quality_report,
+            "payloads": {
+                name: df.to_json(orient="records", date_format="iso").encode()
+                for name, df in metrics.items()
+            },
+            "quality_payload": json.dumps(quality_report, default=str).encode(),
+            "tracer": tracer
+        }
+        self._last_refresh = time.monotonic()
+        self.refresh_count += 1
+        reason = f"stale: {stale}" if stale else "published store changed" if published_elsewhere else "forced"
+        logger.info(f"KPI snapshot refreshed ({reason}): {tracer.summary()}")
+        return True
+
+    def write_reports(self):
+        """Write the Excel export and markdown report from the current snapshot."""
+        with self._lock:
+            snapshot = self._snapshot
+            # Detail sheets stream from the store this snapshot published
+            with data_store.read_store(self.store_path) as con:
+                analyzer.export_analysis_results(snapshot["metrics"], snapshot["quality_report"], con=con)
+            analyzer.generate_enhanced_report(snapshot["metrics"], snapshot["quality_report"])
+        return {"excel": analyzer.OUTPUT_XLSX, "report": analyzer.OUTPUT_MD,
+                "data_version": snapshot["data_version"]}
+
+    def run_scheduler(self, poll_interval=POLL_INTERVAL_S, refresh_interval=REFRESH_INTERVAL_S):
+        """Poll for changed CSVs and force a recompute every refresh_interval seconds."""
+        while not self._stop.wait(poll_interval):
+            try:
+                self.refresh(force=time.monotonic() - self._last_refresh >= refresh_interval)
+            except Exception as e:
+                logger.error(f"Scheduled refresh failed: {e}")
+
+    def start_scheduler(self, poll_interval=POLL_INTERVAL_S, refresh_interval=REFRESH_INTERVAL_S):
+        thread = threading.Thread(target=self.run_scheduler, args=(poll_interval, refresh_interval), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def health(self):
+        snapshot = self._snapshot
+        return {
+            "status": "ok" if snapshot is not None and self.last_error is None else "degraded",
+            "data_version": snapshot["data_version"] if snapshot else None,
+            "refreshed_at": snapshot["refreshed_at"] if snapshot else None,
+            "refresh_count": self.refresh_count,
+            "tables": snapshot["tables"] if snapshot else {},
+            "last_error": self.last_error
+        }
+
+    def snapshot(self):
+        return self._snapshot
+
+class KpiRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over the service snapshot.
+
+    GET  /health            service status and data version
+    GET  /kpi               available KPI names
+    GET  /kpi/<name>        KPI rows as JSON records (?limit=N for the first N)
+    GET  /quality           data quality report
+    GET  /metrics           timings of the last refresh in Prometheus text format
+    POST /refresh           force a recompute
+    POST /reports           write the Excel export and markdown report
+    """
+
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        snapshot = self.service.snapshot()
+        if url.path == "/health":
+            return self._send_json(self.service.health())
+        if snapshot is None:
+            return self._send_json({"error": "KPI snapshot not ready"}, status=503)
+        if url.path == "/kpi":
+            return self._send_json({"metrics": list(snapshot["payloads"]), "data_version": snapshot["data_version"]})
+        if url.path.startswith("/kpi/"):
+            name = url.path[len("/kpi/"):]
+            if name not in snapshot["payloads"]:
+                return self._send_json({"error": f"Unknown KPI: {name}"}, status=404)
+            limit = parse_qs(url.query).get("limit")
+            if limit:
+                try:
+                    limit = int(limit[0])
+                except ValueError:
+                    limit = 0
+                if limit < 1:
+                    return self._send_json({"error": "limit must be a positive integer"}, status=400)
+                rows = snapshot["metrics"][name].head(limit)
+                return self._send(rows.to_json(orient="records", date_format="iso").encode(),
+                                  version=snapshot["data_version"])
+            return self._send(snapshot["payloads"][name], version=snapshot["data_version"])
+        if url.path == "/quality":
+            return self._send(snapshot["quality_payload"], version=snapshot["data_version"])
+        if url.path == "/metrics":
+            return self._send(snapshot["tracer"].prometheus_text().encode(),
+                              content_type="text/plain; version=0.0.4")
+        self._send_json({"error": "Not found"}, status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            if url.path == "/refresh":
+                self.service.refresh(force=True)
+                return self._send_json(self.service.health())
+            if url.path == "/reports":
+                if self.service.snapshot() is None:
+                    return self._send_json({"error": "KPI snapshot not ready"}, status=503)
+                return self._send_json(self.service.write_reports())
+        except Exception as e:
+            logger.error(f"{url.path} failed: {e}")
+            return self._send_json({"error": str(e)}, status=500)
+        self._send_json({"error": "Not found"}, status=404)
+
+    def _send_json(self, body, status=200):
+        self._send(json.dumps(body, default=str).encode(), status=status)
+
+    def _send(self, payload, status=200, content_type="application/json", version=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        if version:
+            self.send_header("X-Data-Version", version)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+def serve(host=HOST, port=PORT, poll_interval=POLL_INTERVAL_S, refresh_interval=REFRESH_INTERVAL_S, incremental=True):
+    """Compute the first snapshot, then serve KPIs until interrupted."""
+    service = KpiService(incremental=incremental)
+    service.refresh(force=True)
+    service.start_scheduler(poll_interval, refresh_interval)
+
+    handler = type("BoundKpiRequestHandler", (KpiRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"KPI service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down KPI service")
+    finally:
+        server.server_close()
+        service.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve precomputed logistics KPIs over HTTP/JSON")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL_S,
+                        help="seconds between checks for changed source CSVs")
+    parser.add_argument("--refresh-interval", type=float, default=REFRESH_INTERVAL_S,
+                        help="seconds after which KPIs are recomputed even if no source changed")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="re-ingest changed CSVs in full instead of upserting new orders/deliveries")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.poll_interval, args.refresh_interval, incremental=not args.full_refresh)
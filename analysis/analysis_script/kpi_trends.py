@@ -0,0 +1,179 @@
+import logging
+import argparse
+
+import data_store
+import kpi_aggregates
+
+# Configs
+TREND_WINDOWS = (7, 30, 90)  # trailing window lengths in days
+TRENDS_TABLE = "kpi_daily_trends"
+FLEET_ENTITY = "All"
+TREND_METRICS = ["on_time_pct", "avg_delay", "emergency_rate", "base_risk_index"]
+
+logger = logging.getLogger(__name__)
+
+def _scope_sql(group_column):
+    """Label each GROUPING SETS row with its scope (vendor, base or fleet) and entity."""
+    return f"""
+        CASE WHEN GROUPING({group_column}) = 0 THEN '{group_column}' ELSE 'fleet' END AS scope,
+        CASE WHEN GROUPING({group_column}) = 0 THEN COALESCE({group_column}, 'Unknown') ELSE '{FLEET_ENTITY}' END AS entity
+    """
+
+def _window_sql(days):
+    return (f"w{days} AS (PARTITION BY scope, entity ORDER BY kpi_date "
+            f"RANGE BETWEEN INTERVAL {days - 1} DAYS PRECEDING AND CURRENT ROW)")
+
+def trends_sql():
+    """Daily fact rows for every scope, entity and trailing window.
+
+    Vendor, base and fleet totals per day come from one GROUPING SETS pass
+    over each daily aggregate, laid on a dense date spine so every window
+    ends on every day. All windows are computed in one sorted pass; a row
+    is kept only if its window saw deliveries or orders. The base risk
+    index rolls route risk and emergency rate over the window and takes
+    low supply from the latest inventory snapshot on or before the day
+    (budget has no history, so overspend is the current ratio).
+    """
+    measures = {
+        "deliveries": "deliveries", "on_time": "on_time_deliveries",
+        "delay_samples": "delay_samples", "total_delay": "total_delay_days",
+        "route_samples": "route_risk_samples", "total_route_risk": "total_route_risk",
+        "orders": "total_orders", "emergency": "emergency_orders"
+    }
+    rolled = ",\n".join(
+        f"SUM({name}) OVER w{days} AS {name}_{days}"
+        for days in TREND_WINDOWS for name in measures
+    )
+    windows = ", ".join(_window_sql(days) for days in TREND_WINDOWS)
+    per_window = "\nUNION ALL\n".join(f"""
+        SELECT
+            kpi_date, scope, entity, {days} AS window_days,
+            deliveries_{days}::BIGINT AS deliveries, orders_{days}::BIGINT AS orders,
+            ROUND(100.0 * on_time_{days} / NULLIF(deliveries_{days}, 0), 2) AS on_time_pct,
+            ROUND(total_delay_{days} / NULLIF(delay_samples_{days}, 0), 2) AS avg_delay,
+            ROUND(100.0 * emergency_{days} / NULLIF(orders_{days}, 0), 2) AS emergency_rate,
+            CASE WHEN scope <> 'vendor' THEN ROUND({kpi_aggregates.RISK_INDEX_SQL}, 1) END AS base_risk_index
+        FROM (
+            SELECT *,
+                total_route_risk_{days} / NULLIF(route_samples_{days}, 0) AS route_risk,
+                emergency_{days} / NULLIF(orders_{days}, 0) AS emergency_ratio
+            FROM rolled
+            WHERE deliveries_{days} > 0 OR orders_{days} > 0
+        )
+    """ for days in TREND_WINDOWS)
+
+    return f"""
+        WITH delivery_daily AS (
+            SELECT {_scope_sql("vendor")}, actual_delivery_date AS kpi_date,
+                SUM(deliveries) AS deliveries, SUM(on_time_deliveries) AS on_time_deliveries,
+                SUM(delay_samples) AS delay_samples, SUM(total_delay_days) AS total_delay_days,
+                SUM(route_risk_samples) AS route_risk_samples, SUM(total_route_risk) AS total_route_risk
+            FROM agg_vendor_daily WHERE actual_delivery_date IS NOT NULL
+            GROUP BY GROUPING SETS ((vendor, actual_delivery_date), (actual_delivery_date))
+            UNION ALL
+            SELECT {_scope_sql("base")}, actual_delivery_date,
+                SUM(deliveries), SUM(on_time_deliveries), SUM(delay_samples),
+                SUM(total_delay_days), SUM(route_risk_samples), SUM(total_route_risk)
+            FROM agg_vendor_daily WHERE actual_delivery_date IS NOT NULL
+            GROUP BY GROUPING SETS ((base, actual_delivery_date))
+        ), order_daily AS (
+            SELECT {_scope_sql("vendor")}, order_date AS kpi_date,
+                SUM(total_orders) AS total_orders, SUM(emergency_orders) AS emergency_orders
+            FROM agg_emergency_daily WHERE order_date IS NOT NULL
+            GROUP BY GROUPING SETS ((vendor, order_date), (order_date))
+            UNION ALL
+            SELECT {_scope_sql("base")}, order_date, SUM(total_orders), SUM(emergency_orders)
+            FROM agg_emergency_daily WHERE order_date IS NOT NULL
+            GROUP BY GROUPING SETS ((base, order_date))
+        ), days AS (
+            SELECT range::DATE AS kpi_date
+            FROM (
+                SELECT MIN(kpi_date) AS first_day, MAX(kpi_date) AS last_day
+                FROM (SELECT kpi_date FROM delivery_daily UNION ALL SELECT kpi_date FROM order_daily)
+            ), range(first_day, last_day + INTERVAL 1 DAY, INTERVAL 1 DAY)
+        ), entities AS (
+            SELECT scope, entity FROM delivery_daily
+            UNION
+            SELECT scope, entity FROM order_daily
+        ), daily AS (
+            SELECT e.scope, e.entity, d.kpi_date,
+                COALESCE(dd.deliveries, 0) AS deliveries,
+                COALESCE(dd.on_time_deliveries, 0) AS on_time,
+                COALESCE(dd.delay_samples, 0) AS delay_samples,
+                COALESCE(dd.total_delay_days, 0) AS total_delay,
+                COALESCE(dd.route_risk_samples, 0) AS route_samples,
+                COALESCE(dd.total_route_risk, 0) AS total_route_risk,
+                COALESCE(od.total_orders, 0) AS orders,
+                COALESCE(od.emergency_orders, 0) AS emergency
+            FROM entities e
+            CROSS JOIN days d
+            LEFT JOIN delivery_daily dd USING (scope, entity, kpi_date)
+            LEFT JOIN order_daily od USING (scope, entity, kpi_date)
+        ), windowed AS (
+            SELECT scope, entity, kpi_date,
+                {rolled}
+            FROM daily
+            WINDOW {windows}
+        ), low_supply AS (
+            SELECT {_scope_sql("base")}, snapshot_date,
+                AVG(CASE WHEN days_remaining < {kpi_aggregates.LOW_SUPPLY_DAYS} THEN 1 ELSE 0 END) AS low_supply_ratio
+            FROM {data_store.INVENTORY_HISTORY_TABLE}
+            GROUP BY GROUPING SETS ((base, snapshot_date), (snapshot_date))
+        ), overspend AS (
+            SELECT {_scope_sql("base")},
+                AVG(CASE WHEN budget_spent > budget_allocated * {kpi_aggregates.OVERSPEND_THRESHOLD_PCT / 100} THEN 1 ELSE 0 END) AS overspend_ratio
+            FROM agg_budget
+            GROUP BY GROUPING SETS ((base), ())
+        ), rolled AS (
+            SELECT w.*, l.low_supply_ratio, o.overspend_ratio
+            FROM windowed w
+            ASOF LEFT JOIN low_supply l
+                ON w.scope = l.scope AND w.entity = l.entity AND w.kpi_date >= l.snapshot_date
+            LEFT JOIN overspend o ON w.scope = o.scope AND w.entity = o.entity
+        )
+        {per_window}
+    """
+
+def latest_trends_sql():
+    """Latest day of the trend table, one row per scope and entity with a column per metric and window."""
+    columns = ",\n".join(
+        f"MAX({metric}) FILTER (WHERE window_days = {days}) AS {metric}_{days}d"
+        for metric in TREND_METRICS for days in TREND_WINDOWS
+    )
+    return f"""
+        SELECT scope, entity, kpi_date AS as_of_date,
+            {columns}
+        FROM {TRENDS_TABLE}
+        WHERE kpi_date = (SELECT MAX(kpi_date) FROM {TRENDS_TABLE})
+        GROUP BY scope, entity, kpi_date
+    """
+
+def trends_current(con):
+    """Whether the trend table was built from the store's current data and aggregate version."""
+    if not data_store.table_exists(con, "_trends_version"):
+        return False
+    built = con.execute("SELECT data_version, aggregate_version FROM _trends_version").fetchone()
+    return built == (data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION)
+
+def refresh_trends(con, force=False):
+    """Rebuild kpi_daily_trends from the daily aggregates when the store data changed.
+
+    Returns the number of fact rows, or None when the table was already current.
+    """
+    if not force and trends_current(con):
+        return None
+    con.execute(f"CREATE OR REPLACE TABLE {TRENDS_TABLE} AS {trends_sql()} ORDER BY kpi_date, scope, entity, window_days")
+    con.execute("CREATE OR REPLACE TABLE _trends_version AS SELECT ? AS data_version, ? AS aggregate_version",
+                [data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION])
+    rows = con.execute(f"SELECT COUNT(*) FROM {TRENDS_TABLE}").fetchone()[0]
+    logger.info(f"Rebuilt {TRENDS_TABLE}: {rows} rows over windows {list(TREND_WINDOWS)} days")
+    return rows
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Rebuild the rolling daily KPI trend table")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the store has not changed")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        kpi_aggregates.refresh_store(con)
+        refresh_trends(con, force=args.force)
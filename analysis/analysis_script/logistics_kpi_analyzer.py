@@ -1,18 +1,60 @@
-import duckdb
 import pandas as pd
 import os
+import time
+import hashlib
 from datetime import datetime
 import logging
+import argparse
+
+import alerting
+import base_reports
+import data_quality
+import data_store
+import forecasting
+import instrumentation
+import kpi_aggregates
+import kpi_trends
+import query_scheduler
+import redistribution
+import stockout_simulation
+import streaming_export
+import vendor_scorecard
 
 # Configs
-RISK_THRESHOLD_DAYS = 35
+RISK_THRESHOLD_DAYS = kpi_aggregates.RISK_THRESHOLD_DAYS
+CRITICAL_DAYS = kpi_aggregates.CRITICAL_DAYS
 DELAY_THRESHOLD_DAYS = 0
-OVERSPEND_THRESHOLD_PCT = 115  # 15% overspend threshold
+OVERSPEND_THRESHOLD_PCT = kpi_aggregates.OVERSPEND_THRESHOLD_PCT  # 15% overspend threshold
+SEVERE_DELAY_DAYS = kpi_aggregates.SEVERE_DELAY_DAYS
+SIMULATION_TRIALS = 20000  # Monte Carlo trials per base x category (standard error <= 0.4 points)
 BASE_PATH = os.path.join("data", "dataset")
+STORE_PATH = os.path.join("data", "warehouse", "logistics.duckdb")
 OUTPUT_XLSX = os.path.join("analysis", "operational_metrics_export.xlsx")
 OUTPUT_MD = os.path.join("analysis", "performance_analysis_report.md")
+OUTPUT_DETAIL_DIR = os.path.join("analysis", "detail")
 OUTPUT_DATE = datetime.now().strftime("%Y-%m-%d")
 
+# Excel sheet per metric, in workbook order; DETAIL_TABLES get optional sidecars
+EXPORT_SHEETS = {
+    'late_deliveries': "Late Deliveries",
+    'low_stock': "Critical Inventory",
+    'vendor_performance': "Vendor Performance",
+    'vendor_scorecard': "Vendor Scorecard",
+    'delay_distribution': "Delay Distribution",
+    'budget_analysis': "Budget Analysis",
+    'emergency_analysis': "Emergency Orders",
+    'base_risk': "Base Risk Index",
+    'kpi_trends': "Rolling KPI Trends",
+    'stockout_forecast': "Stock-out Forecast",
+    'stockout_risk': "Stock-out Risk",
+    'redistribution_plan': "Redistribution Plan"
+}
+# Unbounded row-level metrics: each query runs once into a store table, only
+# its first DETAIL_PREVIEW_ROWS rows are loaded into memory, and the workbook
+# and sidecars stream the full table
+DETAIL_TABLES = ['late_deliveries', 'low_stock']
+DETAIL_PREVIEW_ROWS = 1000
+
 # logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -40,39 +82,17 @@ def validate_data_sources():
     
     logger.info("All required data files validated successfully")
 
-def load_data_sources(con):
-    """Load CSV files into DuckDB tables with data quality validation."""
-    
-    tables_loaded = {}
+def load_data_sources(con, incremental=False):
+    """Sync the persistent store with the source CSVs and keep KPI aggregates current."""
     
     try:
-        # Supply orders
-        con.execute(f"""
-            CREATE OR REPLACE TABLE supply_orders AS
-            SELECT * FROM read_csv_auto('{os.path.join(BASE_PATH, "supply_orders.csv")}')
-        """)
-        tables_loaded['supply_orders'] = con.execute("SELECT COUNT(*) FROM supply_orders").fetchone()[0]
-        
-        # supply deliveries
-        con.execute(f"""
-            CREATE OR REPLACE TABLE supply_deliveries AS
-            SELECT * FROM read_csv_auto('{os.path.join(BASE_PATH, "supply_deliveries.csv")}')
-        """)
-        tables_loaded['supply_deliveries'] = con.execute("SELECT COUNT(*) FROM supply_deliveries").fetchone()[0]
-        
-        # Base inventory
-        con.execute(f"""
-            CREATE OR REPLACE TABLE base_inventory_supply AS
-            SELECT * FROM read_csv_auto('{os.path.join(BASE_PATH, "base_inventory_supply.csv")}')
-        """)
-        tables_loaded['base_inventory_supply'] = con.execute("SELECT COUNT(*) FROM base_inventory_supply").fetchone()[0]
-        
-        # supply budget
-        con.execute(f"""
-            CREATE OR REPLACE TABLE supply_budget AS
-            SELECT * FROM read_csv_auto('{os.path.join(BASE_PATH, "supply_budget.csv")}')
-        """)
-        tables_loaded['supply_budget'] = con.execute("SELECT COUNT(*) FROM supply_budget").fetchone()[0]
+        tables_loaded = kpi_aggregates.refresh_store(con, BASE_PATH, incremental=incremental)
+        kpi_trends.refresh_trends(con)
+        vendor_scorecard.refresh_scorecard(con)
+        forecasting.refresh_forecasts(con)
+        stockout_simulation.refresh_risk(con, SIMULATION_TRIALS)
+        redistribution.refresh_plan(con)
+        alerting.refresh_alerts(con)
         
         logger.info(f"Data loaded successfully: {tables_loaded}")
         return tables_loaded
@@ -81,47 +101,47 @@ def load_data_sources(con):
         logger.error(f"Failed to load data sources: {e}")
         raise
 
-def generate_data_quality_report(con):
-    """Generate data quality validation report."""
-    
-    quality_checks = {}
-    
-    try:
-        # Check for missing delivery dates
-        quality_checks['missing_delivery_dates'] = con.execute("""
-            SELECT COUNT(*) FROM supply_deliveries 
-            WHERE actual_delivery_date IS NULL OR expected_delivery_date IS NULL
-        """).fetchone()[0]
-        
-        # Check for negative inventory
-        quality_checks['negative_inventory'] = con.execute("""
-            SELECT COUNT(*) FROM base_inventory_supply 
-            WHERE inventory_units < 0 OR avg_daily_consumption <= 0
-        """).fetchone()[0]
-        
-        # Check for missing budget data
-        quality_checks['missing_budget_data'] = con.execute("""
-            SELECT COUNT(*) FROM supply_budget 
-            WHERE budget_allocated IS NULL OR budget_spent IS NULL
-        """).fetchone()[0]
-        
-        # Check for orphaned orders (orders without deliveries)
-        quality_checks['orphaned_orders'] = con.execute("""
-            SELECT COUNT(*) FROM supply_orders o
-            LEFT JOIN supply_deliveries d ON o.order_id = d.order_id
-            WHERE d.order_id IS NULL
-        """).fetchone()[0]
-        
-        # Data coverage period
-        date_range = con.execute("""
+def data_quality_queries():
+    """Data coverage queries reported next to the rule checks: (sql, fetch mode) by name."""
+    return {
+        # Data coverage period; bases and vendors are keys of the daily
+        # delivery aggregate, so distinct counts there are exact and skip
+        # the scan of supply_deliveries
+        'date_range': ("""
             SELECT 
                 MIN(actual_delivery_date) as earliest_delivery,
                 MAX(actual_delivery_date) as latest_delivery,
                 COUNT(DISTINCT base) as unique_bases,
                 COUNT(DISTINCT vendor) as unique_vendors
-            FROM supply_deliveries
-        """).fetchone()
-        
+            FROM agg_vendor_daily
+        """, "one")
+    }
+
+def generate_data_quality_report(con, tracer=None, sample_percent=None):
+    """Generate data quality validation report.
+    
+    Every rule in data_quality.RULES is evaluated in one fused pass per
+    table (violating row keys land in the dq_quarantine table); the report
+    holds the violation count per rule, the per-rule summary under
+    'rules' and the data coverage period. ``sample_percent`` checks the
+    largest tables on a key sample and reports scaled-up estimates.
+    """
+    
+    try:
+        summary, rule_timings = data_quality.evaluate_quality(con, sample_percent=sample_percent)
+        coverage, timings = query_scheduler.run_queries(con, data_quality_queries())
+        if tracer is not None:
+            tracer.record_queries("generate_data_quality_report", {**rule_timings, **timings})
+        
+        quality_checks = {row.rule: int(row.estimated_violations) for row in summary.itertuples()}
+        quality_checks['rules'] = [{
+            'table': row.table_name,
+            'rule': row.rule,
+            'severity': row.severity,
+            'violations': int(row.estimated_violations),
+            'sampled': not pd.isna(row.sample_percent)
+        } for row in summary.itertuples()]
+        date_range = coverage['date_range']
         quality_checks['date_range'] = {
             'earliest_delivery': date_range[0],
             'latest_delivery': date_range[1], 
@@ -129,96 +149,195 @@ def generate_data_quality_report(con):
             'unique_vendors': date_range[3]
         }
         
-        logger.info(f"Data quality assessment completed: {quality_checks}")
+        logger.info(f"Data quality assessment completed: { {rule: count for rule, count in quality_checks.items() if rule not in ('rules', 'date_range')} }")
         return quality_checks
         
     except Exception as e:
         logger.error(f"Data quality check failed: {e}")
         return {}
 
-def analyze_performance_metrics(con):
-    """Generate core performance analysis with enhanced error handling."""
-    
-    metrics = {}
-    
-    try:
+def data_integrity_ok(quality_report):
+    """No Error-severity rule violations and no missing delivery dates or budget data."""
+    errors = sum(rule['violations'] for rule in quality_report.get('rules', []) if rule['severity'] == 'Error')
+    return errors == 0 and all(quality_report.get(name, 0) == 0 for name in ['missing_delivery_dates', 'missing_budget_data'])
+
+def performance_queries():
+    """Independent KPI queries, keyed by metric name: (sql, fetch mode)."""
+    return {
         # Late deliveries analysis
-        late_deliveries_df = con.execute(f"""
+        'late_deliveries': (f"""
             SELECT 
                 order_id, vendor, base, supply_category,
                 expected_delivery_date, actual_delivery_date, delay_days,
                 route_risk_level
             FROM supply_deliveries
             WHERE delay_days > {DELAY_THRESHOLD_DAYS}
-            ORDER BY delay_days DESC
-        """).fetchdf()
-        metrics['late_deliveries'] = late_deliveries_df
+            ORDER BY delay_days DESC, order_id
+        """, "df"),
         
         # Critical inventory analysis
-        low_stock_df = con.execute(f"""
+        'low_stock': (f"""
             SELECT 
                 base, supply_category, inventory_units,
                 avg_daily_consumption, days_remaining,
                 last_updated,
                 CASE 
-                    WHEN days_remaining < 15 THEN 'Critical'
+                    WHEN days_remaining < {CRITICAL_DAYS} THEN 'Critical'
                     WHEN days_remaining < 25 THEN 'High Risk'
                     ELSE 'Moderate Risk'
                 END as risk_level
             FROM base_inventory_supply
             WHERE days_remaining < {RISK_THRESHOLD_DAYS}
-            ORDER BY days_remaining ASC
-        """).fetchdf()
-        metrics['low_stock'] = low_stock_df
-        
-        # Enhanced vendor performance metrics
-        vendor_metrics_df = con.execute("""
-            SELECT 
-                vendor,
-                COUNT(*) AS total_deliveries,
-                SUM(CASE WHEN delay_days > 0 THEN 1 ELSE 0 END) AS delayed_deliveries,
-                SUM(CASE WHEN delay_days > 7 THEN 1 ELSE 0 END) AS severely_delayed,
-                ROUND(AVG(delay_days), 2) AS avg_delay,
-                ROUND(100.0 * SUM(CASE WHEN delay_days <= 0 THEN 1 ELSE 0 END) / COUNT(*), 2) AS on_time_percentage,
-                MAX(delay_days) as worst_delay,
-                COUNT(DISTINCT base) as bases_served
-            FROM supply_deliveries
-            GROUP BY vendor
-            ORDER BY on_time_percentage ASC, avg_delay DESC
-        """).fetchdf()
-        metrics['vendor_performance'] = vendor_metrics_df
+            ORDER BY days_remaining ASC, base, supply_category
+        """, "df"),
+        
+        # Enhanced vendor performance metrics (shared roll-up of the daily aggregate)
+        'vendor_performance': (f"""
+            {kpi_aggregates.VENDOR_ROLLUP_SQL.format(where="")}
+            ORDER BY on_time_percentage ASC, avg_delay DESC, vendor
+        """, "df"),
+        
+        # Weighted vendor scores with the delay control-chart status, worst first
+        'vendor_scorecard': (f"""
+            SELECT * FROM {vendor_scorecard.SCORECARD_TABLE}
+            ORDER BY score, vendor
+        """, "df"),
+        
+        # Delay distribution per vendor x route risk x delivery method ('All' = rolled up)
+        'delay_distribution': (f"""
+            SELECT * FROM {vendor_scorecard.DISTRIBUTION_TABLE}
+            ORDER BY vendor, route_risk_level, delivery_method
+        """, "df"),
         
         # Budget utilization with overspend analysis
-        budget_df = con.execute(f"""
+        'budget_analysis': (f"""
             SELECT 
                 base, supply_category, budget_allocated,
-                budget_spent, budget_variance,
-                ROUND((budget_spent / budget_allocated) * 100, 2) AS percent_spent,
+                budget_spent, budget_variance, percent_spent,
                 CASE 
                     WHEN budget_spent > budget_allocated * {OVERSPEND_THRESHOLD_PCT/100} THEN 'Significant Overspend'
                     WHEN budget_spent > budget_allocated THEN 'Overspend'
                     WHEN budget_spent < budget_allocated * 0.5 THEN 'Underutilized'
                     ELSE 'Normal'
                 END as spending_category
-            FROM supply_budget
-            ORDER BY percent_spent DESC
-        """).fetchdf()
-        metrics['budget_analysis'] = budget_df
+            FROM agg_budget
+            ORDER BY percent_spent DESC, base, supply_category
+        """, "df"),
         
         # Emergency procurement analysis
-        emergency_analysis_df = con.execute("""
-            SELECT 
-                base,
-                COUNT(*) as total_orders,
-                SUM(CASE WHEN priority = 'Emergency' THEN 1 ELSE 0 END) as emergency_orders,
-                ROUND(100.0 * SUM(CASE WHEN priority = 'Emergency' THEN 1 ELSE 0 END) / COUNT(*), 2) as emergency_rate,
-                supply_category
-            FROM supply_orders
-            GROUP BY base, supply_category
+        'emergency_analysis': (f"""
+            {kpi_aggregates.EMERGENCY_ROLLUP_SQL.format(where="")}
             HAVING emergency_rate > 20  -- Flag bases with >20% emergency orders
-            ORDER BY emergency_rate DESC
-        """).fetchdf()
-        metrics['emergency_analysis'] = emergency_analysis_df
+            ORDER BY emergency_rate DESC, base, supply_category
+        """, "df"),
+        
+        # Composite base risk index (same table the dashboard charts)
+        'base_risk': ("""
+            SELECT 
+                base, ROUND(route_risk, 2) AS route_risk,
+                ROUND(low_supply_ratio, 2) AS low_supply_ratio,
+                ROUND(overspend_ratio, 2) AS overspend_ratio,
+                ROUND(emergency_ratio, 2) AS emergency_ratio,
+                ROUND(base_risk_index, 1) AS base_risk_index
+            FROM kpi_base_risk
+            ORDER BY base_risk_index DESC, base
+        """, "df"),
+        
+        # Rolling 7/30/90-day KPIs as of the latest day of the trend table
+        'kpi_trends': (f"""
+            {kpi_trends.latest_trends_sql()}
+            ORDER BY CASE scope WHEN 'fleet' THEN 0 WHEN 'base' THEN 1 ELSE 2 END, entity
+        """, "df"),
+        
+        # Projected stock-outs within the risk window (early bound of the forecast band)
+        'stockout_forecast': (f"""
+            SELECT 
+                base, supply_category, inventory_units, as_of_date,
+                forecast_daily_consumption, consumption_trend,
+                projected_days_remaining, stockout_date,
+                stockout_date_early, stockout_date_late,
+                history_points, model
+            FROM {forecasting.FORECAST_TABLE}
+            WHERE days_remaining_early <= {RISK_THRESHOLD_DAYS}
+            ORDER BY stockout_date_early, base, supply_category
+        """, "df"),
+        
+        # Monte Carlo probability of stocking out before the next resupply arrives
+        'stockout_risk': (f"""
+            SELECT * FROM {stockout_simulation.RISK_TABLE}
+            ORDER BY stockout_probability DESC, expected_shortage_days DESC, base, supply_category
+        """, "df"),
+        
+        # Optimized cross-base transfers lifting positions above the risk threshold
+        'redistribution_plan': (f"""
+            SELECT * FROM {redistribution.PLAN_TABLE}
+            ORDER BY supply_category, to_base, transport_cost, from_base
+        """, "df")
+    }
+
+def detail_table(name):
+    """Store table holding the full result of a detail metric."""
+    return f"detail_{name}"
+
+def details_current(con, queries):
+    """Whether the detail tables were built from the store's current data with the current queries."""
+    if not data_store.table_exists(con, "_detail_version"):
+        return False
+    built = con.execute("SELECT data_version, query_hash FROM _detail_version").fetchone()
+    return built == (data_store.data_version(con), _detail_query_hash(queries))
+
+def _detail_query_hash(queries):
+    """Fingerprint of the detail queries, so edited queries rebuild a current store's tables."""
+    return hashlib.sha1(repr([queries[name][0] for name in DETAIL_TABLES]).encode()).hexdigest()[:16]
+
+def detail_summary_queries():
+    """Bounded roll-ups of the detail tables, used by the report instead of their rows."""
+    return {
+        'late_delivery_summary': (f"""
+            SELECT supply_category, COUNT(*) AS late_deliveries
+            FROM {detail_table('late_deliveries')}
+            GROUP BY supply_category
+            ORDER BY late_deliveries DESC, supply_category
+        """, "df"),
+        'low_stock_summary': (f"""
+            SELECT risk_level, COUNT(*) AS positions
+            FROM {detail_table('low_stock')}
+            GROUP BY risk_level
+            ORDER BY risk_level
+        """, "df")
+    }
+
+def analyze_performance_metrics(con, tracer=None):
+    """Generate core performance analysis with enhanced error handling.
+    
+    Detail metrics (DETAIL_TABLES) are executed once into store tables
+    (rebuilt only when the store data changed) and returned as their first
+    DETAIL_PREVIEW_ROWS rows, with their counts in the ``*_summary``
+    metrics; every other metric is small and is returned in full.
+    """
+    
+    try:
+        queries = performance_queries()
+        timings = {}
+        rebuild = not details_current(con, queries)
+        for name in DETAIL_TABLES:
+            if rebuild:
+                started = time.perf_counter()
+                con.execute(f"CREATE OR REPLACE TABLE {detail_table(name)} AS {queries[name][0]}")
+                timings[name] = time.perf_counter() - started
+            queries[name] = (f"SELECT * FROM {detail_table(name)} LIMIT {DETAIL_PREVIEW_ROWS}", "df")
+        if rebuild:
+            con.execute("CREATE OR REPLACE TABLE _detail_version AS SELECT ? AS data_version, ? AS query_hash",
+                        [data_store.data_version(con), _detail_query_hash(performance_queries())])
+        queries.update(detail_summary_queries())
+        
+        # KPI queries are independent, so they run concurrently on separate
+        # cursors; metrics keep the order of performance_queries()
+        metrics, query_timings = query_scheduler.run_queries(con, queries)
+        timings.update(query_timings)
+        if tracer is not None:
+            tracer.record_queries("analyze_performance_metrics", timings)
+            tracer.explain_queries(con, performance_queries())
         
         logger.info("Performance metrics analysis completed successfully")
         return metrics
@@ -227,46 +346,53 @@ def analyze_performance_metrics(con):
         logger.error(f"Performance analysis failed: {e}")
         raise
 
-def export_analysis_results(metrics, quality_report):
-    """Export results to Excel with enhanced formatting and metadata."""
+def export_analysis_results(metrics, quality_report, con=None, sidecar_format=None):
+    """Export results to Excel with enhanced formatting and metadata.
+    
+    Sheets are written through a write-only workbook so memory stays flat
+    regardless of result size. With a connection, the detail sheets are
+    streamed in DuckDB result chunks from the tables analyze_performance_metrics
+    materialized (the queries are not run again), tables past Excel's row
+    limit continue on numbered sheets, and ``sidecar_format`` ("parquet" or
+    "csv") also writes the full-detail tables to OUTPUT_DETAIL_DIR. Without
+    one, detail sheets hold only the in-memory preview rows. Returns the
+    number of data rows written to the workbook.
+    """
     
     try:
-        with pd.ExcelWriter(OUTPUT_XLSX, engine='openpyxl') as writer:
-            # Core analysis sheets
-            if not metrics['late_deliveries'].empty:
-                metrics['late_deliveries'].to_excel(writer, sheet_name="Late Deliveries", index=False)
-            
-            if not metrics['low_stock'].empty:
-                metrics['low_stock'].to_excel(writer, sheet_name="Critical Inventory", index=False)
-            
-            if not metrics['vendor_performance'].empty:
-                metrics['vendor_performance'].to_excel(writer, sheet_name="Vendor Performance", index=False)
-            
-            if not metrics['budget_analysis'].empty:
-                metrics['budget_analysis'].to_excel(writer, sheet_name="Budget Analysis", index=False)
-            
-            if not metrics['emergency_analysis'].empty:
-                metrics['emergency_analysis'].to_excel(writer, sheet_name="Emergency Orders", index=False)
-            
-            # Data quality summary sheet
-            quality_df = pd.DataFrame([{
-                'Metric': 'Missing Delivery Dates',
-                'Count': quality_report.get('missing_delivery_dates', 0),
-                'Status': 'OK' if quality_report.get('missing_delivery_dates', 0) == 0 else 'Warning'
-            }, {
-                'Metric': 'Negative Inventory Records',
-                'Count': quality_report.get('negative_inventory', 0),
-                'Status': 'OK' if quality_report.get('negative_inventory', 0) == 0 else 'Error'
-            }, {
-                'Metric': 'Missing Budget Data',
-                'Count': quality_report.get('missing_budget_data', 0),
-                'Status': 'OK' if quality_report.get('missing_budget_data', 0) == 0 else 'Warning'
-            }])
-            
-            quality_df.to_excel(writer, sheet_name="Data Quality", index=False)
-            
+        workbook = streaming_export.new_workbook()
+        rows_written = 0
+        
+        # Core analysis sheets
+        for name, sheet_name in EXPORT_SHEETS.items():
+            if metrics.get(name) is None or metrics[name].empty:
+                continue
+            if con is not None and name in DETAIL_TABLES:
+                rows_written += streaming_export.write_query_sheet(
+                    workbook, con, f"SELECT * FROM {detail_table(name)}", sheet_name)
+            else:
+                rows_written += streaming_export.write_frame_sheet(workbook, metrics[name], sheet_name)
+        
+        # Data quality summary sheet: one row per rule
+        quality_df = pd.DataFrame([{
+            'Metric': rule['rule'].replace('_', ' ').title(),
+            'Table': rule['table'],
+            'Count': rule['violations'],
+            'Status': 'OK' if rule['violations'] == 0 else rule['severity']
+        } for rule in quality_report.get('rules', [])], columns=['Metric', 'Table', 'Count', 'Status'])
+        
+        rows_written += streaming_export.write_frame_sheet(workbook, quality_df, "Data Quality")
+        workbook.save(OUTPUT_XLSX)
         logger.info(f"Analysis results exported to {OUTPUT_XLSX}")
         
+        # Optional full-detail sidecars
+        if sidecar_format and con is not None:
+            for name in DETAIL_TABLES:
+                path = os.path.join(OUTPUT_DETAIL_DIR, f"{name}.{sidecar_format}")
+                streaming_export.export_sidecar(con, f"SELECT * FROM {detail_table(name)}", path, sidecar_format)
+        
+        return rows_written
+        
     except Exception as e:
         logger.error(f"Failed to export Excel results: {e}")
         raise
@@ -276,20 +402,38 @@ def generate_enhanced_report(metrics, quality_report):
     
     try:
         # Extract key findings with safe data access
-        late_deliveries_df = metrics.get('late_deliveries', pd.DataFrame())
+        late_summary_df = metrics.get('late_delivery_summary', pd.DataFrame(columns=['supply_category', 'late_deliveries']))
+        low_stock_summary_df = metrics.get('low_stock_summary', pd.DataFrame(columns=['risk_level', 'positions']))
         low_stock_df = metrics.get('low_stock', pd.DataFrame())
+        late_delivery_count = int(late_summary_df['late_deliveries'].sum())
+        low_stock_count = int(low_stock_summary_df['positions'].sum())
+        critical_positions = int(low_stock_summary_df.loc[low_stock_summary_df['risk_level'] == 'Critical', 'positions'].sum())
         vendor_metrics_df = metrics.get('vendor_performance', pd.DataFrame())
+        scorecard_df = metrics.get('vendor_scorecard', pd.DataFrame())
         budget_df = metrics.get('budget_analysis', pd.DataFrame())
         emergency_df = metrics.get('emergency_analysis', pd.DataFrame())
+        base_risk_df = metrics.get('base_risk', pd.DataFrame())
+        forecast_df = metrics.get('stockout_forecast', pd.DataFrame())
+        risk_df = metrics.get('stockout_risk', pd.DataFrame())
+        plan_df = metrics.get('redistribution_plan', pd.DataFrame())
+        trends_df = metrics.get('kpi_trends', pd.DataFrame())
         
         # Safe metric extraction
         top_risk_base = low_stock_df.iloc[0]["base"] if not low_stock_df.empty else "No critical inventory identified"
         top_risk_category = low_stock_df.iloc[0]["supply_category"] if not low_stock_df.empty else "N/A"
         
-        worst_vendor = vendor_metrics_df.iloc[0]["vendor"] if not vendor_metrics_df.empty else "No vendor performance issues"
+        # Worst vendor by weighted score (on-time, SLA and severe-delay rates)
+        if not scorecard_df.empty:
+            worst_vendor = f"{scorecard_df.iloc[0]['vendor']} (score {scorecard_df.iloc[0]['score']})"
+        elif not vendor_metrics_df.empty:
+            worst_vendor = vendor_metrics_df.iloc[0]["vendor"]
+        else:
+            worst_vendor = "No vendor performance issues"
+        degrading_vendors = scorecard_df[scorecard_df['delay_status'] == 'Degrading'] if not scorecard_df.empty else scorecard_df
+        degrading_text = ", ".join(f"{row.vendor} (z = {row.z_score})" for row in degrading_vendors.itertuples()) or "none"
         highest_avg_delay = vendor_metrics_df["avg_delay"].max() if not vendor_metrics_df.empty else 0
         
-        most_delayed_category = late_deliveries_df["supply_category"].mode()[0] if not late_deliveries_df.empty else "No delayed categories"
+        most_delayed_category = late_summary_df.iloc[0]["supply_category"] if not late_summary_df.empty else "No delayed categories"
         
         # Budget analysis
         if not budget_df.empty:
@@ -310,6 +454,55 @@ def generate_enhanced_report(metrics, quality_report):
         high_emergency_base = emergency_df.iloc[0]["base"] if not emergency_df.empty else "No excessive emergency orders"
         emergency_rate = emergency_df.iloc[0]["emergency_rate"] if not emergency_df.empty else 0
         
+        # Composite base risk
+        highest_risk_base = base_risk_df.iloc[0]["base"] if not base_risk_df.empty else "N/A"
+        highest_risk_index = base_risk_df.iloc[0]["base_risk_index"] if not base_risk_df.empty else "N/A"
+        
+        # Forecast stock-outs
+        if not forecast_df.empty:
+            first_stockout = forecast_df.iloc[0]
+            first_stockout_text = (f"{first_stockout['base']} – {first_stockout['supply_category']} "
+                                   f"as early as {first_stockout['stockout_date_early']:%Y-%m-%d}")
+        else:
+            first_stockout_text = "None projected"
+        
+        # Simulated stock-out before resupply
+        if not risk_df.empty:
+            likely_stockouts = int((risk_df['stockout_probability'] >= 0.5).sum())
+            top_risk = risk_df.iloc[0]
+            stockout_risk_text = (f"{likely_stockouts}; highest: {top_risk['base']} – {top_risk['supply_category']} "
+                                  f"({top_risk['stockout_probability']:.0%}, resupply in {top_risk['mean_resupply_days']} days "
+                                  f"vs {top_risk['days_of_cover']} days of cover)")
+        else:
+            stockout_risk_text = "no inventory positions simulated"
+        
+        # Redistribution plan
+        if not plan_df.empty:
+            lifted_positions = len(plan_df[['to_base', 'supply_category']].drop_duplicates())
+            redistribution_text = (f"optimized plan: {len(plan_df)} transfers lift {lifted_positions} base-category "
+                                   f"positions above {RISK_THRESHOLD_DAYS} days (see Redistribution Plan sheet)")
+        else:
+            redistribution_text = "no feasible cross-base transfers in the current plan"
+        
+        # Rolling averages (fleet-wide, latest day of the trend table)
+        fleet_trends = trends_df[trends_df['scope'] == 'fleet'] if not trends_df.empty else trends_df
+        if not fleet_trends.empty:
+            fleet = fleet_trends.iloc[0]
+            rolling_text = (f"fleet 90-day rolling averages as of {fleet['as_of_date']:%Y-%m-%d}: "
+                            f"{fleet['on_time_pct_90d']}% on time (30-day: {fleet['on_time_pct_30d']}%), "
+                            f"{fleet['avg_delay_90d']} days average delay, {fleet['emergency_rate_90d']}% emergency orders "
+                            f"(see Rolling KPI Trends sheet)")
+        else:
+            rolling_text = "no delivery history available for rolling averages"
+        
+        violated = [rule for rule in quality_report.get('rules', []) if rule['violations'] > 0]
+        if violated:
+            breakdown = ", ".join(f"{rule['rule']}: {rule['violations']}" for rule in violated)
+            estimated = " (estimated from a sample)" if any(rule['sampled'] for rule in violated) else ""
+            quarantine_text = f"{sum(rule['violations'] for rule in violated)} violations{estimated} ({breakdown}); row keys in `{data_quality.QUARANTINE_TABLE}`"
+        else:
+            quarantine_text = "none"
+        
         # Generate comprehensive report
         md_text = f"""# Performance Analysis Report: Supply Logistics
 **Generated:** {OUTPUT_DATE}  
@@ -325,12 +518,13 @@ This analysis identifies critical performance gaps across vendor delivery, inven
 - **Missing Delivery Dates:** {quality_report.get('missing_delivery_dates', 0)} records
 - **Invalid Inventory Records:** {quality_report.get('negative_inventory', 0)} records  
 - **Missing Budget Data:** {quality_report.get('missing_budget_data', 0)} records
-- **Data Integrity Status:** {'GOOD' if all(v == 0 for v in [quality_report.get('missing_delivery_dates', 0), quality_report.get('negative_inventory', 0), quality_report.get('missing_budget_data', 0)]) else 'REQUIRES ATTENTION'}
+- **Rule Violations Quarantined:** {quarantine_text}
+- **Data Integrity Status:** {'GOOD' if data_integrity_ok(quality_report) else 'REQUIRES ATTENTION'}
 
 ## Critical Findings
 
 ### 1. Delivery Performance Issues
-- **{len(late_deliveries_df)}** deliveries experienced delays beyond acceptable thresholds
+- **{late_delivery_count}** deliveries experienced delays beyond acceptable thresholds
 - **Worst performing vendor:** {worst_vendor}
 - **Average delay impact:** {highest_avg_delay} days
 - **Most affected supply category:** {most_delayed_category}
@@ -342,9 +536,11 @@ This analysis identifies critical performance gaps across vendor delivery, inven
 - Poor synchronization between procurement lead times and operational demand cycles
 
 ### 2. Inventory Risk Exposure  
-- **{len(low_stock_df)}** base-category combinations below {RISK_THRESHOLD_DAYS}-day sustainability threshold
+- **{low_stock_count}** base-category combinations below {RISK_THRESHOLD_DAYS}-day sustainability threshold
 - **Highest risk location:** {top_risk_base} – {top_risk_category}
-- **Critical inventory categories identified:** {len(low_stock_df[low_stock_df['risk_level'] == 'Critical']) if not low_stock_df.empty else 0}
+- **Critical inventory categories identified:** {critical_positions}
+- **Forecast stock-outs within {RISK_THRESHOLD_DAYS} days (90% band):** {len(forecast_df)}; earliest: {first_stockout_text}
+- **Positions more likely than not to stock out before resupply (Monte Carlo over vendor delay distributions):** {stockout_risk_text}
 
 **Root Causes:**
 - Lack of predictive consumption modeling based on operational tempo
@@ -354,7 +550,8 @@ This analysis identifies critical performance gaps across vendor delivery, inven
 
 ### 3. Vendor Performance Degradation
 - **Lowest on-time delivery rate:** {vendor_metrics_df['on_time_percentage'].min() if not vendor_metrics_df.empty else 'N/A'}%
-- **Vendors with severe delays (>7 days):** {len(vendor_metrics_df[vendor_metrics_df['severely_delayed'] > 0]) if not vendor_metrics_df.empty else 0}
+- **Vendors with severe delays (>{SEVERE_DELAY_DAYS} days):** {len(vendor_metrics_df[vendor_metrics_df['severely_delayed'] > 0]) if not vendor_metrics_df.empty else 0}
+- **Vendors with degrading delays (control chart, last {vendor_scorecard.RECENT_DAYS} days above {vendor_scorecard.CONTROL_Z:g}σ limit):** {len(degrading_vendors)}; {degrading_text}
 - **Geographic coverage gaps:** Vendors serving limited base networks
 
 **Root Causes:**
@@ -384,11 +581,11 @@ This analysis identifies critical performance gaps across vendor delivery, inven
 ### Immediate Actions (0-30 days)
 1. **Implement automated inventory alerts** for all base-category pairs below {RISK_THRESHOLD_DAYS} days
 2. **Initiate vendor performance review** for {worst_vendor} and other underperforming suppliers  
-3. **Deploy emergency stock redistribution** to address critical shortfalls at {top_risk_base}
+3. **Deploy emergency stock redistribution** to address critical shortfalls at {top_risk_base} – {redistribution_text}
 4. **Establish daily tracking** of high-risk delivery routes and vendor capacity
 
 ### Short-term Improvements (30-90 days)  
-5. **Develop predictive consumption models** using 90-day rolling averages and operational tempo indicators
+5. **Develop predictive consumption models** using 90-day rolling averages and operational tempo indicators – {rolling_text}
 6. **Implement performance-based vendor incentives** with automatic escalation protocols
 7. **Establish cross-base inventory sharing agreements** for emergency redistribution
 8. **Deploy real-time budget tracking** with variance alerts at 90% threshold
@@ -403,7 +600,8 @@ This analysis identifies critical performance gaps across vendor delivery, inven
 
 **MISSION CRITICAL:** Current inventory and vendor performance gaps pose immediate risk to operational readiness  
 **BUDGET IMPACT:** Uncontrolled emergency procurement increasing costs by estimated 15-25%  
-**OPERATIONAL IMPACT:** Supply disruptions affecting {len(low_stock_df)} base-category combinations
+**OPERATIONAL IMPACT:** Supply disruptions affecting {low_stock_count} base-category combinations  
+**HIGHEST COMPOSITE RISK:** {highest_risk_base} (base risk index {highest_risk_index})
 
 ## Next Steps
 
@@ -424,39 +622,71 @@ This analysis identifies critical performance gaps across vendor delivery, inven
         logger.error(f"Failed to generate report: {e}")
         raise
 
-def main():
-    """Main execution function with comprehensive error handling."""
+def main(incremental=False, sidecar_format=None, trace_path=None, metrics_path=None, explain=False,
+         quality_sample=None, per_base_reports=False):
+    """Main execution function with comprehensive error handling.
     
+    Every stage runs inside an instrumentation span (wall/CPU time, peak
+    RSS, rows in/out). ``trace_path`` writes the spans, per-query timings
+    and, with ``explain``, EXPLAIN ANALYZE profiles as JSON;
+    ``metrics_path`` writes them as a Prometheus textfile.
+    ``quality_sample`` checks the largest tables' data quality rules on a
+    sample of that percent of their rows. ``per_base_reports`` also
+    renders one report per base, skipping bases whose inputs are unchanged.
+    """
+    
+    tracer = instrumentation.Tracer(explain=explain)
+    con = None
     try:
         logger.info("Starting logistics performance analysis...")
         
         # Validate data sources
-        validate_data_sources()
+        with tracer.span("validate_data_sources"):
+            validate_data_sources()
         
-        # Initialize database connection
-        con = duckdb.connect()
+        # Open the persistent columnar store
+        con = data_store.connect_store(STORE_PATH)
         
         # Load and validate data
-        tables_loaded = load_data_sources(con)
+        with tracer.span("load_data_sources", incremental=incremental) as span:
+            tables_loaded = load_data_sources(con, incremental=incremental)
+            span.set(rows_in=sum(tables_loaded.values()))
         logger.info(f"Loaded {sum(tables_loaded.values())} total records across all tables")
         
         # Generate data quality report
-        quality_report = generate_data_quality_report(con)
+        with tracer.span("generate_data_quality_report"):
+            quality_report = generate_data_quality_report(con, tracer=tracer, sample_percent=quality_sample)
         
         # Perform core analysis
-        metrics = analyze_performance_metrics(con)
+        with tracer.span("analyze_performance_metrics") as span:
+            metrics = analyze_performance_metrics(con, tracer=tracer)
+            span.set(rows_out=sum(len(df) for df in metrics.values()))
         
         # Export results
-        export_analysis_results(metrics, quality_report)
+        with tracer.span("export_analysis_results", sidecar_format=sidecar_format) as span:
+            span.set(rows_out=export_analysis_results(metrics, quality_report, con=con, sidecar_format=sidecar_format))
         
         # Generate comprehensive report
-        generate_enhanced_report(metrics, quality_report)
+        with tracer.span("generate_enhanced_report") as span:
+            generate_enhanced_report(metrics, quality_report)
+            span.set(rows_in=sum(len(df) for df in metrics.values()))
+        
+        # Per-base reports from the same store state
+        if per_base_reports:
+            with tracer.span("render_base_reports") as span:
+                rendered, _ = base_reports.render_base_reports(con)
+                span.set(rows_out=rendered)
+        
+        # Hand the refreshed store to readers (dashboard, snapshot export)
+        with tracer.span("publish_store"):
+            data_store.publish_store(con, STORE_PATH)
         
         logger.info("="*50)
         logger.info("ANALYSIS COMPLETE")
         logger.info(f"Excel export: {OUTPUT_XLSX}")
         logger.info(f"Report: {OUTPUT_MD}")
-        logger.info(f"Data quality: {'GOOD' if all(v == 0 for v in [quality_report.get('missing_delivery_dates', 0), quality_report.get('negative_inventory', 0)]) else 'REQUIRES ATTENTION'}")
+        logger.info(f"Data quality: {'GOOD' if data_integrity_ok(quality_report) else 'REQUIRES ATTENTION'}")
+        logger.info(f"Stage timings (s): {tracer.summary()}")
         logger.info("="*50)
         
     except FileNotFoundError as e:
@@ -466,6 +696,33 @@ def main():
         logger.error(f"Analysis failed: {e}")
         print(f"CRITICAL ERROR: Analysis failed - {e}")
         raise
+    finally:
+        # Release the store's write lock before anything else waits on it
+        if con is not None:
+            con.close()
+        # Written even for failed runs so the failing stage is visible
+        if trace_path:
+            tracer.write_json(trace_path)
+        if metrics_path:
+            tracer.write_prometheus(metrics_path)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Supply logistics KPI analysis")
+    parser.add_argument("--incremental", action="store_true",
+                        help="ingest only new or changed orders/deliveries and patch aggregates in place")
+    parser.add_argument("--sidecar", choices=["parquet", "csv"],
+                        help=f"also write full-detail tables to {OUTPUT_DETAIL_DIR} in this format")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write per-stage timings, memory, row counts and query timings as JSON")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write the same measurements in Prometheus text format (textfile collector)")
+    parser.add_argument("--explain", action="store_true",
+                        help="capture EXPLAIN ANALYZE profiles of the KPI queries in the trace")
+    parser.add_argument("--quality-sample", type=float, metavar="PERCENT",
+                        help=f"check data quality rules on a sample of tables over {data_quality.SAMPLE_MIN_ROWS:,} rows")
+    parser.add_argument("--base-reports", action="store_true",
+                        help=f"also render one report per base into {base_reports.OUTPUT_DIR}, skipping unchanged bases")
+    args = parser.parse_args()
+    main(incremental=args.incremental, sidecar_format=args.sidecar,
+         trace_path=args.trace, metrics_path=args.metrics, explain=args.explain,
+         quality_sample=args.quality_sample, per_base_reports=args.base_reports)
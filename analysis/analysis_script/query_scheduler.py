@@ -0,0 +1,50 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+def _fetch(cursor, sql, fetch):
+    """Execute one query on its own cursor and materialize it in the requested form."""
+    result = cursor.execute(sql)
+    if fetch == "df":
+        return result.fetchdf()
+    if fetch == "one":
+        return result.fetchone()
+    if fetch == "scalar":
+        return result.fetchone()[0]
+    return result.fetchall()
+
+def _run_one(con, sql, fetch):
+    """Run a single named query on a fresh cursor, returning its result and timing."""
+    started = time.perf_counter()
+    cursor = con.cursor()
+    try:
+        return _fetch(cursor, sql, fetch), time.perf_counter() - started
+    finally:
+        cursor.close()
+
+def run_queries(con, queries, max_workers=None):
+    """Run independent queries concurrently and return results in submission order.
+
+    ``queries`` maps a name to ``(sql, fetch)`` where fetch is "df", "one",
+    "scalar" or "all". Each query gets its own DuckDB cursor from a thread
+    pool; DuckDB releases the GIL while executing, so end-to-end latency is
+    bounded by the slowest query rather than the sum. Returns
+    ``(results, timings)``, both keyed in the order of ``queries``, with
+    timings in seconds. The first failing query's exception is re-raised.
+    """
+    if not queries:
+        return {}, {}
+    workers = max_workers or min(len(queries), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: pool.submit(_run_one, con, sql, fetch)
+            for name, (sql, fetch) in queries.items()
+        }
+        results, timings = {}, {}
+        for name, future in futures.items():
+            results[name], timings[name] = future.result()
+    logger.info(f"Query timings (s): { {name: round(t, 4) for name, t in timings.items()} }")
+    return results, timings
@@ -0,0 +1,251 @@
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+import data_store
+import kpi_aggregates
+
+# Configs
+RISK_THRESHOLD_DAYS = kpi_aggregates.RISK_THRESHOLD_DAYS
+DONOR_BUFFER_DAYS = 10  # donors keep this much cover above the risk threshold
+MAX_DONORS_PER_RECIPIENT = 20  # cheapest candidate lanes kept per recipient
+LANE_CAPACITY_UNITS = 5000  # units a low-risk lane can move; scaled down by lane risk
+MAX_LANE_RISK = 2.75  # lanes riskier than this (1 = Low .. 3 = High) are not used
+SOLVER_TIME_LIMIT_S = 60
+
+# Relative cost per unit moved, by delivery method
+METHOD_UNIT_COST = {
+    "Truck": 1.0,
+    "Convoy": 1.3,
+    "Chartered Freight": 2.5,
+    "Helicopter": 4.0
+}
+METHOD_COST_SQL = "CASE delivery_method " + " ".join(
+    f"WHEN '{method}' THEN {cost}" for method, cost in METHOD_UNIT_COST.items()
+) + " END"
+
+PLAN_TABLE = "redistribution_plan"
+OUTCOME_TABLE = "redistribution_outcome"
+PLAN_COLUMNS = ["supply_category", "from_base", "to_base", "units", "unit_transport_cost",
+                "transport_cost", "lane_risk"]
+OUTCOME_COLUMNS = ["base", "supply_category", "inventory_units", "avg_daily_consumption",
+                   "days_before", "units_needed", "units_received", "days_after", "lifted"]
+
+logger = logging.getLogger(__name__)
+
+def _require_scipy():
+    """Import the MILP solver, which is an optional dependency."""
+    try:
+        from scipy.optimize import milp, LinearConstraint, Bounds
+        from scipy.sparse import csr_matrix
+    except ImportError as e:
+        raise ImportError(
+            "Stock redistribution needs SciPy >= 1.9 (HiGHS MILP solver): pip install scipy"
+        ) from e
+    return milp, LinearConstraint, Bounds, csr_matrix
+
+def load_positions(con, threshold=RISK_THRESHOLD_DAYS):
+    """Inventory positions with their shortfall (recipients) or spare stock (donors)."""
+    return con.execute(f"""
+        SELECT
+            base, supply_category, inventory_units, avg_daily_consumption,
+            inventory_units / avg_daily_consumption AS days_before,
+            GREATEST(CEIL({threshold} * avg_daily_consumption - inventory_units), 0)::BIGINT AS units_needed,
+            GREATEST(FLOOR(inventory_units - {threshold + DONOR_BUFFER_DAYS} * avg_daily_consumption), 0)::BIGINT AS units_spare
+        FROM base_inventory_supply
+        WHERE avg_daily_consumption > 0
+        ORDER BY supply_category, base
+    """).fetchdf()
+
+def load_route_profiles(con):
+    """Per-base unit transport cost and route risk from its delivery history."""
+    return con.execute(f"""
+        SELECT
+            base,
+            AVG({METHOD_COST_SQL}) AS method_cost,
+            AVG({kpi_aggregates.ROUTE_RISK_SCORE}) AS route_risk
+        FROM supply_deliveries
+        GROUP BY base
+    """).fetchdf()
+
+def candidate_lanes(positions, profiles):
+    """Donor -> recipient lanes within each category, keeping each recipient's cheapest donors.
+
+    A lane's risk is the mean route risk of its two bases; its unit cost is
+    the mean delivery-method cost scaled by that risk, and its capacity
+    shrinks as risk grows.
+    """
+    profiles = profiles.set_index("base")
+    positions = positions.assign(
+        method_cost=positions["base"].map(profiles["method_cost"]).fillna(profiles["method_cost"].median()),
+        route_risk=positions["base"].map(profiles["route_risk"]).fillna(profiles["route_risk"].median())
+    ).reset_index(names="position")
+    recipients = positions[positions["units_needed"] > 0]
+    donors = positions[positions["units_spare"] > 0]
+
+    lanes = recipients.merge(donors, on="supply_category", suffixes=("_to", "_from"))
+    lanes = lanes[lanes["base_to"] != lanes["base_from"]]
+    lanes["lane_risk"] = (lanes["route_risk_to"] + lanes["route_risk_from"]) / 2
+    lanes = lanes[lanes["lane_risk"] <= MAX_LANE_RISK]
+    lanes["unit_transport_cost"] = (lanes["method_cost_to"] + lanes["method_cost_from"]) / 2 * lanes["lane_risk"]
+    lanes["capacity"] = np.floor(LANE_CAPACITY_UNITS / lanes["lane_risk"])
+
+    lanes = lanes.sort_values(["position_to", "unit_transport_cost"])
+    lanes = lanes[lanes.groupby("position_to").cumcount() < MAX_DONORS_PER_RECIPIENT]
+    return lanes.reset_index(drop=True), recipients, donors
+
+def solve_block(lanes, recipients, donors, time_limit=SOLVER_TIME_LIMIT_S):
+    """Choose transfers that lift the most positions above the threshold, then at least cost.
+
+    Sparse MILP with a continuous flow per lane and one binary per recipient
+    (1 = lifted to the threshold). Phase one maximizes the number lifted;
+    phase two fixes that count and minimizes transport cost. Returns the
+    flow per lane and the recipients lifted.
+    """
+    milp, LinearConstraint, Bounds, csr_matrix = _require_scipy()
+    lanes = lanes.reset_index(drop=True)
+    n_lanes, n_recipients = len(lanes), len(recipients)
+    if n_lanes == 0:
+        return np.zeros(0), np.zeros(n_recipients, dtype=bool)
+
+    recipient_row = pd.Series(np.arange(n_recipients), index=recipients["position"])
+    donor_row = pd.Series(np.arange(len(donors)), index=donors["position"])
+    lane_to = recipient_row[lanes["position_to"]].to_numpy()
+    lane_from = donor_row[lanes["position_from"]].to_numpy()
+    need = recipients["units_needed"].to_numpy(dtype=float)
+    lane_ids = np.arange(n_lanes)
+    lift_columns = n_lanes + np.arange(n_recipients)
+
+    # Donors ship at most their spare stock
+    supply = csr_matrix((np.ones(n_lanes), (lane_from, lane_ids)), shape=(len(donors), n_lanes + n_recipients))
+    # Recipients receive at most their need, and all of it when marked lifted
+    inflow = csr_matrix(
+        (np.concatenate([np.ones(n_lanes), -need]),
+         (np.concatenate([lane_to, np.arange(n_recipients)]), np.concatenate([lane_ids, lift_columns]))),
+        shape=(n_recipients, n_lanes + n_recipients)
+    )
+    receive_cap = csr_matrix((np.ones(n_lanes), (lane_to, lane_ids)), shape=(n_recipients, n_lanes + n_recipients))
+    constraints = [
+        LinearConstraint(supply, -np.inf, donors["units_spare"].to_numpy(dtype=float)),
+        LinearConstraint(inflow, 0, np.inf),
+        LinearConstraint(receive_cap, -np.inf, need)
+    ]
+    bounds = Bounds(np.zeros(n_lanes + n_recipients),
+                    np.concatenate([lanes["capacity"].to_numpy(dtype=float), np.ones(n_recipients)]))
+    integrality = np.concatenate([np.zeros(n_lanes), np.ones(n_recipients)])
+    options = {"time_limit": time_limit}
+
+    # Phase 1: most positions lifted
+    lift_objective = np.concatenate([np.zeros(n_lanes), -np.ones(n_recipients)])
+    lifted = milp(lift_objective, constraints=constraints, bounds=bounds, integrality=integrality, options=options)
+    if lifted.x is None:
+        raise RuntimeError(f"Redistribution solver failed: {lifted.message}")
+    best = int(round(-lifted.fun))
+
+    # Phase 2: cheapest plan achieving that count
+    cost_objective = np.concatenate([lanes["unit_transport_cost"].to_numpy(), np.zeros(n_recipients)])
+    keep_count = LinearConstraint(csr_matrix(-lift_objective), best, np.inf)
+    cheapest = milp(cost_objective, constraints=constraints + [keep_count], bounds=bounds,
+                    integrality=integrality, options=options)
+    solution = cheapest.x if cheapest.x is not None else lifted.x
+    return solution[:n_lanes], solution[n_lanes:] > 0.5
+
+def solve_plan(lanes, recipients, donors, time_limit=SOLVER_TIME_LIMIT_S):
+    """Solve every category's block of the transfer problem.
+
+    Stock never moves between categories, so the full problem is block
+    diagonal; solving the blocks separately gives the same optimum and is
+    orders of magnitude faster for the MILP search than one combined model.
+    """
+    flow = np.zeros(len(lanes))
+    lifted = np.zeros(len(recipients), dtype=bool)
+    for category in recipients["supply_category"].unique():
+        lane_mask = (lanes["supply_category"] == category).to_numpy()
+        recipient_mask = (recipients["supply_category"] == category).to_numpy()
+        donor_mask = (donors["supply_category"] == category).to_numpy()
+        flow[lane_mask], lifted[recipient_mask] = solve_block(
+            lanes[lane_mask], recipients[recipient_mask], donors[donor_mask], time_limit
+        )
+    return flow, lifted
+
+def optimize_redistribution(con, threshold=RISK_THRESHOLD_DAYS, time_limit=SOLVER_TIME_LIMIT_S):
+    """Build the transfer plan and per-position outcome for every category in one batched run."""
+    positions = load_positions(con, threshold)
+    lanes, recipients, donors = candidate_lanes(positions, load_route_profiles(con))
+    flow, lifted = solve_plan(lanes, recipients, donors, time_limit)
+
+    # Round up so lifted positions clear the threshold; donors keep a buffer
+    lanes["units"] = np.ceil(flow - 1e-6).astype(int)
+    plan = lanes[lanes["units"] > 0].rename(columns={"base_from": "from_base", "base_to": "to_base"})
+    plan = plan.assign(transport_cost=(plan["units"] * plan["unit_transport_cost"]).round(2),
+                       unit_transport_cost=plan["unit_transport_cost"].round(3),
+                       lane_risk=plan["lane_risk"].round(2))[PLAN_COLUMNS]
+    plan = plan.sort_values(["supply_category", "to_base", "transport_cost"]).reset_index(drop=True)
+
+    received = plan.groupby(["to_base", "supply_category"])["units"].sum().rename("units_received")
+    outcome = recipients.assign(lifted=lifted).merge(
+        received, left_on=["base", "supply_category"], right_index=True, how="left"
+    ).fillna({"units_received": 0})
+    outcome = outcome.assign(
+        days_after=((outcome["inventory_units"] + outcome["units_received"]) / outcome["avg_daily_consumption"]).round(1),
+        days_before=outcome["days_before"].round(1)
+    )[OUTCOME_COLUMNS].reset_index(drop=True)
+    logger.info(f"Redistribution plan: {len(plan)} transfers lift {int(lifted.sum())} of "
+                f"{len(recipients)} positions above {threshold} days "
+                f"(transport cost {plan['transport_cost'].sum():,.0f})")
+    return plan, outcome
+
+def _write_table(con, name, df):
+    """Replace a store table with the contents of a DataFrame."""
+    con.register("_redistribution_df", df)
+    con.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM _redistribution_df")
+    con.unregister("_redistribution_df")
+
+def plan_current(con, threshold):
+    """Whether the plan was solved from the store's current data with this threshold."""
+    if not data_store.table_exists(con, "_redistribution_version"):
+        return False
+    built = con.execute("SELECT data_version, aggregate_version, threshold FROM _redistribution_version").fetchone()
+    return built == (data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION, threshold)
+
+def refresh_plan(con, threshold=RISK_THRESHOLD_DAYS, force=False):
+    """Persist the plan for reporting when the store changed; without SciPy, leave empty tables and warn.
+
+    Returns the number of transfers, or None when the plan was already current.
+    """
+    if not force and plan_current(con, threshold):
+        return None
+    try:
+        plan, outcome = optimize_redistribution(con, threshold)
+    except ImportError as e:
+        logger.warning(f"Skipping redistribution plan: {e}")
+        plan = pd.DataFrame(columns=PLAN_COLUMNS)
+        outcome = pd.DataFrame(columns=OUTCOME_COLUMNS)
+        solved = False
+    else:
+        solved = True
+    _write_table(con, PLAN_TABLE, plan)
+    _write_table(con, OUTCOME_TABLE, outcome)
+    if solved:
+        # An empty placeholder plan is not recorded, so installing SciPy re-solves it
+        con.execute("""
+            CREATE OR REPLACE TABLE _redistribution_version AS
+            SELECT ? AS data_version, ? AS aggregate_version, ? AS threshold
+        """, [data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION, threshold])
+    return len(plan)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Plan cross-base stock transfers to lift positions above the risk threshold")
+    parser.add_argument("--threshold", type=float, default=RISK_THRESHOLD_DAYS, help="days of cover to restore")
+    parser.add_argument("--time-limit", type=float, default=SOLVER_TIME_LIMIT_S, help="solver time limit per phase (s)")
+    parser.add_argument("--output", help="also write the transfer plan to this CSV")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        plan, outcome = optimize_redistribution(con, args.threshold, args.time_limit)
+        _write_table(con, PLAN_TABLE, plan)
+        _write_table(con, OUTCOME_TABLE, outcome)
+    if args.output:
+        plan.to_csv(args.output, index=False)
+    print(plan.to_string(index=False))
@@ -0,0 +1,263 @@
+import logging
+import argparse
+import pandas as pd
+
+import data_store
+import kpi_aggregates
+import vendor_scorecard
+
+# Configs
+RISK_THRESHOLD_DAYS = kpi_aggregates.RISK_THRESHOLD_DAYS
+CRITICAL_DAYS = kpi_aggregates.CRITICAL_DAYS
+DELAY_THRESHOLD_DAYS = 0  # a delivery is late past this many days
+BASELINE = "baseline"
+
+# Perturbation kinds and the columns that narrow them (empty = everything):
+#   delay_shift             add `value` days to every matching delivery's delay
+#   consumption_multiplier  multiply matching daily consumption by `value`
+#   budget_cut              cut matching budget allocations by `value` percent
+PERTURBATION_FILTERS = {
+    "delay_shift": ["vendor", "delivery_method", "route_risk_level"],
+    "consumption_multiplier": ["base", "supply_category"],
+    "budget_cut": ["base", "supply_category"]
+}
+PERTURBATION_COLUMNS = ["scenario", "kind", "vendor", "delivery_method", "route_risk_level",
+                        "base", "supply_category", "value"]
+# KPIs also reported as the change against the baseline scenario
+COMPARED_KPIS = ["late_deliveries", "on_time_pct", "avg_delay", "low_stock_positions",
+                 "overspend_lines", "mean_base_risk_index", "max_base_risk_index"]
+
+logger = logging.getLogger(__name__)
+
+def _match_sql(kind, alias):
+    """Join condition of a perturbation onto the rows it applies to (NULL filters match all)."""
+    return " AND ".join(
+        [f"p.kind = '{kind}'"]
+        + [f"(p.{column} IS NULL OR p.{column} = {alias}.{column}::VARCHAR)" for column in PERTURBATION_FILTERS[kind]]
+    )
+
+def scenarios_sql():
+    """KPIs and base risk index for every scenario in one set-based pass.
+
+    Scenarios are rows of _scenario_names, their perturbations rows of
+    _scenario_perturbations. Each scenario is applied to the shared store
+    aggregates instead of a copy of the data: delay shifts move the
+    delivery delay histogram (agg_vendor_delay_hist), consumption
+    multipliers scale days of cover, budget cuts scale allocations. Route
+    risk and emergency rates are not perturbed and are computed once.
+    """
+    weights = vendor_scorecard.SCORE_WEIGHTS
+    return f"""
+        WITH shifted AS (
+            SELECT s.scenario, h.vendor, h.deliveries, h.delay_days + COALESCE(SUM(p.value), 0) AS delay_days
+            FROM _scenario_names s
+            CROSS JOIN agg_vendor_delay_hist h
+            LEFT JOIN _scenario_perturbations p ON p.scenario = s.scenario AND {_match_sql("delay_shift", "h")}
+            GROUP BY s.scenario, h.vendor, h.route_risk_level, h.delivery_method, h.delay_days, h.deliveries
+        ), vendors AS (
+            SELECT scenario, vendor,
+                SUM(deliveries) AS deliveries,
+                COALESCE(SUM(deliveries) FILTER (WHERE delay_days IS NOT NULL), 0) AS delay_samples,
+                SUM(deliveries * delay_days) AS total_delay_days,
+                COALESCE(SUM(deliveries) FILTER (WHERE delay_days > {DELAY_THRESHOLD_DAYS}), 0) AS late,
+                COALESCE(SUM(deliveries) FILTER (WHERE delay_days <= 0), 0) AS on_time,
+                COALESCE(SUM(deliveries) FILTER (WHERE delay_days > {kpi_aggregates.SLA_DELAY_DAYS}), 0) AS sla_breaches,
+                COALESCE(SUM(deliveries) FILTER (WHERE delay_days > {kpi_aggregates.SEVERE_DELAY_DAYS}), 0) AS severe
+            FROM shifted
+            GROUP BY scenario, vendor
+        ), delivery_kpis AS (
+            SELECT scenario,
+                SUM(late)::BIGINT AS late_deliveries,
+                ROUND(100.0 * SUM(on_time) / SUM(deliveries), 2) AS on_time_pct,
+                ROUND(SUM(total_delay_days) / NULLIF(SUM(delay_samples), 0), 2) AS avg_delay,
+                ROUND(100.0 * SUM(sla_breaches) / SUM(deliveries), 2) AS sla_breach_pct,
+                SUM(severe)::BIGINT AS severe_delays,
+                FIRST(vendor ORDER BY
+                    {weights['on_time']} * on_time / deliveries + {weights['within_sla']} * (1 - sla_breaches / deliveries)
+                    + {weights['not_severe']} * (1 - severe / deliveries), vendor) AS worst_vendor
+            FROM vendors
+            GROUP BY scenario
+        ), inventory AS (
+            SELECT s.scenario, i.base, i.supply_category,
+                i.days_remaining / COALESCE(PRODUCT(p.value), 1) AS days_remaining
+            FROM _scenario_names s
+            CROSS JOIN base_inventory_supply i
+            LEFT JOIN _scenario_perturbations p ON p.scenario = s.scenario AND {_match_sql("consumption_multiplier", "i")}
+            GROUP BY s.scenario, i.base, i.supply_category, i.days_remaining
+        ), budget AS (
+            SELECT s.scenario, b.base, b.supply_category, b.budget_spent,
+                b.budget_allocated * COALESCE(PRODUCT(1 - p.value / 100), 1) AS budget_allocated
+            FROM _scenario_names s
+            CROSS JOIN agg_budget b
+            LEFT JOIN _scenario_perturbations p ON p.scenario = s.scenario AND {_match_sql("budget_cut", "b")}
+            GROUP BY s.scenario, b.base, b.supply_category, b.budget_spent, b.budget_allocated
+        ), route AS (
+            SELECT base, SUM(total_route_risk) / SUM(route_risk_samples) AS route_risk
+            FROM agg_vendor_daily GROUP BY base
+        ), emergency AS (
+            SELECT base, SUM(emergency_orders) / SUM(total_orders) AS emergency_ratio
+            FROM agg_emergency_daily GROUP BY base
+        ), low_supply AS (
+            SELECT scenario, base,
+                AVG(CASE WHEN days_remaining < {kpi_aggregates.LOW_SUPPLY_DAYS} THEN 1 ELSE 0 END) AS low_supply_ratio
+            FROM inventory GROUP BY scenario, base
+        ), overspend AS (
+            SELECT scenario, base,
+                AVG(CASE WHEN budget_spent > budget_allocated * {kpi_aggregates.OVERSPEND_THRESHOLD_PCT / 100} THEN 1 ELSE 0 END) AS overspend_ratio
+            FROM budget GROUP BY scenario, base
+        ), components AS (
+            SELECT s.scenario, route.base, route.route_risk, low_supply.low_supply_ratio,
+                overspend.overspend_ratio, emergency.emergency_ratio
+            FROM _scenario_names s
+            CROSS JOIN route
+            LEFT JOIN low_supply ON low_supply.scenario = s.scenario AND low_supply.base = route.base
+            LEFT JOIN overspend ON overspend.scenario = s.scenario AND overspend.base = route.base
+            LEFT JOIN emergency ON emergency.base = route.base
+        ), risk_kpis AS (
+            SELECT scenario,
+                ROUND(AVG(base_risk_index), 1) AS mean_base_risk_index,
+                ROUND(MAX(base_risk_index), 1) AS max_base_risk_index,
+                FIRST(base ORDER BY base_risk_index DESC, base) AS highest_risk_base
+            FROM (SELECT scenario, base, {kpi_aggregates.RISK_INDEX_SQL} AS base_risk_index FROM components)
+            GROUP BY scenario
+        ), inventory_kpis AS (
+            SELECT scenario,
+                COUNT(*) FILTER (WHERE days_remaining < {RISK_THRESHOLD_DAYS}) AS low_stock_positions,
+                COUNT(*) FILTER (WHERE days_remaining < {CRITICAL_DAYS}) AS critical_positions,
+                ROUND(MIN(days_remaining), 1) AS min_days_remaining
+            FROM inventory
+            GROUP BY scenario
+        ), budget_kpis AS (
+            SELECT scenario,
+                COUNT(*) FILTER (WHERE budget_spent > budget_allocated * {kpi_aggregates.OVERSPEND_THRESHOLD_PCT / 100}) AS overspend_lines,
+                ROUND(100.0 * SUM(budget_spent) / SUM(budget_allocated), 2) AS percent_spent
+            FROM budget
+            GROUP BY scenario
+        )
+        SELECT s.scenario, s.perturbations, d.* EXCLUDE (scenario), i.* EXCLUDE (scenario),
+            b.* EXCLUDE (scenario), r.* EXCLUDE (scenario)
+        FROM _scenario_names s
+        LEFT JOIN delivery_kpis d USING (scenario)
+        LEFT JOIN inventory_kpis i USING (scenario)
+        LEFT JOIN budget_kpis b USING (scenario)
+        LEFT JOIN risk_kpis r USING (scenario)
+        ORDER BY s.position
+    """
+
+def validate_perturbations(perturbations):
+    """Normalize a perturbation table (DataFrame or list of dicts) and reject unknown kinds or filters."""
+    frame = pd.DataFrame(perturbations)
+    unknown_columns = set(frame.columns) - set(PERTURBATION_COLUMNS)
+    if unknown_columns:
+        raise ValueError(f"Unknown perturbation columns: {sorted(unknown_columns)}")
+    frame = frame.reindex(columns=PERTURBATION_COLUMNS)
+    if frame["scenario"].isna().any() or frame["value"].isna().any():
+        raise ValueError("Every perturbation needs a scenario and a value")
+    unknown_kinds = set(frame["kind"]) - set(PERTURBATION_FILTERS)
+    if unknown_kinds:
+        raise ValueError(f"Unknown perturbation kinds {sorted(map(str, unknown_kinds))} "
+                         f"(expected one of {list(PERTURBATION_FILTERS)})")
+    for kind, filters in PERTURBATION_FILTERS.items():
+        ignored = [column for column in PERTURBATION_COLUMNS[2:-1]
+                   if column not in filters and frame.loc[frame["kind"] == kind, column].notna().any()]
+        if ignored:
+            raise ValueError(f"{kind} perturbations cannot be narrowed by {ignored} (use {filters})")
+    if (frame.loc[frame["kind"] == "consumption_multiplier", "value"] <= 0).any():
+        raise ValueError("Consumption multipliers must be positive")
+    if (frame.loc[frame["kind"] == "budget_cut", "value"] >= 100).any():
+        raise ValueError("Budget cuts are percentages below 100")
+    if (frame["scenario"] == BASELINE).any():
+        raise ValueError(f"'{BASELINE}' is reserved for the unperturbed scenario")
+    frame[PERTURBATION_COLUMNS[:-1]] = frame[PERTURBATION_COLUMNS[:-1]].astype(object).where(
+        frame[PERTURBATION_COLUMNS[:-1]].notna(), None)
+    frame["value"] = frame["value"].astype(float)
+    return frame
+
+def _describe(rows):
+    """Short human-readable summary of one scenario's perturbations."""
+    parts = []
+    for row in rows.itertuples(index=False):
+        scope = "/".join(str(getattr(row, column)) for column in PERTURBATION_FILTERS[row.kind]
+                         if getattr(row, column) is not None) or "all"
+        if row.kind == "delay_shift":
+            parts.append(f"{scope} delay {row.value:+g}d")
+        elif row.kind == "consumption_multiplier":
+            parts.append(f"{scope} consumption x{row.value:g}")
+        else:
+            parts.append(f"{scope} budget -{row.value:g}%")
+    return "; ".join(parts)
+
+def run_scenarios(con, perturbations):
+    """Evaluate every scenario against the current store and compare it with the baseline.
+
+    ``perturbations`` has one row per perturbation (see PERTURBATION_COLUMNS);
+    rows sharing a scenario name are applied together. Returns one row per
+    scenario, baseline first, with the headline KPIs, the base risk index
+    summary and a ``<kpi>_change`` column against the baseline for each of
+    COMPARED_KPIS.
+    """
+    frame = validate_perturbations(perturbations)
+    names = [BASELINE] + list(dict.fromkeys(frame["scenario"]))
+    described = {name: _describe(rows) for name, rows in frame.groupby("scenario", sort=False)}
+    scenario_names = pd.DataFrame({
+        "position": range(len(names)),
+        "scenario": names,
+        "perturbations": [described.get(name, "none") for name in names]
+    })
+
+    cursor = con.cursor()
+    try:
+        cursor.register("_scenario_names", scenario_names)
+        cursor.register("_scenario_perturbations", frame)
+        comparison = cursor.execute(scenarios_sql()).fetchdf()
+    finally:
+        cursor.close()
+
+    baseline = comparison.iloc[0]
+    for kpi in COMPARED_KPIS:
+        comparison[f"{kpi}_change"] = (comparison[kpi] - baseline[kpi]).round(2)
+    logger.info(f"Evaluated {len(names) - 1} scenarios against the baseline")
+    return comparison
+
+def sweep_perturbations(con, vendor_slip=None, consumption_rise=None, budget_cut=None):
+    """One single-change scenario per vendor, supply category or base.
+
+    ``vendor_slip`` days of extra delay for each vendor in turn,
+    ``consumption_rise`` percent more consumption for each supply category,
+    ``budget_cut`` percent less allocation for each base.
+    """
+    rows = []
+    if vendor_slip is not None:
+        for (vendor,) in con.execute("SELECT DISTINCT vendor FROM agg_vendor_delay_hist ORDER BY vendor").fetchall():
+            rows.append({"scenario": f"{vendor} slips {vendor_slip:g}d", "kind": "delay_shift",
+                         "vendor": vendor, "value": vendor_slip})
+    if consumption_rise is not None:
+        for (category,) in con.execute("SELECT DISTINCT supply_category FROM base_inventory_supply ORDER BY 1").fetchall():
+            rows.append({"scenario": f"{category} consumption +{consumption_rise:g}%", "kind": "consumption_multiplier",
+                         "supply_category": category, "value": 1 + consumption_rise / 100})
+    if budget_cut is not None:
+        for (base,) in con.execute("SELECT DISTINCT base FROM agg_budget ORDER BY base").fetchall():
+            rows.append({"scenario": f"{base} budget -{budget_cut:g}%", "kind": "budget_cut",
+                         "base": base, "value": budget_cut})
+    return pd.DataFrame(rows, columns=PERTURBATION_COLUMNS)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Compare what-if scenarios against the current KPIs")
+    parser.add_argument("--scenarios", metavar="CSV",
+                        help=f"perturbations, one per row with columns {', '.join(PERTURBATION_COLUMNS)}")
+    parser.add_argument("--vendor-slip", type=float, metavar="DAYS", help="add a scenario per vendor slipping DAYS")
+    parser.add_argument("--consumption-rise", type=float, metavar="PCT",
+                        help="add a scenario per supply category consuming PCT%% more")
+    parser.add_argument("--budget-cut", type=float, metavar="PCT", help="add a scenario per base losing PCT%% of its budget")
+    parser.add_argument("--output", help="write the comparison table to this CSV")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        kpi_aggregates.refresh_store(con)
+        perturbations = [sweep_perturbations(con, args.vendor_slip, args.consumption_rise, args.budget_cut)]
+        if args.scenarios:
+            perturbations.append(pd.read_csv(args.scenarios))
+        comparison = run_scenarios(con, pd.concat(perturbations, ignore_index=True))
+    if args.output:
+        comparison.to_csv(args.output, index=False)
+    print(comparison.to_string(index=False))
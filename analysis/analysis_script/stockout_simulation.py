@@ -0,0 +1,292 @@
+import os
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+import data_store
+import forecasting
+import kpi_aggregates
+
+# Configs
+DEFAULT_TRIALS = 100000
+DEFAULT_SEED = 42
+BLOCK_SAMPLES = 2000000  # series x trials drawn per block, bounds memory per worker
+CONSUMPTION_CV = forecasting.DEFAULT_CV  # daily consumption std / rate
+DEFAULT_LEAD_DAYS = 30  # order-to-due lead time when no order history exists
+ALL = "All"  # pooled delay distribution label (every vendor and/or route risk)
+RISK_TABLE = "stockout_risk"
+RISK_COLUMNS = ["base", "supply_category", "as_of_date", "inventory_units", "avg_daily_consumption",
+                "days_of_cover", "resupply", "resupply_vendor", "nominal_resupply_days",
+                "mean_resupply_days", "stockout_probability", "expected_shortage_days", "trials"]
+
+logger = logging.getLogger(__name__)
+
+# Simulation inputs of the current process (set once per worker)
+_model = {}
+
+def alias_tables(weights, groups):
+    """Walker alias tables for consecutive groups of weighted outcomes.
+
+    ``groups`` labels each weight with its distribution (0..n-1, sorted).
+    Returns each group's first outcome and size plus, per outcome, the
+    probability of keeping it and the (global) outcome it otherwise aliases,
+    so any number of draws from any mix of distributions costs O(1) each.
+    """
+    weights = np.asarray(weights, dtype=float)
+    groups = np.asarray(groups)
+    sizes = np.bincount(groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    keep = np.ones(len(weights))
+    alias = np.arange(len(weights))
+    for start, size in zip(starts, sizes):
+        scaled = weights[start:start + size] * size / weights[start:start + size].sum()
+        small = [i for i in range(size) if scaled[i] < 1]
+        large = [i for i in range(size) if scaled[i] >= 1]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            keep[start + low] = scaled[low]
+            alias[start + low] = start + high
+            scaled[high] -= 1 - scaled[low]
+            (small if scaled[high] < 1 else large).append(high)
+    return starts, sizes, keep, alias
+
+def draw(rng, group, tables):
+    """Sample one outcome index from the alias tables of each entry of ``group``."""
+    starts, sizes, keep, alias = tables
+    size = sizes[group]
+    scaled = rng.random(group.shape) * size
+    column = np.minimum(scaled.astype(np.int64), size - 1)
+    outcome = starts[group] + column
+    return np.where(scaled - column < keep[outcome], outcome, alias[outcome])
+
+def load_delay_cells(con):
+    """Empirical delay distributions per vendor x route risk, pooled per vendor and fleet-wide.
+
+    Returns the index of every cell key, the delay value of every
+    histogram bin and the cells' alias tables.
+    """
+    bins = con.execute(f"""
+        SELECT
+            CASE WHEN GROUPING(vendor) = 1 THEN '{ALL}' ELSE vendor END AS vendor,
+            CASE WHEN GROUPING(route_risk_level) = 1 THEN '{ALL}' ELSE route_risk_level::VARCHAR END AS route_risk_level,
+            delay_days, SUM(deliveries) AS n
+        FROM agg_vendor_delay_hist
+        WHERE delay_days IS NOT NULL
+        GROUP BY GROUPING SETS ((vendor, route_risk_level, delay_days), (vendor, delay_days), (delay_days))
+        ORDER BY vendor, route_risk_level, delay_days
+    """).fetchdf()
+    if bins.empty:
+        # No delivery history: every resupply arrives on its due date
+        bins = pd.DataFrame({"vendor": [ALL], "route_risk_level": [ALL], "delay_days": [0], "n": [1]})
+    codes, keys = pd.factorize(pd.MultiIndex.from_frame(bins[["vendor", "route_risk_level"]]))
+    cells = {key: index for index, key in enumerate(keys)}
+    return cells, bins["delay_days"].to_numpy(dtype=float), alias_tables(bins["n"], codes)
+
+def load_resupply(con, series, cells):
+    """Next resupply of every series: nominal days until due plus the delay cells it draws from.
+
+    An order already in transit at the snapshot date (ordered on or before
+    it, due on or after it and not yet delivered by then) resupplies from
+    its own vendor and route; the earliest due one counts. Otherwise a new
+    order is assumed, due after the series' median lead time and served
+    by its historical vendor x route risk mix.
+    """
+    in_transit = con.execute("""
+        SELECT i.base, i.supply_category,
+            arg_min(o.vendor, o.expected_delivery_date) AS vendor,
+            arg_min(d.route_risk_level::VARCHAR, o.expected_delivery_date) AS route_risk_level,
+            MIN(o.expected_delivery_date - i.last_updated) AS due_days
+        FROM base_inventory_supply i
+        JOIN supply_orders o ON o.base = i.base AND o.supply_category = i.supply_category
+        LEFT JOIN supply_deliveries d ON d.order_id = o.order_id
+        WHERE o.order_date <= i.last_updated AND o.expected_delivery_date >= i.last_updated
+          AND (d.actual_delivery_date IS NULL OR d.actual_delivery_date > i.last_updated)
+        GROUP BY i.base, i.supply_category
+    """).fetchdf()
+    lead = con.execute("""
+        SELECT base, supply_category, MEDIAN(expected_delivery_date - order_date) AS lead_days
+        FROM supply_orders
+        WHERE expected_delivery_date >= order_date
+        GROUP BY base, supply_category
+    """).fetchdf()
+    fleet_lead = con.execute("""
+        SELECT MEDIAN(expected_delivery_date - order_date) FROM supply_orders
+        WHERE expected_delivery_date >= order_date
+    """).fetchone()[0]
+    mix = con.execute("""
+        SELECT base, supply_category, vendor, route_risk_level::VARCHAR AS route_risk_level, COUNT(*) AS n
+        FROM supply_deliveries
+        WHERE delay_days IS NOT NULL
+        GROUP BY ALL
+        ORDER BY base, supply_category, vendor, route_risk_level
+    """).fetchdf()
+
+    keys = list(zip(series["base"], series["supply_category"]))
+    transit = {(r.base, r.supply_category): r for r in in_transit.itertuples()}
+    leads = {(r.base, r.supply_category): r.lead_days for r in lead.itertuples()}
+    mixes = {key: rows for key, rows in mix.groupby(["base", "supply_category"], sort=False)}
+    default_lead = DEFAULT_LEAD_DAYS if fleet_lead is None or pd.isna(fleet_lead) else float(fleet_lead)
+    pooled = cells[(ALL, ALL)]
+
+    nominal, kind, vendors, mix_cells, mix_weights, mix_series = [], [], [], [], [], []
+    for index, key in enumerate(keys):
+        if key in transit:
+            order = transit[key]
+            cell = cells.get((order.vendor, order.route_risk_level), cells.get((order.vendor, ALL), pooled))
+            nominal.append(float(order.due_days))
+            kind.append("in transit")
+            vendors.append(order.vendor)
+            mix_cells.append([cell])
+            mix_weights.append([1.0])
+        else:
+            nominal.append(float(leads.get(key, default_lead)))
+            kind.append("new order")
+            vendors.append(None)
+            rows = mixes.get(key)
+            if rows is None:
+                mix_cells.append([pooled])
+                mix_weights.append([1.0])
+            else:
+                mix_cells.append([cells.get((v, r), pooled) for v, r in zip(rows["vendor"], rows["route_risk_level"])])
+                mix_weights.append(rows["n"].to_numpy(dtype=float))
+        mix_series.append(np.full(len(mix_cells[-1]), index))
+
+    mix = alias_tables(np.concatenate(mix_weights), np.concatenate(mix_series))
+    return np.array(nominal), kind, vendors, np.concatenate(mix_cells).astype(np.int64), mix
+
+def load_model(con):
+    """Series, resupply and delay distributions the simulation samples from."""
+    series = con.execute("""
+        SELECT base, supply_category, last_updated AS as_of_date, inventory_units, avg_daily_consumption,
+            inventory_units / avg_daily_consumption AS days_of_cover
+        FROM base_inventory_supply
+        WHERE avg_daily_consumption > 0
+        ORDER BY base, supply_category
+    """).fetchdf()
+    if series.empty:
+        return series.assign(resupply=None, resupply_vendor=None, nominal_resupply_days=None), None
+    cells, delay_values, delay_tables = load_delay_cells(con)
+    nominal, kind, vendors, mix_cells, mix_tables = load_resupply(con, series, cells)
+    model = {
+        "inventory": series["inventory_units"].to_numpy(dtype=float),
+        "consumption": series["avg_daily_consumption"].to_numpy(dtype=float),
+        "nominal": nominal,
+        "mix_cells": mix_cells,
+        "mix_tables": mix_tables,
+        "delay_values": delay_values,
+        "delay_tables": delay_tables
+    }
+    series = series.assign(resupply=kind, resupply_vendor=vendors, nominal_resupply_days=nominal)
+    return series, model
+
+def _init_worker(model):
+    _model.update(model)
+
+def simulate_block(block_index, trials, seed):
+    """Run ``trials`` trials of every series; returns per-series stock-out counts and sums.
+
+    Each block draws from its own generator seeded by (seed, block index),
+    so results do not depend on how blocks are spread over workers. Per
+    trial: a vendor/route cell is drawn from the series' resupply mix, a
+    delay from that cell's empirical distribution, and the average daily
+    consumption until arrival from N(rate, (CONSUMPTION_CV * rate)^2 / days),
+    i.e. independent daily errors as in the forecast band. The series
+    stocks out when its stock covers fewer days than the resupply takes.
+    """
+    m = _model
+    rng = np.random.default_rng([seed, block_index])
+    n_series = len(m["inventory"])
+    series = np.broadcast_to(np.arange(n_series), (trials, n_series))
+
+    cell = m["mix_cells"][draw(rng, series, m["mix_tables"])]
+    delay = m["delay_values"][draw(rng, cell, m["delay_tables"])]
+    arrival = np.maximum(m["nominal"] + delay, 0)
+
+    rate = m["consumption"] * (1 + CONSUMPTION_CV * rng.standard_normal((trials, n_series))
+                               / np.sqrt(np.maximum(arrival, 1)))
+    with np.errstate(divide="ignore"):
+        cover = np.where(rate > 0, m["inventory"] / rate, np.inf)
+    shortage = np.maximum(arrival - cover, 0)
+    return (shortage > 0).sum(axis=0), shortage.sum(axis=0), arrival.sum(axis=0)
+
+def simulate(model, trials=DEFAULT_TRIALS, seed=DEFAULT_SEED, workers=1):
+    """Run the Monte Carlo trials in blocks, optionally across worker processes."""
+    n_series = len(model["inventory"])
+    block_trials = max(1, BLOCK_SAMPLES // max(n_series, 1))
+    blocks = [(index, min(block_trials, trials - start), seed)
+              for index, start in enumerate(range(0, trials, block_trials))]
+    totals = [np.zeros(n_series) for _ in range(3)]
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+            results = pool.map(simulate_block, *zip(*blocks))
+            for result in results:
+                for total, part in zip(totals, result):
+                    total += part
+    else:
+        _init_worker(model)
+        for block in blocks:
+            for total, part in zip(totals, simulate_block(*block)):
+                total += part
+    stockouts, shortage, arrival = totals
+    return stockouts / trials, shortage / trials, arrival / trials
+
+def build_risk(con, trials=DEFAULT_TRIALS, seed=DEFAULT_SEED, workers=1):
+    """Simulated stock-out probability before resupply for every base x supply category."""
+    series, model = load_model(con)
+    if model is None:
+        return series.assign(mean_resupply_days=None, stockout_probability=None,
+                             expected_shortage_days=None, trials=trials)[RISK_COLUMNS]
+    probability, shortage, arrival = simulate(model, trials, seed, workers)
+    return series.assign(
+        days_of_cover=series["days_of_cover"].round(1),
+        mean_resupply_days=np.round(arrival, 1),
+        stockout_probability=np.round(probability, 4),
+        expected_shortage_days=np.round(shortage, 2),
+        trials=trials
+    )[RISK_COLUMNS]
+
+def risk_current(con, trials, seed):
+    """Whether the risk table was simulated from the store's current data with these settings."""
+    if not data_store.table_exists(con, "_stockout_risk_version"):
+        return False
+    built = con.execute("SELECT data_version, aggregate_version, trials, seed FROM _stockout_risk_version").fetchone()
+    return built == (data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION, trials, seed)
+
+def refresh_risk(con, trials=DEFAULT_TRIALS, seed=DEFAULT_SEED, workers=1, force=False):
+    """Re-run the simulation into stockout_risk when the store changed.
+
+    Returns the number of series simulated, or None when the table was already current.
+    """
+    if not force and risk_current(con, trials, seed):
+        return None
+    risk = build_risk(con, trials, seed, workers)
+    con.register("_stockout_risk_df", risk)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {RISK_TABLE} AS
+        SELECT * REPLACE (as_of_date::DATE AS as_of_date, resupply_vendor::VARCHAR AS resupply_vendor)
+        FROM _stockout_risk_df
+    """)
+    con.unregister("_stockout_risk_df")
+    con.execute("""
+        CREATE OR REPLACE TABLE _stockout_risk_version AS
+        SELECT ? AS data_version, ? AS aggregate_version, ? AS trials, ? AS seed
+    """, [data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION, trials, seed])
+    logger.info(f"Stock-out risk simulated for {len(risk)} series x {trials} trials "
+                f"({int((risk['stockout_probability'] >= 0.5).sum())} more likely than not to stock out)")
+    return len(risk)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Simulate the probability of stocking out before resupply")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS, help="Monte Carlo trials per series")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="random seed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--force", action="store_true", help="re-run even if the store has not changed")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        kpi_aggregates.refresh_store(con)
+        refresh_risk(con, args.trials, args.seed, args.workers, args.force)
+        print(con.execute(f"SELECT * FROM {RISK_TABLE} ORDER BY stockout_probability DESC, base, supply_category")
+              .fetchdf().to_string(index=False))
@@ -0,0 +1,78 @@
+import os
+import logging
+from openpyxl import Workbook
+
+# Configs
+EXCEL_MAX_ROWS = 1048576  # per sheet, including the header row
+FETCH_BATCH_ROWS = 50000
+SHEET_NAME_MAX = 31
+
+logger = logging.getLogger(__name__)
+
+def new_workbook():
+    """Create a write-only workbook: rows are flushed to disk as they are appended."""
+    return Workbook(write_only=True)
+
+def _sheet_name(base_name, part):
+    """Sheet name for the n-th part of a split table, within Excel's 31-char limit."""
+    if part == 1:
+        return base_name[:SHEET_NAME_MAX]
+    suffix = f" ({part})"
+    return base_name[:SHEET_NAME_MAX - len(suffix)] + suffix
+
+def write_rows(workbook, sheet_name, header, batches, max_rows=EXCEL_MAX_ROWS):
+    """Append row batches to a sheet, continuing on a new sheet at Excel's row limit.
+
+    Nothing is created when ``batches`` yields no rows. Returns the number
+    of data rows written.
+    """
+    sheet, part, sheet_rows, written = None, 0, 0, 0
+    for batch in batches:
+        for row in batch:
+            if sheet is None or sheet_rows >= max_rows:
+                part += 1
+                sheet = workbook.create_sheet(_sheet_name(sheet_name, part))
+                sheet.append(header)
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+            written += 1
+    if part > 1:
+        logger.info(f"Sheet '{sheet_name}' split into {part} parts ({written} rows)")
+    return written
+
+def _cursor_batches(cursor, batch_size):
+    """Yield DuckDB result chunks without materializing the full result."""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+def write_query_sheet(workbook, con, sql, sheet_name, batch_size=FETCH_BATCH_ROWS):
+    """Stream a query's result into a sheet chunk by chunk on a dedicated cursor."""
+    cursor = con.cursor()
+    try:
+        cursor.execute(sql)
+        header = [column[0] for column in cursor.description]
+        return write_rows(workbook, sheet_name, header, _cursor_batches(cursor, batch_size))
+    finally:
+        cursor.close()
+
+def _frame_batches(df, batch_size):
+    """Yield a DataFrame's rows as plain Python tuples in batches."""
+    for start in range(0, len(df), batch_size):
+        chunk = df.iloc[start:start + batch_size]
+        yield chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+def write_frame_sheet(workbook, df, sheet_name, batch_size=FETCH_BATCH_ROWS):
+    """Write an in-memory DataFrame through the same streaming path."""
+    return write_rows(workbook, sheet_name, list(df.columns), _frame_batches(df, batch_size))
+
+def export_sidecar(con, sql, path, file_format="parquet"):
+    """Write a full-detail result next to the workbook via DuckDB's streaming COPY."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    options = "FORMAT PARQUET, COMPRESSION ZSTD" if file_format == "parquet" else "FORMAT CSV, HEADER"
+    con.execute(f"COPY ({sql}) TO '{path}' ({options})")
+    logger.info(f"Sidecar written: {path}")
+    return path
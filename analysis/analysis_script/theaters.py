@@ -0,0 +1,352 @@
+import os
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import duckdb
+import pandas as pd
+
+import data_store
+import kpi_aggregates
+import logistics_kpi_analyzer as analyzer
+import query_scheduler
+import streaming_export
+import vendor_scorecard
+
+# Configs
+THEATERS_PATH = data_store.THEATERS_PATH
+OUTPUT_MD = os.path.join("analysis", "theater_analysis_report.md")
+OUTPUT_XLSX = os.path.join("analysis", "theater_metrics_export.xlsx")
+ALL_THEATERS = "All theaters"
+TOP_N = 5
+
+# Mergeable partials each theater reports: additive counts and sums at the
+# grain the global KPIs need, the delay histogram (an exact, mergeable
+# percentile sketch for whole-day delays) and the small snapshot tables.
+# Table names match the store aggregates so the shared KPI SQL runs on the merge.
+PARTIAL_QUERIES = {
+    "agg_vendor_daily": """
+        SELECT vendor, base,
+            SUM(deliveries) AS deliveries, SUM(delay_samples) AS delay_samples,
+            SUM(delayed_deliveries) AS delayed_deliveries, SUM(sla_breaches) AS sla_breaches,
+            SUM(severely_delayed) AS severely_delayed, SUM(on_time_deliveries) AS on_time_deliveries,
+            SUM(total_delay_days) AS total_delay_days, MAX(worst_delay) AS worst_delay,
+            SUM(route_risk_samples) AS route_risk_samples, SUM(total_route_risk) AS total_route_risk
+        FROM agg_vendor_daily
+        GROUP BY vendor, base
+    """,
+    "agg_vendor_delay_hist": """
+        SELECT vendor, route_risk_level::VARCHAR AS route_risk_level,
+            delivery_method::VARCHAR AS delivery_method, delay_days, deliveries
+        FROM agg_vendor_delay_hist
+    """,
+    "agg_emergency_daily": """
+        SELECT base, supply_category, SUM(total_orders) AS total_orders, SUM(emergency_orders) AS emergency_orders
+        FROM agg_emergency_daily
+        GROUP BY base, supply_category
+    """,
+    "agg_budget": "SELECT * FROM agg_budget",
+    "base_inventory_supply": "SELECT * REPLACE (inventory_status::VARCHAR AS inventory_status) FROM base_inventory_supply"
+}
+
+logger = logging.getLogger(__name__)
+
+def discover_theaters(root=THEATERS_PATH):
+    """Theater name -> dataset directory for every sub-directory holding all source CSVs."""
+    if not os.path.isdir(root):
+        return {}
+    theaters = {}
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and all(os.path.exists(data_store.source_file(t, path)) for t in data_store.TABLE_SCHEMAS):
+            theaters[name] = path
+        elif os.path.isdir(path):
+            logger.warning(f"Skipping {path}: missing source CSVs")
+    return theaters
+
+def theater_partials(theater, base_path, incremental=False):
+    """Sync one theater's store and return its mergeable partial aggregates.
+
+    Runs in a worker process: only the partials, not the theater's rows,
+    travel back to the coordinating process.
+    """
+    with data_store.connect_store(data_store.theater_store_path(theater)) as con:
+        tables_loaded = kpi_aggregates.refresh_store(con, base_path, incremental=incremental)
+        partials = {name: con.execute(sql).fetchdf() for name, sql in PARTIAL_QUERIES.items()}
+        quality = analyzer.generate_data_quality_report(con)
+    if not quality:
+        # The report logs its own failure and returns {}; name the theater instead of a bare KeyError
+        raise RuntimeError(f"Theater {theater}: data quality report failed for {base_path} (see the log above)")
+    partials["quality"] = pd.DataFrame([{
+        "missing_delivery_dates": quality["missing_delivery_dates"],
+        "negative_inventory": quality["negative_inventory"],
+        "missing_budget_data": quality["missing_budget_data"],
+        "orphaned_orders": quality["orphaned_orders"],
+        "earliest_delivery": quality["date_range"]["earliest_delivery"],
+        "latest_delivery": quality["date_range"]["latest_delivery"],
+        "orders": tables_loaded.get("supply_orders", 0)
+    }])
+    return partials
+
+def collect_partials(theaters, workers=None, incremental=False):
+    """Compute every theater's partials, one worker process per theater."""
+    workers = workers or min(len(theaters), os.cpu_count() or 1)
+    partials = {}
+    if workers > 1 and len(theaters) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {name: pool.submit(theater_partials, name, path, incremental) for name, path in theaters.items()}
+            for name, future in futures.items():
+                partials[name] = future.result()
+    else:
+        for name, path in theaters.items():
+            partials[name] = theater_partials(name, path, incremental)
+    return partials
+
+def merge_partials(partials):
+    """Stack the theaters' partials into an in-memory DuckDB connection, tagged by theater."""
+    con = duckdb.connect()
+    for table in list(PARTIAL_QUERIES) + ["quality"]:
+        merged = pd.concat([frames[table].assign(theater=name) for name, frames in partials.items()], ignore_index=True)
+        con.register(f"_{table}_df", merged)
+        con.execute(f"CREATE TABLE {table} AS SELECT * FROM _{table}_df")
+        con.unregister(f"_{table}_df")
+    # Bases are assigned to the theater whose CSVs report their inventory;
+    # a base reported by two theaters would be double-counted by every join
+    overlaps = con.execute("""
+        SELECT base, STRING_AGG(DISTINCT theater, ', ' ORDER BY theater) AS theaters
+        FROM base_inventory_supply
+        GROUP BY base
+        HAVING COUNT(DISTINCT theater) > 1
+        ORDER BY base
+    """).fetchall()
+    if overlaps:
+        con.close()
+        listed = "; ".join(f"{base} ({theaters})" for base, theaters in overlaps[:TOP_N])
+        raise ValueError(f"{len(overlaps)} bases are reported by more than one theater: {listed}")
+    con.execute("CREATE TABLE base_theater AS SELECT DISTINCT base, theater FROM base_inventory_supply")
+    return con
+
+def theater_summary_sql():
+    """One KPI row per theater plus the all-theater total, from the merged partials."""
+    theater_label = f"CASE WHEN GROUPING(theater) = 1 THEN '{ALL_THEATERS}' ELSE theater END AS theater"
+    return f"""
+        WITH deliveries AS (
+            SELECT {theater_label},
+                COUNT(DISTINCT base) AS bases, COUNT(DISTINCT vendor) AS vendors,
+                SUM(deliveries)::BIGINT AS deliveries, SUM(delayed_deliveries)::BIGINT AS late_deliveries,
+                ROUND(100.0 * SUM(on_time_deliveries) / SUM(deliveries), 2) AS on_time_pct,
+                ROUND(SUM(total_delay_days) / SUM(delay_samples), 2) AS avg_delay,
+                ROUND(100.0 * SUM(sla_breaches) / SUM(deliveries), 2) AS sla_breach_pct
+            FROM agg_vendor_daily
+            GROUP BY GROUPING SETS ((theater), ())
+        ), hist AS (
+            SELECT {theater_label}, delay_days, SUM(deliveries) AS n
+            FROM agg_vendor_delay_hist
+            WHERE delay_days IS NOT NULL
+            GROUP BY GROUPING SETS ((theater, delay_days), (delay_days))
+        ), cumulative AS (
+            SELECT *,
+                SUM(n) OVER (PARTITION BY theater ORDER BY delay_days ROWS UNBOUNDED PRECEDING) AS cumulative,
+                SUM(n) OVER (PARTITION BY theater) AS samples
+            FROM hist
+        ), percentiles AS (
+            SELECT theater,
+                {kpi_aggregates.histogram_quantile_sql(0.5)} AS p50_delay,
+                {kpi_aggregates.histogram_quantile_sql(0.9)} AS p90_delay,
+                {kpi_aggregates.histogram_quantile_sql(0.95)} AS p95_delay
+            FROM cumulative
+            GROUP BY theater, samples
+        ), inventory AS (
+            SELECT {theater_label},
+                COUNT(*) FILTER (WHERE days_remaining < {kpi_aggregates.RISK_THRESHOLD_DAYS}) AS low_stock_positions,
+                COUNT(*) FILTER (WHERE days_remaining < {kpi_aggregates.CRITICAL_DAYS}) AS critical_positions
+            FROM base_inventory_supply
+            GROUP BY GROUPING SETS ((theater), ())
+        ), budget AS (
+            SELECT {theater_label},
+                COUNT(*) FILTER (WHERE budget_spent > budget_allocated * {kpi_aggregates.OVERSPEND_THRESHOLD_PCT / 100}) AS overspend_lines,
+                ROUND(100.0 * SUM(budget_spent) / SUM(budget_allocated), 2) AS percent_spent
+            FROM agg_budget
+            GROUP BY GROUPING SETS ((theater), ())
+        ), emergency AS (
+            SELECT {theater_label},
+                ROUND(100.0 * SUM(emergency_orders) / SUM(total_orders), 2) AS emergency_rate
+            FROM agg_emergency_daily
+            GROUP BY GROUPING SETS ((theater), ())
+        ), risk AS (
+            SELECT {theater_label}, ROUND(MAX(r.base_risk_index), 1) AS max_base_risk_index
+            FROM global_base_risk r JOIN base_theater USING (base)
+            GROUP BY GROUPING SETS ((theater), ())
+        )
+        SELECT *
+        FROM deliveries
+        LEFT JOIN percentiles USING (theater)
+        LEFT JOIN inventory USING (theater)
+        LEFT JOIN budget USING (theater)
+        LEFT JOIN emergency USING (theater)
+        LEFT JOIN risk USING (theater)
+        ORDER BY theater = '{ALL_THEATERS}', theater
+    """
+
+def global_metrics(con):
+    """Global KPIs from the merged partials, using the same SQL as the single-store analyzer."""
+    no_filter = dict(delivery_where="", inventory_where="", budget_where="", order_where="")
+    con.execute(f"CREATE TABLE global_base_risk AS {kpi_aggregates.BASE_RISK_SQL.format(**no_filter)}")
+    con.execute(f"CREATE TABLE {vendor_scorecard.DISTRIBUTION_TABLE} AS {vendor_scorecard.distribution_sql()}")
+    weights = vendor_scorecard.SCORE_WEIGHTS
+    queries = {
+        "theater_summary": (theater_summary_sql(), "df"),
+        "vendor_scorecard": (f"""
+            SELECT vendor, deliveries, mean_delay, p50_delay, p90_delay, p95_delay, on_time_pct, sla_breach_pct, severe_pct,
+                ROUND({weights['on_time']} * on_time_pct + {weights['within_sla']} * (100 - sla_breach_pct)
+                      + {weights['not_severe']} * (100 - severe_pct), 1) AS score
+            FROM {vendor_scorecard.DISTRIBUTION_TABLE}
+            WHERE route_risk_level = 'All' AND delivery_method = 'All'
+            ORDER BY score, vendor
+        """, "df"),
+        "vendor_performance": (f"""
+            {kpi_aggregates.VENDOR_ROLLUP_SQL.format(where="")}
+            ORDER BY on_time_percentage ASC, avg_delay DESC, vendor
+        """, "df"),
+        "base_risk": ("""
+            SELECT theater, base, ROUND(route_risk, 2) AS route_risk, ROUND(low_supply_ratio, 2) AS low_supply_ratio,
+                ROUND(overspend_ratio, 2) AS overspend_ratio, ROUND(emergency_ratio, 2) AS emergency_ratio,
+                ROUND(base_risk_index, 1) AS base_risk_index
+            FROM global_base_risk LEFT JOIN base_theater USING (base)
+            ORDER BY base_risk_index DESC, base
+        """, "df"),
+        "budget_analysis": (f"""
+            SELECT theater, base, supply_category, budget_allocated, budget_spent, budget_variance, percent_spent
+            FROM agg_budget
+            WHERE budget_spent > budget_allocated * {kpi_aggregates.OVERSPEND_THRESHOLD_PCT / 100}
+            ORDER BY percent_spent DESC, base, supply_category
+        """, "df"),
+        "emergency_analysis": (f"""
+            SELECT e.*, t.theater
+            FROM ({kpi_aggregates.EMERGENCY_ROLLUP_SQL.format(where="")} HAVING emergency_rate > 20) e
+            LEFT JOIN base_theater t USING (base)
+            ORDER BY emergency_rate DESC, base, supply_category
+        """, "df"),
+        "quality": ("""
+            SELECT theater, missing_delivery_dates, negative_inventory, missing_budget_data, orphaned_orders,
+                earliest_delivery, latest_delivery, orders
+            FROM quality ORDER BY theater
+        """, "df")
+    }
+    metrics, _ = query_scheduler.run_queries(con, queries)
+    return metrics
+
+def _markdown_table(df):
+    """Render a small DataFrame as a markdown table."""
+    header = "| " + " | ".join(df.columns) + " |"
+    rule = "|" + "|".join("---" for _ in df.columns) + "|"
+    rows = ["| " + " | ".join("" if pd.isna(v) else str(v) for v in row) + " |" for row in df.itertuples(index=False)]
+    return "\n".join([header, rule] + rows)
+
+def generate_theater_report(metrics, theaters):
+    """Write the global multi-theater markdown report."""
+    summary = metrics["theater_summary"]
+    total = summary[summary["theater"] == ALL_THEATERS].iloc[0]
+    quality = metrics["quality"]
+    scorecard = metrics["vendor_scorecard"]
+    base_risk = metrics["base_risk"]
+    budget = metrics["budget_analysis"]
+    emergency = metrics["emergency_analysis"]
+
+    worst_vendors = "\n".join(
+        f"- **{row.vendor}:** score {row.score}, {row.on_time_pct}% on time, p90 delay {row.p90_delay} days"
+        for row in scorecard.head(TOP_N).itertuples()) or "- No vendor deliveries"
+    risky_bases = "\n".join(
+        f"- **{row.base}** ({row.theater}): risk index {row.base_risk_index}"
+        for row in base_risk.head(TOP_N).itertuples()) or "- No bases"
+    if not budget.empty:
+        worst_budget = budget.iloc[0]
+        budget_text = (f"{len(budget)} lines above {kpi_aggregates.OVERSPEND_THRESHOLD_PCT}% of budget; highest: "
+                       f"{worst_budget['base']} – {worst_budget['supply_category']} ({worst_budget['percent_spent']}%)")
+    else:
+        budget_text = "No significant overspends detected"
+    data_issues = int(quality[["missing_delivery_dates", "negative_inventory", "missing_budget_data"]].to_numpy().sum())
+
+    md_text = f"""# Multi-Theater Performance Report: Supply Logistics
+**Generated:** {analyzer.OUTPUT_DATE}
+**Theaters:** {", ".join(theaters)}
+**Analysis Period:** {pd.Timestamp(quality['earliest_delivery'].min()):%Y-%m-%d} to {pd.Timestamp(quality['latest_delivery'].max()):%Y-%m-%d}
+**Coverage:** {total['bases']} bases, {total['vendors']} vendors, {total['deliveries']} deliveries
+
+## Theater Summary
+
+{_markdown_table(summary)}
+
+## Global Findings
+
+### 1. Delivery Performance
+- **{total['late_deliveries']}** late deliveries across all theaters ({total['on_time_pct']}% on time, {total['sla_breach_pct']}% over the {kpi_aggregates.SLA_DELAY_DAYS}-day SLA)
+- **Delay percentiles:** p50 {total['p50_delay']}, p90 {total['p90_delay']}, p95 {total['p95_delay']} days
+
+**Lowest-scoring vendors (all theaters):**
+{worst_vendors}
+
+### 2. Inventory and Base Risk
+- **{total['low_stock_positions']}** base-category positions below {kpi_aggregates.RISK_THRESHOLD_DAYS} days of cover ({total['critical_positions']} critical)
+
+**Highest-risk bases:**
+{risky_bases}
+
+### 3. Budget and Emergency Procurement
+- **Budget:** {budget_text}
+- **Emergency procurement:** {total['emergency_rate']}% of orders; {len(emergency)} base-category combinations above 20%
+
+## Data Quality Assessment
+- **Records requiring attention:** {data_issues} (missing delivery dates, invalid inventory, missing budget data)
+- **Orphaned orders:** {int(quality['orphaned_orders'].sum())}
+- **Data Integrity Status:** {'GOOD' if data_issues == 0 else 'REQUIRES ATTENTION'}
+
+---
+*Each theater was analyzed in its own process against its own store; this report merges their partial aggregates.*
+"""
+    with open(OUTPUT_MD, "w", encoding="utf-8") as f:
+        f.write(md_text)
+    logger.info(f"Theater report written to {OUTPUT_MD}")
+
+def export_theater_results(metrics):
+    """Write the merged global tables to the theater workbook."""
+    workbook = streaming_export.new_workbook()
+    sheets = {
+        "theater_summary": "Theater Summary",
+        "vendor_scorecard": "Vendor Scorecard",
+        "vendor_performance": "Vendor Performance",
+        "base_risk": "Base Risk Index",
+        "budget_analysis": "Budget Overspend",
+        "emergency_analysis": "Emergency Orders",
+        "quality": "Data Quality"
+    }
+    for name, sheet_name in sheets.items():
+        streaming_export.write_frame_sheet(workbook, metrics[name], sheet_name)
+    workbook.save(OUTPUT_XLSX)
+    logger.info(f"Theater metrics exported to {OUTPUT_XLSX}")
+
+def run(theaters, workers=None, incremental=False):
+    """Analyze every theater in parallel, merge the partials and write the global outputs."""
+    if not theaters:
+        raise FileNotFoundError(f"No theater datasets found under {THEATERS_PATH}")
+    partials = collect_partials(theaters, workers, incremental)
+    with merge_partials(partials) as con:
+        metrics = global_metrics(con)
+    export_theater_results(metrics)
+    generate_theater_report(metrics, theaters)
+    return metrics
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Analyze several theaters in parallel and merge them into a global report")
+    parser.add_argument("--root", default=THEATERS_PATH, help="directory with one dataset sub-directory per theater")
+    parser.add_argument("--theater", action="append", default=[], metavar="NAME=PATH",
+                        help="explicit theater dataset directory (repeatable; replaces discovery)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per theater, up to the CPU count)")
+    parser.add_argument("--incremental", action="store_true", help="upsert only new or changed orders per theater")
+    args = parser.parse_args()
+    if args.theater:
+        theaters = dict(spec.split("=", 1) for spec in args.theater)
+    else:
+        theaters = discover_theaters(args.root)
+    metrics = run(theaters, args.workers, args.incremental)
+    print(metrics["theater_summary"].to_string(index=False))
@@ -0,0 +1,196 @@
+import logging
+import argparse
+
+import data_store
+import kpi_aggregates
+
+# Configs
+RECENT_DAYS = 7  # control-chart subgroup: deliveries in the trailing week
+BASELINE_DAYS = 60  # reference window ending where the recent window starts
+CONTROL_Z = 3.0  # flag when the recent mean delay sits this many standard errors above baseline
+MIN_BASELINE_SAMPLES = 20
+MIN_RECENT_SAMPLES = 3
+MIN_DELAY_STD = 0.5  # floor on the baseline spread so perfectly steady vendors are not flagged on one late truck
+# Score weights: on-time rate, deliveries within the SLA, deliveries without a severe delay
+SCORE_WEIGHTS = {"on_time": 0.5, "within_sla": 0.3, "not_severe": 0.2}
+
+DISTRIBUTION_TABLE = "vendor_delay_distribution"
+CONTROL_TABLE = "vendor_delay_control"
+SCORECARD_TABLE = "vendor_scorecard"
+
+logger = logging.getLogger(__name__)
+
+def _label_sql(column):
+    """Group label of a GROUPING SETS row: 'All' where the column was rolled up."""
+    return f"CASE WHEN GROUPING({column}) = 1 THEN 'All' ELSE COALESCE({column}::VARCHAR, 'Unknown') END AS {column}"
+
+def distribution_sql():
+    """Delay distribution per vendor, vendor x route risk, vendor x delivery method and all three.
+
+    Built from agg_vendor_delay_hist (delivery counts per vendor, route
+    risk, method and delay day), which incremental refreshes patch in
+    place, so supply_deliveries is never rescanned here. Every level comes
+    from one GROUPING SETS pass over the histogram; rolled-up columns are
+    labelled 'All'. Delays are whole days, so percentiles read off the
+    cumulative counts match quantile_cont over the raw rows.
+    """
+    return f"""
+        WITH hist AS (
+            SELECT vendor, {_label_sql("route_risk_level")}, {_label_sql("delivery_method")},
+                delay_days, SUM(deliveries) AS n
+            FROM agg_vendor_delay_hist
+            GROUP BY GROUPING SETS (
+                (vendor, delay_days), (vendor, route_risk_level, delay_days),
+                (vendor, delivery_method, delay_days), (vendor, route_risk_level, delivery_method, delay_days)
+            )
+        ), cumulative AS (
+            SELECT *,
+                SUM(n) OVER (PARTITION BY vendor, route_risk_level, delivery_method
+                             ORDER BY delay_days NULLS LAST ROWS UNBOUNDED PRECEDING) AS cumulative,
+                SUM(n) FILTER (WHERE delay_days IS NOT NULL)
+                    OVER (PARTITION BY vendor, route_risk_level, delivery_method) AS samples
+            FROM hist
+        )
+        SELECT
+            vendor, route_risk_level, delivery_method,
+            SUM(n)::BIGINT AS deliveries,
+            COALESCE(samples, 0)::BIGINT AS delay_samples,
+            ROUND(SUM(n * delay_days) / samples, 2) AS mean_delay,
+            ROUND(SQRT(GREATEST(SUM(n * delay_days * delay_days) - SUM(n * delay_days) ^ 2 / samples, 0)
+                       / NULLIF(samples - 1, 0)), 2) AS std_delay,
+            {kpi_aggregates.histogram_quantile_sql(0.5)} AS p50_delay,
+            {kpi_aggregates.histogram_quantile_sql(0.9)} AS p90_delay,
+            {kpi_aggregates.histogram_quantile_sql(0.95)} AS p95_delay,
+            MAX(delay_days) AS max_delay,
+            ROUND(100.0 * COALESCE(SUM(n) FILTER (WHERE delay_days <= 0), 0) / SUM(n), 2) AS on_time_pct,
+            ROUND(100.0 * COALESCE(SUM(n) FILTER (WHERE delay_days > {kpi_aggregates.SLA_DELAY_DAYS}), 0) / SUM(n), 2) AS sla_breach_pct,
+            ROUND(100.0 * COALESCE(SUM(n) FILTER (WHERE delay_days > {kpi_aggregates.SEVERE_DELAY_DAYS}), 0) / SUM(n), 2) AS severe_pct
+        FROM cumulative
+        GROUP BY vendor, route_risk_level, delivery_method, samples
+    """
+
+def control_sql():
+    """X-bar control chart of delivery delay per vendor, by due date.
+
+    For every vendor and due date with deliveries, the mean delay of the
+    trailing RECENT_DAYS is compared with the BASELINE_DAYS before them.
+    Deliveries are placed on their expected date: grouping by arrival date
+    would skew the edges of the history (early arrivals first, late ones
+    last). Means and spreads come from per-day counts, sums and sums of
+    squares in agg_vendor_due_daily, so the chart follows incremental
+    refreshes without reading raw deliveries.
+    """
+    recent = f"RANGE BETWEEN INTERVAL {RECENT_DAYS - 1} DAYS PRECEDING AND CURRENT ROW"
+    baseline = (f"RANGE BETWEEN INTERVAL {RECENT_DAYS + BASELINE_DAYS - 1} DAYS PRECEDING "
+                f"AND INTERVAL {RECENT_DAYS} DAYS PRECEDING")
+    return f"""
+        WITH daily AS (
+            SELECT vendor, expected_delivery_date AS due_date,
+                delay_samples AS n, total_delay_days AS total, total_sq_delay_days AS total_sq
+            FROM agg_vendor_due_daily
+            WHERE expected_delivery_date IS NOT NULL
+        ), windowed AS (
+            SELECT vendor, due_date,
+                SUM(n) OVER recent AS recent_n, SUM(total) OVER recent AS recent_total,
+                SUM(n) OVER baseline AS baseline_n, SUM(total) OVER baseline AS baseline_total,
+                SUM(total_sq) OVER baseline AS baseline_total_sq
+            FROM daily
+            WINDOW recent AS (PARTITION BY vendor ORDER BY due_date {recent}),
+                   baseline AS (PARTITION BY vendor ORDER BY due_date {baseline})
+        ), stats AS (
+            SELECT vendor, due_date, recent_n::BIGINT AS recent_n, baseline_n::BIGINT AS baseline_n,
+                recent_total / recent_n AS recent_mean,
+                baseline_total / baseline_n AS baseline_mean,
+                GREATEST(SQRT(GREATEST(baseline_total_sq - baseline_total * baseline_total / baseline_n, 0)
+                              / NULLIF(baseline_n - 1, 0)), {MIN_DELAY_STD}) AS baseline_std
+            FROM windowed
+            WHERE recent_n > 0
+        )
+        SELECT vendor, due_date, recent_n, baseline_n,
+            ROUND(recent_mean, 2) AS recent_mean_delay,
+            ROUND(baseline_mean, 2) AS baseline_mean_delay,
+            ROUND(baseline_std, 2) AS baseline_std_delay,
+            ROUND(baseline_mean + {CONTROL_Z} * baseline_std / SQRT(recent_n), 2) AS upper_control_limit,
+            ROUND((recent_mean - baseline_mean) / (baseline_std / SQRT(recent_n)), 2) AS z_score,
+            COALESCE(baseline_n >= {MIN_BASELINE_SAMPLES} AND recent_n >= {MIN_RECENT_SAMPLES}
+                     AND recent_mean > baseline_mean + {CONTROL_Z} * baseline_std / SQRT(recent_n), FALSE) AS out_of_control
+        FROM stats
+    """
+
+def scorecard_sql():
+    """One row per vendor: overall distribution, weighted score and current control-chart status.
+
+    A vendor is 'Degrading' when its latest control point is out of control
+    and falls within RECENT_DAYS of the latest due date in the store.
+    """
+    weights = SCORE_WEIGHTS
+    return f"""
+        WITH latest AS (
+            SELECT vendor, arg_max(c, due_date) AS point
+            FROM {CONTROL_TABLE} c
+            GROUP BY vendor
+        ), recent_alerts AS (
+            SELECT vendor, COUNT(*) AS out_of_control_days
+            FROM {CONTROL_TABLE}
+            WHERE out_of_control
+              AND due_date > (SELECT MAX(due_date) FROM {CONTROL_TABLE}) - INTERVAL {BASELINE_DAYS} DAY
+            GROUP BY vendor
+        )
+        SELECT
+            d.vendor, d.deliveries, d.mean_delay, d.std_delay, d.p50_delay, d.p90_delay, d.p95_delay,
+            d.max_delay, d.on_time_pct, d.sla_breach_pct, d.severe_pct,
+            ROUND({weights['on_time']} * d.on_time_pct + {weights['within_sla']} * (100 - d.sla_breach_pct)
+                  + {weights['not_severe']} * (100 - d.severe_pct), 1) AS score,
+            l.point.due_date AS last_control_date,
+            l.point.recent_mean_delay AS recent_mean_delay,
+            l.point.baseline_mean_delay AS baseline_mean_delay,
+            l.point.z_score AS z_score,
+            COALESCE(a.out_of_control_days, 0) AS out_of_control_days,
+            CASE
+                WHEN l.point.out_of_control
+                     AND l.point.due_date > (SELECT MAX(due_date) FROM {CONTROL_TABLE}) - INTERVAL {RECENT_DAYS} DAY
+                    THEN 'Degrading'
+                WHEN l.point.baseline_n IS NULL OR l.point.baseline_n < {MIN_BASELINE_SAMPLES} THEN 'Insufficient History'
+                ELSE 'In Control'
+            END AS delay_status
+        FROM {DISTRIBUTION_TABLE} d
+        LEFT JOIN latest l USING (vendor)
+        LEFT JOIN recent_alerts a USING (vendor)
+        WHERE d.route_risk_level = 'All' AND d.delivery_method = 'All'
+    """
+
+def scorecard_current(con):
+    """Whether the scorecard tables were built from the store's current data."""
+    if not data_store.table_exists(con, "_scorecard_version"):
+        return False
+    built = con.execute("SELECT data_version, aggregate_version FROM _scorecard_version").fetchone()
+    return built == (data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION)
+
+def refresh_scorecard(con, force=False):
+    """Rebuild the delay distributions, control chart and vendor scorecard when the store changed.
+
+    Returns the number of vendors scored, or None when the tables were already current.
+    """
+    if not force and scorecard_current(con):
+        return None
+    con.execute(f"CREATE OR REPLACE TABLE {DISTRIBUTION_TABLE} AS {distribution_sql()} "
+                f"ORDER BY vendor, route_risk_level, delivery_method")
+    con.execute(f"CREATE OR REPLACE TABLE {CONTROL_TABLE} AS {control_sql()} ORDER BY vendor, due_date")
+    con.execute(f"CREATE OR REPLACE TABLE {SCORECARD_TABLE} AS {scorecard_sql()} ORDER BY score, vendor")
+    con.execute("CREATE OR REPLACE TABLE _scorecard_version AS SELECT ? AS data_version, ? AS aggregate_version",
+                [data_store.data_version(con), kpi_aggregates.AGGREGATE_VERSION])
+    vendors, degrading = con.execute(f"""
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE delay_status = 'Degrading') FROM {SCORECARD_TABLE}
+    """).fetchone()
+    logger.info(f"Vendor scorecard refreshed: {vendors} vendors, {degrading} with degrading delays")
+    return vendors
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Score vendors and flag delivery delay anomalies")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the store has not changed")
+    args = parser.parse_args()
+    with data_store.connect_store() as con:
+        kpi_aggregates.refresh_store(con)
+        refresh_scorecard(con, force=args.force)
+        print(con.execute(f"SELECT * FROM {SCORECARD_TABLE}").fetchdf().to_string(index=False))
@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(REPO_DIR, "data", "script"))
+sys.path.append(os.path.join(REPO_DIR, "analysis", "analysis_script"))
+import generate_datasets
+import instrumentation
+
+# Configs
+# Scale name -> (orders, bases, vendors)
+SCALES = {
+    "1k": (1000, 8, 10),
+    "100k": (100000, 40, 60),
+    "1m": (1000000, 100, 200),
+    "10m": (10000000, 250, 500)
+}
+DEFAULT_OUTPUT = "benchmark_results.json"
+WALL_TOLERANCE = 0.20  # fractional slowdown tolerated before flagging
+MEMORY_TOLERANCE = 0.20
+MIN_WALL_DELTA_S = 0.05  # ignore sub-noise absolute changes
+MIN_MEMORY_DELTA_MB = 16
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def prepare_dataset(scale, work_dir, workers):
+    """Generate the scale's CSVs once under work_dir and reuse them on later runs."""
+    orders, bases, vendors = SCALES[scale]
+    scale_dir = os.path.join(work_dir, scale)
+    dataset_dir = os.path.join(scale_dir, "data", "dataset")
+    if os.path.exists(os.path.join(dataset_dir, "supply_budget.csv")):
+        logger.info(f"Reusing {scale} dataset in {dataset_dir}")
+        return scale_dir, None
+    logger.info(f"Generating {scale} dataset ({orders:,} orders)")
+    tracer = instrumentation.Tracer()
+    with tracer.span("generate_datasets") as span:
+        generate_datasets.generate(num_orders=orders, num_bases=bases, num_vendors=vendors,
+                                   output_dir=dataset_dir, workers=workers)
+        span.set(rows_out=orders)
+    return scale_dir, span.to_dict()
+
+def run_scale(scale_dir, trace_python=False):
+    """Run every pipeline stage against one scale's dataset, in a fresh process.
+
+    The analyzer and dashboard resolve their inputs and outputs relative to
+    the working directory, so running from scale_dir points them at the
+    generated data and a throwaway store without touching the repository.
+    """
+    os.chdir(scale_dir)
+    shutil.rmtree(os.path.join("data", "warehouse"), ignore_errors=True)
+    os.makedirs("analysis", exist_ok=True)
+    sys.path.append(os.path.join(REPO_DIR, "dashboard"))
+    import importlib
+    import plotly.utils
+    import dash  # noqa: F401  imported up front so the dashboard stage excludes it
+    import data_store
+    import logistics_kpi_analyzer as analyzer
+
+    tracer = instrumentation.Tracer(trace_python=trace_python)
+
+    con = data_store.connect_store(analyzer.STORE_PATH)
+    with tracer.span("load_data_sources") as span:
+        span.set(rows_in=sum(analyzer.load_data_sources(con).values()))
+    with tracer.span("generate_data_quality_report"):
+        quality_report = analyzer.generate_data_quality_report(con, tracer=tracer)
+    with tracer.span("analyze_performance_metrics") as span:
+        metrics = analyzer.analyze_performance_metrics(con, tracer=tracer)
+        span.set(rows_out=sum(len(df) for df in metrics.values()))
+    with tracer.span("export_analysis_results") as span:
+        span.set(rows_out=analyzer.export_analysis_results(metrics, quality_report, con=con))
+    span.set(output_bytes=os.path.getsize(analyzer.OUTPUT_XLSX))
+    with tracer.span("generate_enhanced_report"):
+        analyzer.generate_enhanced_report(metrics, quality_report)
+    con.close()
+
+    # Dashboard startup (store sync and publish + first page layout), then each tab's figures
+    with tracer.span("dashboard_startup"):
+        dashboard = importlib.import_module("command_operational_dashboard")
+        dashboard.refresh_dashboard_store()
+        dashboard.serve_layout()
+    no_filters = {"bases": None, "vendors": None, "categories": None, "start_date": None, "end_date": None}
+    with data_store.read_store(analyzer.STORE_PATH) as read_con:
+        for section, (_, build) in dashboard.SECTIONS.items():
+            with tracer.span(f"dashboard_{section}") as span:
+                children = build(read_con.cursor(), no_filters)
+            span.set(payload_bytes=len(json.dumps(children, cls=plotly.utils.PlotlyJSONEncoder)))
+
+    stages = {}
+    for span in tracer.spans:
+        stages[span.name] = span.to_dict()
+        logger.info(f"{span.name}: {stages[span.name]}")
+    return stages
+
+def git_revision():
+    """Short commit hash of the benchmarked tree, if available."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(scales, work_dir, workers=1, trace_python=False):
+    """Benchmark each scale in its own process so peak RSS is not carried over."""
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "trace_python_memory": trace_python
+        },
+        "scales": {}
+    }
+    for scale in scales:
+        orders, bases, vendors = SCALES[scale]
+        scale_dir, generation = prepare_dataset(scale, work_dir, workers)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            stages = pool.submit(run_scale, scale_dir, trace_python).result()
+        results["scales"][scale] = {
+            "orders": orders, "bases": bases, "vendors": vendors,
+            "generate_datasets": generation,
+            "stages": stages,
+            "total_wall_s": round(sum(stage["wall_s"] for stage in stages.values()), 4)
+        }
+    return results
+
+def compare_results(current, baseline, wall_tolerance=WALL_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """List stages whose wall time or peak RSS regressed beyond tolerance vs the baseline."""
+    regressions = []
+    for scale, scale_result in current["scales"].items():
+        baseline_stages = baseline.get("scales", {}).get(scale, {}).get("stages", {})
+        for stage, result in scale_result["stages"].items():
+            previous = baseline_stages.get(stage)
+            if not previous:
+                continue
+            checks = [
+                ("wall_s", wall_tolerance, MIN_WALL_DELTA_S),
+                ("peak_rss_mb", memory_tolerance, MIN_MEMORY_DELTA_MB)
+            ]
+            for metric, tolerance, min_delta in checks:
+                old, new = previous.get(metric), result.get(metric)
+                if old is None or new is None:
+                    continue
+                if new > old * (1 + tolerance) and new - old > min_delta:
+                    regressions.append({
+                        "scale": scale, "stage": stage, "metric": metric,
+                        "baseline": old, "current": new,
+                        "change_pct": round((new - old) / old * 100, 1) if old else None
+                    })
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the logistics KPI pipeline at several data scales")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES),
+                        help="dataset scales to benchmark")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON results file")
+    parser.add_argument("--work-dir", help="where datasets and stores are kept (reused across runs); default is a temporary directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes used to generate datasets")
+    parser.add_argument("--trace-python-memory", action="store_true",
+                        help="also record the Python heap peak per stage via tracemalloc (slows stages down)")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="flag regressions against a stored results file")
+    parser.add_argument("--results", metavar="RESULTS_JSON", help="compare an existing results file instead of running")
+    parser.add_argument("--wall-tolerance", type=float, default=WALL_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        work_dir = args.work_dir or tempfile.mkdtemp(prefix="logistics_bench_")
+        try:
+            results = run_benchmarks(args.scales, work_dir, args.workers, args.trace_python_memory)
+        finally:
+            if not args.work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Benchmark results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.wall_tolerance, args.memory_tolerance)
+        for r in regressions:
+            change = f" ({r['change_pct']:+}%)" if r["change_pct"] is not None else ""
+            logger.warning(f"REGRESSION {r['scale']}/{r['stage']} {r['metric']}: "
+                           f"{r['baseline']} -> {r['current']}{change}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
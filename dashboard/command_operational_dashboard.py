@@ -1,186 +1,328 @@
 import dash
-from dash import dcc, html
+from dash import dcc, html, Input, Output
+import flask
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
 import os
-import numpy as np
+import sys
 
-# Load datasets
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis", "analysis_script"))
+from data_store import connect_store, publish_store, read_store, data_version, theater_paths
+from kpi_aggregates import refresh_store, SLA_DELAY_DAYS, RISK_THRESHOLD_DAYS
+from kpi_trends import refresh_trends
+import dashboard_queries as queries
+from figure_cache import FigureCache
+
+# The dashboard never holds the store: every page load and callback opens a
+# short-lived read-only connection to the copy the last writer published
+# (the analyzer, the KPI service or refresh_dashboard_store below), so any
+# number of workers can run next to them. Filtering and aggregation run in
+# DuckDB; only the already-aggregated result of the open tab is sent to the
+# browser. Set DASHBOARD_THEATER to serve one theater's dataset and store instead.
 DATA_PATH = "data/dataset"
-deliveries = pd.read_csv(os.path.join(DATA_PATH, "supply_deliveries.csv"))
-inventory = pd.read_csv(os.path.join(DATA_PATH, "base_inventory_supply.csv"))
-budget = pd.read_csv(os.path.join(DATA_PATH, "supply_budget.csv"))
-orders = pd.read_csv(os.path.join(DATA_PATH, "supply_orders.csv"))
-
-# Helper mappings
-risk_map = {"Low": 1, "Medium": 2, "High": 3}
-
-# Vendor delivery metrics
-deliveries["on_time"] = deliveries["delay_days"] <= 0
-deliveries["delayed_7"] = deliveries["delay_days"] > 2
-vendor_summary = deliveries.groupby("vendor").agg(
-    total_deliveries=("order_id", "count"),
-    on_time_pct=("on_time", lambda x: round(100 * x.mean(), 2)),
-    avg_delay=("delay_days", "mean"),
-    delayed_over_7_pct=("delayed_7", lambda x: round(100 * x.mean(), 2))
-).reset_index()
-
-vendor_summary = vendor_summary.sort_values("on_time_pct", ascending=False)
-fig_vendor = px.bar(vendor_summary, x="vendor", y="on_time_pct", text="on_time_pct",
-    title="On-Time Delivery Rate by Vendor", labels={"vendor": "Vendor", "on_time_pct": "% On-Time"})
-fig_vendor.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-fig_vendor.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Avg delay
-avg_delay_fig = px.bar(vendor_summary.sort_values("avg_delay", ascending=False),
-    x="vendor", y="avg_delay", text="avg_delay",
-    title="Average Delivery Delay (Days) by Vendor",
-    labels={"vendor": "Vendor", "avg_delay": "Average Delay (Days)"})
-avg_delay_fig.update_traces(texttemplate='%{text:.1f}', textposition='outside')
-avg_delay_fig.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Severe delays
-fig_severe = px.bar(vendor_summary.sort_values("delayed_over_7_pct", ascending=False),
-    x="vendor", y="delayed_over_7_pct", text="delayed_over_7_pct",
-    title="% of Deliveries Delayed Over 2 Days",
-    labels={"vendor": "Vendor", "delayed_over_7_pct": "% Delayed > 2 Days"})
-fig_severe.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-fig_severe.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Inventory coverage
-low_inventory = inventory[inventory["days_remaining"] < 35]
-fig_inventory = px.scatter(low_inventory, x="base", y="days_remaining", color="supply_category",
-    size="inventory_units", title="Inventory Risk (Coverage < 35 Days)",
-    labels={"base": "Base", "days_remaining": "Days Remaining", "supply_category": "Supply Category"})
-fig_inventory.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Budget utilization
-budget["utilization"] = (budget["budget_spent"] / budget["budget_allocated"]) * 100
-fig_budget = px.density_heatmap(budget, x="base", y="supply_category", z="utilization",
-    title="Budget Utilization (%)", color_continuous_scale=px.colors.sequential.Blues,
-    labels={"base": "Base", "supply_category": "Supply Category", "utilization": "Utilization (%)"})
-fig_budget.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Route risk score
-deliveries["risk_score"] = deliveries["route_risk_level"].map(risk_map)
-route_risk = deliveries.groupby("base")["risk_score"].mean().reset_index()
-fig_route_risk = px.bar(route_risk.sort_values("risk_score", ascending=False),
-    x="base", y="risk_score", text="risk_score",
-    title="Average Route Risk Score by Base", labels={"base": "Base", "risk_score": "Route Risk Score"})
-fig_route_risk.update_traces(texttemplate='%{text:.2f}', textposition='outside')
-fig_route_risk.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Procurement lead time
-orders = orders.merge(deliveries[["order_id", "actual_delivery_date"]], on="order_id", how="left")
-orders["order_date"] = pd.to_datetime(orders["order_date"])
-orders["actual_delivery_date"] = pd.to_datetime(orders["actual_delivery_date"])
-orders["lead_time"] = (orders["actual_delivery_date"] - orders["order_date"]).dt.days
-fig_lead_time = px.box(orders, x="supply_category", y="lead_time", title="Procurement Lead Time by Supply Category",
-    labels={"supply_category": "Supply Category", "lead_time": "Lead Time (Days)"})
-fig_lead_time.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Emergency procurement
-emergency_freq = orders[orders["priority"] == "Emergency"].groupby("base").size() / orders.groupby("base").size()
-emergency_df = emergency_freq.reset_index().rename(columns={0: "emergency_rate"})
-fig_emergency = px.bar(emergency_df.sort_values("emergency_rate", ascending=False), x="base", y="emergency_rate", text="emergency_rate",
-    title="Emergency Order Rate by Base", labels={"base": "Base", "emergency_rate": "% Emergency Orders"})
-fig_emergency.update_traces(texttemplate='%{text:.2%}', textposition='outside')
-fig_emergency.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Aging inventory
-inventory["last_updated"] = pd.to_datetime(inventory["last_updated"])
-inventory["days_since_update"] = (pd.to_datetime("today") - inventory["last_updated"]).dt.days
-fig_aging = px.box(inventory, x="supply_category", y="days_since_update",
-    title="Aging Inventory Risk by Supply Category",
-    labels={"supply_category": "Supply Category", "days_since_update": "Days Since Last Update"})
-fig_aging.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Base risk index ---
-budget["overspend_flag"] = (budget["budget_spent"] > budget["budget_allocated"] * 1.15).astype(int)
-inventory["low_supply_flag"] = (inventory["days_remaining"] < 30).astype(int)
-emergency_counts = orders[orders["priority"] == "Emergency"].groupby("base").size()
-total_counts = orders.groupby("base").size()
-emergency_ratio = (emergency_counts / total_counts).fillna(0)
-base_risk = deliveries.groupby("base")["risk_score"].mean().to_frame("route_risk")
-base_risk = base_risk.join(
-    inventory.groupby("base")["low_supply_flag"].mean().to_frame("low_supply_ratio")
-).join(
-    budget.groupby("base")["overspend_flag"].mean().to_frame("overspend_ratio")
-).join(
-    emergency_ratio.to_frame("emergency_ratio")
-)
-base_risk["base_risk_index"] = base_risk.mean(axis=1) * 100
-fig_base_risk = px.bar(base_risk.reset_index().sort_values("base_risk_index", ascending=False), x="base", y="base_risk_index", text="base_risk_index",
-    title="Composite Base Risk Index", labels={"base": "Base", "base_risk_index": "Risk Index"})
-fig_base_risk.update_traces(texttemplate='%{text:.1f}', textposition='outside')
-fig_base_risk.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
-
-# Low inventory table
-low_inv_table = low_inventory.sort_values(["days_remaining", "inventory_units"]).reset_index(drop=True)
-low_inv_table["label"] = low_inv_table["base"] + " – " + low_inv_table["supply_category"]
-fig_low_inv_table = px.bar(low_inv_table, x="label", y="days_remaining",
-    title="Critical Base-Category Inventory (<35 Days)",
-    labels={"label": "Base – Supply Category", "days_remaining": "Days Remaining"})
-fig_low_inv_table.update_traces(texttemplate='%{y}', textposition='outside')
-fig_low_inv_table.update_layout(margin=dict(t=60, b=100), uniformtext_minsize=9)
-
-vendor_count = deliveries.groupby(["base", "vendor"]).size().reset_index(name="orders")
-fig_vendor_heatmap = px.density_heatmap(
-    vendor_count,
-    x="base",
-    y="vendor",
-    z="orders",
-    color_continuous_scale=px.colors.sequential.Blues,
-    title="Vendor Reliance Heatmap",
-    labels={"base": "Base", "vendor": "Vendor", "orders": "Order Volume"}
-)
-fig_vendor_heatmap.update_layout(margin=dict(t=60, b=40))
+STORE_PATH = "data/warehouse/logistics.duckdb"
+if os.environ.get("DASHBOARD_THEATER"):
+    DATA_PATH, STORE_PATH = theater_paths(os.environ["DASHBOARD_THEATER"])
+
+# Rendered sections are cached per filter selection, data version and day.
+# Point DASHBOARD_CACHE_DIR at a shared directory to share renders across
+# gunicorn workers.
+cache = FigureCache(disk_dir=os.environ.get("DASHBOARD_CACHE_DIR"))
+
+def refresh_dashboard_store(data_path=DATA_PATH, store_path=STORE_PATH):
+    """Sync the store with its CSVs, rebuild the aggregates and publish them for the dashboard."""
+    with connect_store(store_path) as con:
+        refresh_store(con, data_path)
+        refresh_trends(con)
+        publish_store(con, store_path)
+
+GRAPH_HALF = {"width": "48%", "display": "inline-block", "padding": "10px"}
+GRAPH_FULL = {"padding": "10px"}
+TREND_WINDOW_DAYS = 30
+
+def box_figure(stats, load_rows, x, y, title, labels):
+    """Box plot from raw rows when small, otherwise from server-side quantiles.
+
+    Above RAW_ROWS_LIMIT observations only the per-group quartiles and
+    whiskers are sent, so the payload no longer grows with the row count.
+    """
+    if stats["n"].sum() <= queries.RAW_ROWS_LIMIT:
+        return px.box(load_rows(), x=x, y=y, title=title, labels=labels)
+    fig = go.Figure(go.Box(
+        x=stats[x], q1=stats["q1"], median=stats["median"], q3=stats["q3"],
+        lowerfence=stats["lowerfence"], upperfence=stats["upperfence"], mean=stats["mean"],
+        name="", boxpoints=False
+    ))
+    fig.update_layout(title=f"{title} ({int(stats['n'].sum()):,} observations)",
+        xaxis_title=labels[x], yaxis_title=labels[y], showlegend=False)
+    return fig
+
+def vendor_figures(cur, filters):
+    """Vendor performance section: on-time rate, delays and vendor reliance."""
+    vendor_summary = queries.vendor_summary(cur, filters).rename(columns={
+        "on_time_percentage": "on_time_pct", "sla_breach_percentage": "delayed_over_sla_pct"
+    })
+
+    # Vendor delivery metrics
+    vendor_summary = vendor_summary.sort_values("on_time_pct", ascending=False)
+    fig_vendor = px.bar(vendor_summary, x="vendor", y="on_time_pct", text="on_time_pct",
+        title="On-Time Delivery Rate by Vendor", labels={"vendor": "Vendor", "on_time_pct": "% On-Time"})
+    fig_vendor.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+    fig_vendor.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    # Avg delay
+    avg_delay_fig = px.bar(vendor_summary.sort_values("avg_delay", ascending=False),
+        x="vendor", y="avg_delay", text="avg_delay",
+        title="Average Delivery Delay (Days) by Vendor",
+        labels={"vendor": "Vendor", "avg_delay": "Average Delay (Days)"})
+    avg_delay_fig.update_traces(texttemplate='%{text:.1f}', textposition='outside')
+    avg_delay_fig.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    # Severe delays
+    fig_severe = px.bar(vendor_summary.sort_values("delayed_over_sla_pct", ascending=False),
+        x="vendor", y="delayed_over_sla_pct", text="delayed_over_sla_pct",
+        title=f"% of Deliveries Delayed Over {SLA_DELAY_DAYS} Days",
+        labels={"vendor": "Vendor", "delayed_over_sla_pct": f"% Delayed > {SLA_DELAY_DAYS} Days"})
+    fig_severe.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+    fig_severe.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    vendor_count = queries.vendor_reliance(cur, filters)
+    fig_vendor_heatmap = px.density_heatmap(
+        vendor_count,
+        x="base",
+        y="vendor",
+        z="orders",
+        color_continuous_scale=px.colors.sequential.Blues,
+        title="Vendor Reliance Heatmap",
+        labels={"base": "Base", "vendor": "Vendor", "orders": "Order Volume"}
+    )
+    fig_vendor_heatmap.update_layout(margin=dict(t=60, b=40))
+
+    return [
+        html.Div([
+            html.Div([dcc.Graph(figure=fig_vendor)], style=GRAPH_HALF),
+            html.Div([dcc.Graph(figure=avg_delay_fig)], style=GRAPH_HALF)
+        ]),
+        html.Div([dcc.Graph(figure=fig_severe)], style=GRAPH_FULL),
+        html.Div([dcc.Graph(figure=fig_vendor_heatmap)], style=GRAPH_FULL)
+    ]
+
+def inventory_figures(cur, filters):
+    """Inventory risk section: low coverage, aging and critical positions."""
+    # Inventory coverage: raw points when small, else binned positions plus the worst N
+    low_count = queries.low_inventory_count(cur, filters)
+    inventory_labels = {"base": "Base", "days_remaining": "Days Remaining", "supply_category": "Supply Category"}
+    inventory_title = f"Inventory Risk (Coverage < {RISK_THRESHOLD_DAYS} Days)"
+    if low_count <= queries.RAW_ROWS_LIMIT:
+        low_inventory = queries.low_inventory(cur, filters)
+        fig_inventory = px.scatter(low_inventory, x="base", y="days_remaining", color="supply_category",
+            size="inventory_units", title=inventory_title, labels=inventory_labels)
+    else:
+        low_inventory = queries.low_inventory(cur, filters, limit=queries.TOP_N_WORST)
+        fig_inventory = px.scatter(queries.low_inventory_bins(cur, filters), x="base", y="days_remaining",
+            color="supply_category", size="positions", opacity=0.5, hover_data=["inventory_units"],
+            title=f"{inventory_title} – {low_count:,} positions binned, worst {queries.TOP_N_WORST} highlighted",
+            labels=inventory_labels)
+        fig_inventory.add_trace(go.Scatter(x=low_inventory["base"], y=low_inventory["days_remaining"],
+            mode="markers", name=f"Worst {queries.TOP_N_WORST}",
+            marker=dict(symbol="x", color="crimson", size=9),
+            text=low_inventory["supply_category"]))
+    fig_inventory.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    # Aging inventory
+    fig_aging = box_figure(queries.inventory_aging_stats(cur, filters),
+        lambda: queries.inventory_aging(cur, filters), x="supply_category", y="days_since_update",
+        title="Aging Inventory Risk by Supply Category",
+        labels={"supply_category": "Supply Category", "days_since_update": "Days Since Last Update"})
+    fig_aging.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    # Low inventory table (worst N once the list outgrows a readable bar chart)
+    low_inv_table = low_inventory.head(queries.TOP_N_WORST).reset_index(drop=True)
+    low_inv_table["label"] = low_inv_table["base"].astype(str) + " – " + low_inv_table["supply_category"].astype(str)
+    low_inv_title = f"Critical Base-Category Inventory (<{RISK_THRESHOLD_DAYS} Days)"
+    if low_count > queries.TOP_N_WORST:
+        low_inv_title = f"{low_inv_title} – worst {queries.TOP_N_WORST} of {low_count:,}"
+    fig_low_inv_table = px.bar(low_inv_table, x="label", y="days_remaining",
+        title=low_inv_title,
+        labels={"label": "Base – Supply Category", "days_remaining": "Days Remaining"})
+    fig_low_inv_table.update_traces(texttemplate='%{y}', textposition='outside')
+    fig_low_inv_table.update_layout(margin=dict(t=60, b=100), uniformtext_minsize=9)
+
+    return [
+        html.Div([
+            html.Div([dcc.Graph(figure=fig_inventory)], style=GRAPH_HALF),
+            html.Div([dcc.Graph(figure=fig_aging)], style=GRAPH_HALF)
+        ]),
+        html.Div([dcc.Graph(figure=fig_low_inv_table)], style=GRAPH_FULL)
+    ]
+
+def financial_figures(cur, filters):
+    """Financial controls section: budget utilization and cost breakdown."""
+    budget = queries.budget_utilization(cur, filters)
 
-fig_cost_breakdown = px.bar(budget.sort_values("budget_spent", ascending=False),
-    x="base", y="budget_spent", color="supply_category", barmode="stack",
-    title="Cost Breakdown by Base and Supply Category",
-    labels={"base": "Base", "budget_spent": "Budget Spent", "supply_category": "Supply Category"})
-fig_cost_breakdown.update_layout(margin=dict(t=60, b=40))
+    # Budget utilization
+    fig_budget = px.density_heatmap(budget, x="base", y="supply_category", z="utilization",
+        title="Budget Utilization (%)", color_continuous_scale=px.colors.sequential.Blues,
+        labels={"base": "Base", "supply_category": "Supply Category", "utilization": "Utilization (%)"})
+    fig_budget.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    fig_cost_breakdown = px.bar(budget.sort_values("budget_spent", ascending=False),
+        x="base", y="budget_spent", color="supply_category", barmode="stack",
+        title="Cost Breakdown by Base and Supply Category",
+        labels={"base": "Base", "budget_spent": "Budget Spent", "supply_category": "Supply Category"})
+    fig_cost_breakdown.update_layout(margin=dict(t=60, b=40))
+
+    return [
+        html.Div([dcc.Graph(figure=fig_budget)], style=GRAPH_FULL),
+        html.Div([dcc.Graph(figure=fig_cost_breakdown)], style=GRAPH_FULL)
+    ]
+
+def operational_figures(cur, filters):
+    """Operational assessment section: emergency orders, route risk and lead time."""
+    base_risk = queries.base_risk(cur, filters)
+
+    # Emergency procurement
+    emergency_df = base_risk[["base", "emergency_ratio"]].rename(columns={"emergency_ratio": "emergency_rate"})
+    fig_emergency = px.bar(emergency_df.sort_values("emergency_rate", ascending=False), x="base", y="emergency_rate", text="emergency_rate",
+        title="Emergency Order Rate by Base", labels={"base": "Base", "emergency_rate": "% Emergency Orders"})
+    fig_emergency.update_traces(texttemplate='%{text:.2%}', textposition='outside')
+    fig_emergency.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    # Route risk score
+    route_risk = base_risk[["base", "route_risk"]].rename(columns={"route_risk": "risk_score"})
+    fig_route_risk = px.bar(route_risk.sort_values("risk_score", ascending=False),
+        x="base", y="risk_score", text="risk_score",
+        title="Average Route Risk Score by Base", labels={"base": "Base", "risk_score": "Route Risk Score"})
+    fig_route_risk.update_traces(texttemplate='%{text:.2f}', textposition='outside')
+    fig_route_risk.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    # Procurement lead time
+    fig_lead_time = box_figure(queries.lead_time_stats(cur, filters),
+        lambda: queries.lead_times(cur, filters), x="supply_category", y="lead_time",
+        title="Procurement Lead Time by Supply Category",
+        labels={"supply_category": "Supply Category", "lead_time": "Lead Time (Days)"})
+    fig_lead_time.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    return [
+        html.Div([
+            html.Div([dcc.Graph(figure=fig_emergency)], style=GRAPH_HALF),
+            html.Div([dcc.Graph(figure=fig_route_risk)], style=GRAPH_HALF)
+        ]),
+        html.Div([dcc.Graph(figure=fig_lead_time)], style=GRAPH_FULL)
+    ]
+
+def strategic_figures(cur, filters):
+    """Strategic overview section: composite base risk index and rolling KPI trends."""
+    base_risk = queries.base_risk(cur, filters)
+
+    # Base risk index ---
+    fig_base_risk = px.bar(base_risk.sort_values("base_risk_index", ascending=False), x="base", y="base_risk_index", text="base_risk_index",
+        title="Composite Base Risk Index", labels={"base": "Base", "base_risk_index": "Risk Index"})
+    fig_base_risk.update_traces(texttemplate='%{text:.1f}', textposition='outside')
+    fig_base_risk.update_layout(margin=dict(t=60, b=40), uniformtext_minsize=10)
+
+    # Rolling trends from the daily KPI fact table
+    base_trends = queries.kpi_trends(cur, filters, "base", TREND_WINDOW_DAYS)
+    fig_risk_trend = px.line(base_trends, x="kpi_date", y="base_risk_index", color="entity",
+        title=f"Rolling {TREND_WINDOW_DAYS}-Day Base Risk Index",
+        labels={"kpi_date": "Date", "base_risk_index": "Risk Index", "entity": "Base"})
+    fig_risk_trend.update_layout(margin=dict(t=60, b=40))
+
+    vendor_trends = queries.kpi_trends(cur, filters, "vendor", TREND_WINDOW_DAYS)
+    fig_on_time_trend = px.line(vendor_trends, x="kpi_date", y="on_time_pct", color="entity",
+        title=f"Rolling {TREND_WINDOW_DAYS}-Day On-Time Delivery Rate by Vendor",
+        labels={"kpi_date": "Date", "on_time_pct": "% On-Time", "entity": "Vendor"})
+    fig_on_time_trend.update_layout(margin=dict(t=60, b=40))
+
+    return [
+        html.Div([dcc.Graph(figure=fig_base_risk)], style=GRAPH_FULL),
+        html.Div([
+            html.Div([dcc.Graph(figure=fig_risk_trend)], style=GRAPH_HALF),
+            html.Div([dcc.Graph(figure=fig_on_time_trend)], style=GRAPH_HALF)
+        ])
+    ]
+
+# Tab value -> (label, section builder); a section's figures are only built
+# when its tab is opened.
+SECTIONS = {
+    "vendor": ("Vendor Performance", vendor_figures),
+    "inventory": ("Inventory Risk", inventory_figures),
+    "financial": ("Financial Controls", financial_figures),
+    "operational": ("Operational Assessment", operational_figures),
+    "strategic": ("Strategic Overview", strategic_figures)
+}
 
 # Dash application setup
 app = dash.Dash(__name__)
 app.title = "Military Base Supply – Operations Insights Dashboard"
 
-app.layout = html.Div([
-    html.H2("Military Base Supply – Operations Insights", style={"textAlign": "center"}),
-    html.P("Data coverage: ~90 days of simulated operational activity.", style={"textAlign": "center", "fontSize": "14px", "marginBottom": "20px"}),
-    html.P("Disclaimer: This dataset is entirely fictional and does not reflect real-world military operations or supply conditions.",
-    style={"textAlign": "center", "fontSize": "14px", "fontStyle": "italic", "color": "gray"}
-),
-
-    html.Div([
-        html.Div([dcc.Graph(figure=fig_vendor)], style={"width": "48%", "display": "inline-block", "padding": "10px"}),
-        html.Div([dcc.Graph(figure=avg_delay_fig)], style={"width": "48%", "display": "inline-block", "padding": "10px"})
-    ]),
-
-    html.Div([
-        html.Div([dcc.Graph(figure=fig_severe)], style={"width": "48%", "display": "inline-block", "padding": "10px"}),
-        html.Div([dcc.Graph(figure=fig_inventory)], style={"width": "48%", "display": "inline-block", "padding": "10px"})
-    ]),
-
-    html.Div([dcc.Graph(figure=fig_budget)], style={"padding": "10px"}),
-
-    html.Div([
-        html.Div([dcc.Graph(figure=fig_emergency)], style={"width": "48%", "display": "inline-block", "padding": "10px"}),
-        html.Div([dcc.Graph(figure=fig_route_risk)], style={"width": "48%", "display": "inline-block", "padding": "10px"})
-    ]),
-
-    html.Div([
-        html.Div([dcc.Graph(figure=fig_lead_time)], style={"width": "48%", "display": "inline-block", "padding": "10px"}),
-        html.Div([dcc.Graph(figure=fig_aging)], style={"width": "48%", "display": "inline-block", "padding": "10px"})
-    ]),
-
-    html.Div([dcc.Graph(figure=fig_base_risk)], style={"padding": "10px"}),
-    html.Div([dcc.Graph(figure=fig_low_inv_table)], style={"padding": "10px"}),
-    html.Div([dcc.Graph(figure=fig_vendor_heatmap)], style={"padding": "10px"}),
-    html.Div([dcc.Graph(figure=fig_cost_breakdown)], style={"padding": "10px"})
-], style={"maxWidth": "1200px", "margin": "auto", "fontFamily": "Arial"})
+def serve_layout():
+    """Page layout, built per page load so the filter options follow the published data."""
+    try:
+        with read_store(STORE_PATH) as con:
+            filter_options = queries.filter_options(con.cursor())
+    except FileNotFoundError as e:
+        # Nothing published yet (e.g. a fresh gunicorn deployment): say so instead of failing
+        return html.Div([
+            html.H2("Military Base Supply – Operations Insights", style={"textAlign": "center"}),
+            html.P(str(e), style={"textAlign": "center", "color": "gray"})
+        ], style={"maxWidth": "1200px", "margin": "auto", "fontFamily": "Arial"})
+    return html.Div([
+        html.H2("Military Base Supply – Operations Insights", style={"textAlign": "center"}),
+        html.P("Data coverage: ~90 days of simulated operational activity.", style={"textAlign": "center", "fontSize": "14px", "marginBottom": "20px"}),
+        html.P("Disclaimer: This dataset is entirely fictional and does not reflect real-world military operations or supply conditions.",
+        style={"textAlign": "center", "fontSize": "14px", "fontStyle": "italic", "color": "gray"}
+    ),
+
+        html.Div([
+            html.Div([dcc.Dropdown(id="filter-base", options=filter_options["bases"], multi=True, placeholder="All bases")],
+                style={"width": "24%", "display": "inline-block", "padding": "5px"}),
+            html.Div([dcc.Dropdown(id="filter-vendor", options=filter_options["vendors"], multi=True, placeholder="All vendors")],
+                style={"width": "24%", "display": "inline-block", "padding": "5px"}),
+            html.Div([dcc.Dropdown(id="filter-category", options=filter_options["categories"], multi=True, placeholder="All supply categories")],
+                style={"width": "24%", "display": "inline-block", "padding": "5px"}),
+            html.Div([dcc.DatePickerRange(id="filter-dates",
+                start_date=filter_options["dates"][0], end_date=filter_options["dates"][1],
+                min_date_allowed=filter_options["dates"][0], max_date_allowed=filter_options["dates"][1])],
+                style={"width": "24%", "display": "inline-block", "padding": "5px", "verticalAlign": "top"})
+        ]),
+
+        dcc.Tabs(id="section-tabs", value="vendor",
+            children=[dcc.Tab(label=label, value=value) for value, (label, _) in SECTIONS.items()]),
+        dcc.Loading(html.Div(id="section-content"))
+    ], style={"maxWidth": "1200px", "margin": "auto", "fontFamily": "Arial"})
+
+app.layout = serve_layout
+
+@app.callback(
+    Output("section-content", "children"),
+    Input("section-tabs", "value"),
+    Input("filter-base", "value"),
+    Input("filter-vendor", "value"),
+    Input("filter-category", "value"),
+    Input("filter-dates", "start_date"),
+    Input("filter-dates", "end_date")
+)
+def render_section(section, bases, vendors, categories, start_date, end_date):
+    """Build only the open section's figures for the current filter selection."""
+    filters = {
+        "bases": bases, "vendors": vendors, "categories": categories,
+        "start_date": start_date, "end_date": end_date
+    }
+    _, build = SECTIONS[section]
+    with read_store(STORE_PATH) as con:
+        cur = con.cursor()
+        key = FigureCache.make_key(section, filters, data_version(cur))
+        return cache.get_or_compute(key, lambda: build(cur, filters))
+
+@app.server.route("/cache-stats")
+def cache_stats():
+    """Expose figure cache hit/miss counters as JSON."""
+    return flask.jsonify(cache.stats())
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # Standalone runs refresh the store themselves; under gunicorn the
+    # analyzer or KPI service publishes it instead
+    refresh_dashboard_store()
+    # Dash's debug mode (reloader and in-browser tracebacks) only on request
+    app.run(debug=os.environ.get("DASHBOARD_DEBUG") == "1")
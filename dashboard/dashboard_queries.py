@@ -0,0 +1,258 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis", "analysis_script"))
+from kpi_aggregates import VENDOR_ROLLUP_SQL, BASE_RISK_SQL, RISK_THRESHOLD_DAYS, histogram_quantile_sql
+from kpi_trends import TRENDS_TABLE
+
+# Filter keys -> column they restrict, per dashboard source. Filters that a
+# source has no column for (e.g. vendor on inventory) are ignored there.
+DELIVERY_COLUMNS = {"bases": "base", "vendors": "vendor", "categories": "supply_category", "dates": "actual_delivery_date"}
+ORDER_COLUMNS = {"bases": "base", "vendors": "vendor", "categories": "supply_category", "dates": "order_date"}
+SNAPSHOT_COLUMNS = {"bases": "base", "categories": "supply_category"}
+TREND_COLUMNS = {"dates": "kpi_date"}
+
+# Payload bounds for high-cardinality charts: above RAW_ROWS_LIMIT rows a chart
+# is drawn from server-side aggregates instead of the raw rows.
+RAW_ROWS_LIMIT = 5000
+SCATTER_BIN_DAYS = 5
+MAX_SCATTER_BINS = 2000
+TOP_N_WORST = 50
+
+# Label columns fetched as pandas categoricals (ENUM columns already arrive
+# that way); strings are only materialized when a chart renders them.
+LABEL_COLUMNS = ["base", "vendor", "supply_category", "entity"]
+
+def fetch_frame(cur, sql, params=None):
+    """Run a query and return its result with label columns as category dtype."""
+    df = cur.execute(sql, params or []).fetchdf()
+    for column in LABEL_COLUMNS:
+        if column in df.columns and df[column].dtype != "category":
+            df[column] = df[column].astype("category")
+    return df
+
+def build_where(filters, columns, alias=""):
+    """Translate dashboard filters into a parameterized WHERE clause for DuckDB."""
+    clauses, params = [], []
+    prefix = f"{alias}." if alias else ""
+    for key in ("bases", "vendors", "categories"):
+        values = filters.get(key)
+        if key in columns and values:
+            clauses.append(f"{prefix}{columns[key]} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    if "dates" in columns:
+        if filters.get("start_date"):
+            clauses.append(f"{prefix}{columns['dates']} >= ?::DATE")
+            params.append(filters["start_date"])
+        if filters.get("end_date"):
+            clauses.append(f"{prefix}{columns['dates']} <= ?::DATE")
+            params.append(filters["end_date"])
+    return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def filter_options(cur):
+    """Distinct values and date bounds used to populate the filter controls."""
+    return {
+        "bases": [r[0] for r in cur.execute("SELECT DISTINCT base FROM agg_vendor_daily ORDER BY 1").fetchall()],
+        "vendors": [r[0] for r in cur.execute("SELECT DISTINCT vendor FROM agg_vendor_daily ORDER BY 1").fetchall()],
+        "categories": [r[0] for r in cur.execute("SELECT DISTINCT supply_category FROM agg_vendor_daily ORDER BY 1").fetchall()],
+        "dates": cur.execute("SELECT MIN(actual_delivery_date), MAX(actual_delivery_date) FROM agg_vendor_daily").fetchone()
+    }
+
+def vendor_summary(cur, filters):
+    """Per-vendor delivery KPIs for the filtered slice."""
+    where, params = build_where(filters, DELIVERY_COLUMNS)
+    return fetch_frame(cur, VENDOR_ROLLUP_SQL.format(where=where), params)
+
+def vendor_reliance(cur, filters):
+    """Delivery volume per base and vendor."""
+    where, params = build_where(filters, DELIVERY_COLUMNS)
+    return fetch_frame(cur, f"""
+        SELECT base, vendor, SUM(deliveries) AS orders
+        FROM agg_vendor_daily {where}
+        GROUP BY base, vendor
+    """, params)
+
+def _low_inventory_source(filters):
+    """Relation and parameters for inventory positions under the coverage threshold."""
+    where, params = build_where(filters, SNAPSHOT_COLUMNS)
+    where = f"{where} AND" if where else "WHERE"
+    return f"""
+        SELECT base, supply_category, inventory_units, days_remaining
+        FROM base_inventory_supply
+        {where} days_remaining < {RISK_THRESHOLD_DAYS}
+    """, params
+
+def low_inventory(cur, filters, limit=None):
+    """Base-category inventory positions under the coverage threshold, worst first."""
+    source, params = _low_inventory_source(filters)
+    limit_sql = f"LIMIT {int(limit)}" if limit else ""
+    return fetch_frame(cur, f"""
+        {source}
+        ORDER BY days_remaining, inventory_units
+        {limit_sql}
+    """, params)
+
+def low_inventory_count(cur, filters):
+    """Number of inventory positions under the coverage threshold."""
+    source, params = _low_inventory_source(filters)
+    return count_rows(cur, source, params)
+
+def low_inventory_bins(cur, filters):
+    """Low-stock positions binned by base, category and SCATTER_BIN_DAYS of cover."""
+    source, params = _low_inventory_source(filters)
+    return fetch_frame(cur, f"""
+        SELECT
+            base, supply_category,
+            ROUND(AVG(days_remaining), 1) AS days_remaining,
+            SUM(inventory_units) AS inventory_units,
+            COUNT(*) AS positions
+        FROM ({source})
+        GROUP BY base, supply_category, FLOOR(days_remaining / {SCATTER_BIN_DAYS})
+        ORDER BY days_remaining
+        LIMIT {MAX_SCATTER_BINS}
+    """, params)
+
+def count_rows(cur, source, params):
+    """Row count of a relation, used to pick raw vs aggregated chart rendering."""
+    return cur.execute(f"SELECT COUNT(*) FROM ({source})", params).fetchone()[0]
+
+# Tukey (1.5 IQR) whiskers over a relation of per-group quartiles
+FENCES_SQL = """
+    SELECT *,
+        GREATEST(min_value, q1 - 1.5 * (q3 - q1)) AS lowerfence,
+        LEAST(max_value, q3 + 1.5 * (q3 - q1)) AS upperfence
+    FROM stats
+    ORDER BY {group_column}
+"""
+
+def box_stats(cur, source, params, group_column, value_column):
+    """Precomputed box-plot statistics per group, with Tukey (1.5 IQR) whiskers."""
+    return fetch_frame(cur, f"""
+        WITH stats AS (
+            SELECT
+                {group_column},
+                COUNT({value_column}) AS n,
+                MIN({value_column}) AS min_value,
+                MAX({value_column}) AS max_value,
+                AVG({value_column}) AS mean,
+                quantile_cont({value_column}, 0.25) AS q1,
+                quantile_cont({value_column}, 0.5) AS median,
+                quantile_cont({value_column}, 0.75) AS q3
+            FROM ({source})
+            WHERE {value_column} IS NOT NULL
+            GROUP BY {group_column}
+        )
+        {FENCES_SQL.format(group_column=group_column)}
+    """, params)
+
+def histogram_box_stats(cur, source, params, group_column, value_column, count_column):
+    """Box-plot statistics per group from a whole-valued histogram (value, count) relation.
+
+    Matches box_stats over the raw rows the histogram counts, but only
+    touches one row per group and value.
+    """
+    return fetch_frame(cur, f"""
+        WITH hist AS (
+            SELECT {group_column}, {value_column}, SUM({count_column}) AS n
+            FROM ({source})
+            WHERE {value_column} IS NOT NULL
+            GROUP BY {group_column}, {value_column}
+        ), cumulative AS (
+            SELECT *,
+                SUM(n) OVER (PARTITION BY {group_column} ORDER BY {value_column} ROWS UNBOUNDED PRECEDING) AS cumulative,
+                SUM(n) OVER (PARTITION BY {group_column}) AS samples
+            FROM hist
+        ), stats AS (
+            SELECT
+                {group_column},
+                samples::BIGINT AS n,
+                MIN({value_column}) AS min_value,
+                MAX({value_column}) AS max_value,
+                SUM(n * {value_column}) / samples AS mean,
+                {histogram_quantile_sql(0.25, value_column)} AS q1,
+                {histogram_quantile_sql(0.5, value_column)} AS median,
+                {histogram_quantile_sql(0.75, value_column)} AS q3
+            FROM cumulative
+            GROUP BY {group_column}, samples
+        )
+        {FENCES_SQL.format(group_column=group_column)}
+    """, params)
+
+def _inventory_aging_source(filters):
+    """Relation and parameters for days since each inventory record was updated."""
+    where, params = build_where(filters, SNAPSHOT_COLUMNS)
+    return f"""
+        SELECT supply_category, current_date - last_updated AS days_since_update
+        FROM base_inventory_supply {where}
+    """, params
+
+def inventory_aging(cur, filters):
+    """Days since each inventory record was last updated."""
+    source, params = _inventory_aging_source(filters)
+    return fetch_frame(cur, source, params)
+
+def inventory_aging_stats(cur, filters):
+    """Box-plot statistics of inventory record age per supply category."""
+    source, params = _inventory_aging_source(filters)
+    return box_stats(cur, source, params, "supply_category", "days_since_update")
+
+def budget_utilization(cur, filters):
+    """Budget allocation, spend and utilization per base and category."""
+    where, params = build_where(filters, SNAPSHOT_COLUMNS)
+    return fetch_frame(cur, f"""
+        SELECT base, supply_category, budget_allocated, budget_spent, percent_spent AS utilization
+        FROM agg_budget {where}
+    """, params)
+
+def _lead_time_source(filters):
+    """Relation and parameters for order-to-delivery lead times."""
+    where, params = build_where(filters, ORDER_COLUMNS, alias="o")
+    return f"""
+        SELECT o.supply_category, d.actual_delivery_date - o.order_date AS lead_time
+        FROM supply_orders o
+        LEFT JOIN supply_deliveries d ON o.order_id = d.order_id
+        {where}
+    """, params
+
+def lead_times(cur, filters):
+    """Order-to-delivery lead time in days for each filtered order."""
+    source, params = _lead_time_source(filters)
+    return fetch_frame(cur, source, params)
+
+def lead_time_stats(cur, filters):
+    """Box-plot statistics of procurement lead time per supply category, from agg_lead_time_hist."""
+    where, params = build_where(filters, ORDER_COLUMNS)
+    source = f"SELECT supply_category, lead_time, orders FROM agg_lead_time_hist {where}"
+    return histogram_box_stats(cur, source, params, "supply_category", "lead_time", "orders")
+
+def base_risk(cur, filters):
+    """Composite base risk index and its components for the filtered slice."""
+    clauses = [
+        build_where(filters, DELIVERY_COLUMNS),
+        build_where(filters, SNAPSHOT_COLUMNS),
+        build_where(filters, SNAPSHOT_COLUMNS),
+        build_where(filters, ORDER_COLUMNS)
+    ]
+    sql = BASE_RISK_SQL.format(
+        delivery_where=clauses[0][0], inventory_where=clauses[1][0],
+        budget_where=clauses[2][0], order_where=clauses[3][0]
+    )
+    params = [p for _, clause_params in clauses for p in clause_params]
+    return fetch_frame(cur, sql, params)
+
+def kpi_trends(cur, filters, scope, window_days):
+    """Rolling KPIs per day for one scope (vendor, base or fleet) and trailing window."""
+    entities = {"vendor": filters.get("vendors"), "base": filters.get("bases")}.get(scope)
+    where, params = build_where(filters, TREND_COLUMNS)
+    where = f"{where} AND" if where else "WHERE"
+    params += [scope, window_days]
+    entity_sql = ""
+    if entities:
+        entity_sql = f"AND entity IN ({', '.join('?' for _ in entities)})"
+        params.extend(entities)
+    return fetch_frame(cur, f"""
+        SELECT kpi_date, entity, deliveries, orders, on_time_pct, avg_delay, emergency_rate, base_risk_index
+        FROM {TRENDS_TABLE}
+        {where} scope = ? AND window_days = ? {entity_sql}
+        ORDER BY entity, kpi_date
+    """, params)
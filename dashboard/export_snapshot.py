@@ -0,0 +1,325 @@
+import os
+import json
+import gzip
+import hashlib
+import tarfile
+import logging
+import tempfile
+import argparse
+from datetime import datetime, timezone
+
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+from dash import dcc
+
+import command_operational_dashboard as dashboard
+
+# Configs
+SNAPSHOT_DIR = "dashboard/snapshot"
+FIGURE_DIR = "figures"  # content-addressed figure JSON, shared across snapshots
+TEMPLATE_DIR = "templates"  # plotly layout templates, stored once instead of in every figure
+HISTORY_DIR = "manifests"  # manifest of each snapshot, for delta packages
+KEEP_SNAPSHOTS = 5  # figure files referenced by the last N snapshots are kept
+GZIP_LEVEL = 9
+
+# Static page: loads manifest.json, the shared plotly.js and then only the
+# figures of the open tab. Figures are cached in localStorage by content
+# hash, so a client that already holds a snapshot only downloads the
+# figures whose hash changed.
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Military Base Supply – Operations Insights (snapshot)</title>
+<style>
+body { max-width: 1200px; margin: auto; font-family: Arial; }
+h2, #meta { text-align: center; }
+#meta { font-size: 14px; color: gray; }
+nav button { padding: 8px 14px; border: 1px solid #ccc; background: #f4f4f4; cursor: pointer; }
+nav button.active { background: #fff; border-bottom-color: #fff; font-weight: bold; }
+.figure { padding: 10px; min-height: 450px; }
+</style>
+</head>
+<body>
+<h2>Military Base Supply – Operations Insights</h2>
+<p id="meta">Loading snapshot…</p>
+<nav id="tabs"></nav>
+<div id="content"></div>
+<script>
+const store = {
+  get: key => { try { return localStorage.getItem(key); } catch (e) { return null; } },
+  set: (key, value) => { try { localStorage.setItem(key, value); } catch (e) {} }
+};
+
+async function fetchText(path) {
+  const response = await fetch(path, { cache: path.endsWith("manifest.json") ? "no-cache" : "default" });
+  if (!response.ok) throw new Error(`${path}: ${response.status}`);
+  const bytes = new Uint8Array(await response.arrayBuffer());
+  // Servers that send .gz files with Content-Encoding: gzip hand us plain JSON
+  if (bytes[0] === 0x1f && bytes[1] === 0x8b) {
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+    return await new Response(stream).text();
+  }
+  return new TextDecoder().decode(bytes);
+}
+
+async function fetchCached(path, hash) {
+  const key = `snapshot:${hash}`;
+  let text = store.get(key);
+  if (text === null) {
+    text = await fetchText(path);
+    store.set(key, text);
+  }
+  return JSON.parse(text);
+}
+
+function loadScript(src) {
+  return new Promise((resolve, reject) => {
+    const script = document.createElement("script");
+    script.src = src;
+    script.onload = resolve;
+    script.onerror = reject;
+    document.head.appendChild(script);
+  });
+}
+
+async function showSection(manifest, section) {
+  document.querySelectorAll("nav button").forEach(b => b.classList.toggle("active", b.dataset.id === section.id));
+  const content = document.getElementById("content");
+  content.innerHTML = "";
+  for (const figure of section.figures) {
+    const div = document.createElement("div");
+    div.className = "figure";
+    content.appendChild(div);
+    const spec = await fetchCached(`FIGURE_DIR/${figure.hash}.json.gz`, figure.hash);
+    if (figure.template) {
+      spec.layout.template = await fetchCached(`TEMPLATE_DIR/${figure.template}.json.gz`, figure.template);
+    }
+    Plotly.newPlot(div, spec.data, spec.layout, { responsive: true, displaylogo: false });
+  }
+}
+
+async function main() {
+  const manifest = JSON.parse(await fetchText("manifest.json"));
+  await loadScript(manifest.plotly_js);
+  const changed = manifest.previous_version
+    ? `; ${manifest.changed.length} figures changed since ${manifest.previous_version}` : "";
+  document.getElementById("meta").textContent =
+    `Snapshot ${manifest.version} rendered ${manifest.created}${changed}`;
+  const tabs = document.getElementById("tabs");
+  for (const section of manifest.sections) {
+    const button = document.createElement("button");
+    button.textContent = section.label;
+    button.dataset.id = section.id;
+    button.onclick = () => showSection(manifest, section);
+    tabs.appendChild(button);
+  }
+  await showSection(manifest, manifest.sections[0]);
+}
+
+main().catch(e => { document.getElementById("meta").textContent = `Snapshot failed to load: ${e.message}`; });
+</script>
+</body>
+</html>
+""".replace("FIGURE_DIR", FIGURE_DIR).replace("TEMPLATE_DIR", TEMPLATE_DIR)
+
+logger = logging.getLogger(__name__)
+
+def _digest(data):
+    """Content hash used as a bundle file name."""
+    return hashlib.sha1(data).hexdigest()[:16]
+
+def _write_atomic(path, data):
+    """Publish a file in one rename so a site syncing mid-export never reads it half written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)  # mkstemp creates owner-only files; the bundle is served as-is
+    os.replace(tmp_path, path)
+
+def _write_gzip(path, data):
+    """Write gzip-compressed content once; a fixed mtime keeps identical content byte-identical."""
+    if not os.path.exists(path):
+        _write_atomic(path, gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))
+
+def _compact_json(value):
+    """Smallest stable JSON encoding of a value."""
+    return json.dumps(value, separators=(",", ":"), sort_keys=True).encode()
+
+def _graphs(component):
+    """Figures of every dcc.Graph in a rendered section, in layout order."""
+    if isinstance(component, dcc.Graph):
+        yield component.figure
+    elif isinstance(component, (list, tuple)):
+        for child in component:
+            yield from _graphs(child)
+    elif getattr(component, "children", None) is not None:
+        yield from _graphs(component.children)
+
+def default_filters(cur):
+    """The selection a dashboard visitor starts with: everything over the full date range."""
+    start_date, end_date = dashboard.queries.filter_options(cur)["dates"]
+    return {"bases": None, "vendors": None, "categories": None,
+            "start_date": str(start_date), "end_date": str(end_date)}
+
+def render_sections(cur, filters):
+    """Build every section's figures with the dashboard's own (pre-aggregating) section builders."""
+    for section, (label, build) in dashboard.SECTIONS.items():
+        yield section, label, list(_graphs(build(cur, filters)))
+
+def _write_plotly_js(output_dir):
+    """Write plotly.js once per version, shared by every figure and snapshot."""
+    script = get_plotlyjs().encode()
+    name = f"plotly-{_digest(script)}.min.js"
+    path = os.path.join(output_dir, name)
+    if not os.path.exists(path):
+        _write_atomic(path, script)
+    _write_gzip(f"{path}.gz", script)  # precompressed twin for gzip_static servers
+    return name
+
+def read_manifest(output_dir, version=None):
+    """Current manifest of a bundle, or the manifest of an earlier snapshot version."""
+    path = (os.path.join(output_dir, HISTORY_DIR, f"{version}.json") if version
+            else os.path.join(output_dir, "manifest.json"))
+    if not os.path.exists(path):
+        if version:
+            raise ValueError(f"Unknown snapshot version {version} in {output_dir}")
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _bundle_files(manifest):
+    """Bundle-relative paths of every figure and template file a manifest references."""
+    files = set()
+    for section in manifest["sections"]:
+        for figure in section["figures"]:
+            files.add(f"{FIGURE_DIR}/{figure['hash']}.json.gz")
+            if figure["template"]:
+                files.add(f"{TEMPLATE_DIR}/{figure['template']}.json.gz")
+    return files
+
+def _prune(output_dir):
+    """Drop manifests beyond KEEP_SNAPSHOTS and the files none of the kept snapshots reference."""
+    history_dir = os.path.join(output_dir, HISTORY_DIR)
+    manifests = []
+    for name in os.listdir(history_dir):
+        with open(os.path.join(history_dir, name)) as f:
+            manifests.append((json.load(f), name))
+    manifests.sort(key=lambda item: item[0]["created"], reverse=True)
+    for _, name in manifests[KEEP_SNAPSHOTS:]:
+        os.remove(os.path.join(history_dir, name))
+    kept = set().union(*(_bundle_files(manifest) for manifest, _ in manifests[:KEEP_SNAPSHOTS]))
+    removed = 0
+    for directory in (FIGURE_DIR, TEMPLATE_DIR):
+        for name in os.listdir(os.path.join(output_dir, directory)):
+            if f"{directory}/{name}" not in kept:
+                os.remove(os.path.join(output_dir, directory, name))
+                removed += 1
+    return removed
+
+def export_snapshot(output_dir=SNAPSHOT_DIR, filters=None, store_path=dashboard.STORE_PATH):
+    """Render the dashboard into a static bundle and return its manifest.
+
+    Each figure is stored once as compressed, content-addressed JSON built
+    from the dashboard's pre-aggregated queries; plotly's layout template
+    and plotly.js are stored once for all figures. The manifest lists the
+    figure hashes per section and which figures changed since the previous
+    snapshot, so clients and delta packages only move changed figures.
+    The sections are read from the store's published copy over one
+    short-lived read-only connection, like a dashboard page load.
+    """
+    previous = read_manifest(output_dir)
+    previous_hashes = {}
+    if previous:
+        previous_hashes = {f["id"]: f["hash"] for s in previous["sections"] for f in s["figures"]}
+
+    # Render first so the read-only connection is released before any file is written
+    with dashboard.read_store(store_path) as con:
+        cur = con.cursor()
+        filters = filters or default_filters(cur)
+        data_version = dashboard.data_version(cur)
+        rendered = list(render_sections(cur, filters))
+
+    sections, changed = [], []
+    for section, label, figures in rendered:
+        entries = []
+        for index, fig in enumerate(figures):
+            spec = json.loads(pio.to_json(fig, validate=False, remove_uids=True))
+            template = spec["layout"].pop("template", None)
+            template_hash = None
+            if template is not None:
+                template_json = _compact_json(template)
+                template_hash = _digest(template_json)
+                _write_gzip(os.path.join(output_dir, TEMPLATE_DIR, f"{template_hash}.json.gz"), template_json)
+            figure_json = _compact_json(spec)
+            figure_hash = _digest(figure_json)
+            _write_gzip(os.path.join(output_dir, FIGURE_DIR, f"{figure_hash}.json.gz"), figure_json)
+            figure_id = f"{section}-{index}"
+            if previous_hashes.get(figure_id) != figure_hash:
+                changed.append(figure_id)
+            entries.append({
+                "id": figure_id,
+                "title": (spec["layout"].get("title") or {}).get("text"),
+                "hash": figure_hash,
+                "template": template_hash,
+                "bytes": len(figure_json)
+            })
+        sections.append({"id": section, "label": label, "figures": entries})
+
+    version = _digest(_compact_json([sections, filters]))
+    if previous and previous["version"] == version:
+        logger.info(f"Snapshot {version} is unchanged")
+        return previous
+    manifest = {
+        "version": version,
+        "created": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "data_version": data_version,
+        "filters": filters,
+        "plotly_js": _write_plotly_js(output_dir),
+        "previous_version": previous["version"] if previous else None,
+        "changed": changed,
+        "sections": sections
+    }
+    manifest_json = json.dumps(manifest, indent=1).encode()
+    _write_atomic(os.path.join(output_dir, HISTORY_DIR, f"{version}.json"), manifest_json)
+    _write_atomic(os.path.join(output_dir, "index.html"), INDEX_HTML.encode())
+    _write_atomic(os.path.join(output_dir, "manifest.json"), manifest_json)
+    removed = _prune(output_dir)
+    logger.info(f"Snapshot {version}: {sum(len(s['figures']) for s in sections)} figures, "
+                f"{len(changed)} changed, {removed} stale files removed")
+    return manifest
+
+def write_package(output_dir, path, since_version=None):
+    """Pack the bundle into one tar file, or with ``since_version`` only what changed after it.
+
+    A delta package holds the current manifest, the page and the figure,
+    template and plotly.js files the earlier snapshot did not reference;
+    unpacking it over that snapshot's bundle brings it up to date. Bundle
+    files are already gzip-compressed, so the tar itself is not.
+    """
+    manifest = read_manifest(output_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No snapshot in {output_dir}; export one first")
+    files = _bundle_files(manifest) | {manifest["plotly_js"], f"{manifest['plotly_js']}.gz"}
+    if since_version:
+        since = read_manifest(output_dir, since_version)
+        files -= _bundle_files(since) | {since["plotly_js"], f"{since['plotly_js']}.gz"}
+    files |= {"index.html", "manifest.json", f"{HISTORY_DIR}/{manifest['version']}.json"}
+    with tarfile.open(path, "w") as tar:
+        for name in sorted(files):
+            tar.add(os.path.join(output_dir, name), arcname=name)
+    logger.info(f"Wrote {path}: {len(files)} files{f' changed since {since_version}' if since_version else ''}")
+    return len(files)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Export the dashboard as a static, compressed snapshot bundle")
+    parser.add_argument("--output-dir", default=SNAPSHOT_DIR, help="bundle directory (updated in place)")
+    parser.add_argument("--package", metavar="PATH", help="also write the bundle as one tar file for transfer")
+    parser.add_argument("--since", metavar="VERSION",
+                        help="with --package, include only what changed after this snapshot version")
+    args = parser.parse_args()
+    export_snapshot(args.output_dir)
+    if args.package:
+        write_package(args.output_dir, args.package, since_version=args.since)
@@ -0,0 +1,149 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+from datetime import date
+from collections import OrderedDict
+
+# Configs
+MEMORY_CAP_BYTES = 64 * 1024 * 1024
+DISK_CAP_BYTES = 512 * 1024 * 1024
+
+class FigureCache:
+    """LRU cache of rendered dashboard sections with an optional shared disk tier.
+
+    Entries are keyed on the section, the filter selection, the store's
+    data version and the render date, so a re-ingest naturally invalidates
+    everything rendered from older data, and sections that measure against
+    ``current_date`` (inventory aging) are not served from a previous day.
+    The in-memory tier evicts least recently used entries once their
+    pickled size exceeds ``memory_cap``. When ``disk_dir`` is set,
+    entries are also written there so several gunicorn workers (and
+    restarts) share rendered sections; that tier is trimmed oldest-first
+    past ``disk_cap``.
+    """
+
+    def __init__(self, memory_cap=MEMORY_CAP_BYTES, disk_dir=None, disk_cap=DISK_CAP_BYTES):
+        self.memory_cap = memory_cap
+        self.disk_dir = disk_dir
+        self.disk_cap = disk_cap
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(section, filters, version, day=None):
+        """Stable key for a section render on ``day`` (default today): filter order must not matter."""
+        normalized = sorted(
+            (name, tuple(sorted(value)) if isinstance(value, (list, tuple)) else value)
+            for name, value in filters.items()
+        )
+        day = (day or date.today()).isoformat()
+        return hashlib.sha1(repr((section, normalized, version, day)).encode()).hexdigest()
+
+    def get(self, key):
+        """Return a cached value or None, promoting it to most recently used."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return pickle.loads(self._entries[key])
+        payload = self._read_disk(key)
+        with self._lock:
+            if payload is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._store_memory(key, payload)
+        return pickle.loads(payload)
+
+    def set(self, key, value):
+        """Cache a value in memory and, if configured, on disk."""
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store_memory(key, payload)
+        self._write_disk(key, payload)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and caching it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        """Hit/miss counters and current occupancy."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round((self._stats["hits"] + self._stats["disk_hits"]) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "memory_cap_bytes": self.memory_cap,
+                "disk_dir": self.disk_dir
+            }
+
+    def _store_memory(self, key, payload):
+        """Insert into the LRU tier and evict until under the memory cap (lock held)."""
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        if len(payload) > self.memory_cap:
+            return
+        self._entries[key] = payload
+        self._bytes += len(payload)
+        while self._bytes > self.memory_cap:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def _disk_path(self, key):
+        """File holding a disk-tier entry."""
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _read_disk(self, key):
+        """Load a disk-tier entry, touching it so trimming keeps recently used files."""
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                payload = f.read()
+            os.utime(self._disk_path(key))
+            return payload
+        except OSError:
+            return None
+
+    def _write_disk(self, key, payload):
+        """Atomically publish an entry so concurrent workers never read partial files."""
+        if not self.disk_dir:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self._disk_path(key))
+        self._trim_disk()
+
+    def _trim_disk(self):
+        """Remove least recently used disk entries beyond the disk cap."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".pkl"):
+                try:
+                    stat = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_cap:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+            total -= size
@@ -1,134 +1,252 @@
 import os
+import argparse
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-import random
-from datetime import timedelta
 from faker import Faker
 
-fake = Faker()
-Faker.seed(42)
-random.seed(42)
-
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "dataset")
-os.makedirs(DATA_DIR, exist_ok=True)
 
-num_orders = 300
-num_bases = 8
-num_vendors = 10
+# Defaults reproduce the original demo dataset size
+DEFAULT_ORDERS = 300
+DEFAULT_BASES = 8
+DEFAULT_VENDORS = 10
+DEFAULT_DAYS = 90
+DEFAULT_SEED = 42
+DEFAULT_CHUNK_ROWS = 250000
+NAME_POOL_SIZE = 5000
+MIN_ORDER_AGE_DAYS = 10
+
+# Independent random streams derived from the seed
+SNAPSHOT_STREAM = 0
+ORDER_STREAM = 1
+
 supply_categories = [
     "Food", "Medical Supplies",
     "Fuel", "Vehicles", "Ammunition", "Communication Equipment"
 ]
-bases = [fake.city() for _ in range(num_bases)]
-vendors = [fake.company() for _ in range(num_vendors)]
-
-def random_date_between(start, end):
-    return start + timedelta(days=random.randint(0, (end - start).days))
-
-supply_orders = []
-for i in range(num_orders):
-    order_date = fake.date_between(start_date='-90d', end_date='-10d')
-    expected_delivery = order_date + timedelta(days=random.randint(5, 30))
-    base = random.choice(bases)
-    vendor = random.choice(vendors)
-    category = random.choice(supply_categories)
-    units = random.randint(20, 1000)
-    unit_cost = random.uniform(100, 2000)
-    total_cost = round(units * unit_cost, 2)
-    priority = random.choice(["Routine", "Urgent", "Emergency"])
-    requester = fake.name()
-
-    supply_orders.append({
-        "order_id": f"ORD-{1000+i}",
-        "order_date": order_date,
+priorities = np.array(["Routine", "Urgent", "Emergency"])
+delivery_methods = np.array(["Truck", "Helicopter", "Convoy", "Chartered Freight"])
+route_risks = np.array(["Low", "Medium", "High"])
+route_risk_weights = np.array([4, 1, 5]) / 10
+delay_choices = np.array([0, 1, 2, 5, -1, -2])
+
+# Per-process lookup tables, set once per worker by _init_worker()
+_pools = {}
+
+def unique_names(generate, count):
+    """Draw ``count`` distinct Faker values, suffixing repeats once the provider runs dry."""
+    names, seen = [], set()
+    for i in range(count):
+        name = generate()
+        if name in seen:
+            name = f"{name} {i}"
+        seen.add(name)
+        names.append(name)
+    return np.array(names)
+
+def build_pools(num_bases, num_vendors, seed):
+    """Precompute Faker name pools once so rows never call Faker individually."""
+    fake = Faker()
+    Faker.seed(seed)
+    return {
+        "bases": unique_names(fake.city, num_bases),
+        "vendors": unique_names(fake.company, num_vendors),
+        "requesters": np.array([fake.name() for _ in range(NAME_POOL_SIZE)])
+    }
+
+def _init_worker(pools):
+    """Install the shared name pools in a worker process."""
+    _pools.update(pools)
+
+def _dates_to_str(values):
+    return np.datetime_as_string(values, unit="D")
+
+def generate_order_chunk(chunk_index, first_order, num_rows, seed, today, days, as_text):
+    """Generate one chunk of orders and their deliveries with vectorized NumPy draws.
+
+    Each chunk draws from its own generator seeded by (seed, chunk index), so
+    the output is identical however chunks are spread across processes.
+    """
+    rng = np.random.default_rng([seed, ORDER_STREAM, chunk_index])
+    bases, vendors, requesters = _pools["bases"], _pools["vendors"], _pools["requesters"]
+    categories = np.array(supply_categories)
+
+    today = np.datetime64(today, "D")
+    order_date = today - rng.integers(MIN_ORDER_AGE_DAYS, max(days, MIN_ORDER_AGE_DAYS) + 1, num_rows)
+    expected_delivery = order_date + rng.integers(5, 31, num_rows)
+    base = bases[rng.integers(0, len(bases), num_rows)]
+    vendor = vendors[rng.integers(0, len(vendors), num_rows)]
+    category = categories[rng.integers(0, len(categories), num_rows)]
+    units = rng.integers(20, 1001, num_rows)
+    unit_cost = rng.uniform(100, 2000, num_rows)
+    order_ids = np.char.add("ORD-", (np.arange(first_order, first_order + num_rows) + 1000).astype(str))
+
+    delay_days = delay_choices[rng.integers(0, len(delay_choices), num_rows)]
+    actual_delivery = expected_delivery + delay_days
+
+    as_date = _dates_to_str if as_text else (lambda values: values)
+    orders = pd.DataFrame({
+        "order_id": order_ids,
+        "order_date": as_date(order_date),
         "base": base,
         "vendor": vendor,
         "supply_category": category,
         "units_ordered": units,
-        "unit_cost": round(unit_cost, 2),
-        "total_cost": total_cost,
-        "priority": priority,
-        "requested_by": requester,
-        "expected_delivery_date": expected_delivery
+        "unit_cost": np.round(unit_cost, 2),
+        "total_cost": np.round(units * unit_cost, 2),
+        "priority": priorities[rng.integers(0, len(priorities), num_rows)],
+        "requested_by": requesters[rng.integers(0, len(requesters), num_rows)],
+        "expected_delivery_date": as_date(expected_delivery)
     })
-
-supply_deliveries = []
-for order in supply_orders:
-    delay_days = random.choice([0, 1, 2, 5, -1, -2])
-    actual_delivery = order["expected_delivery_date"] + timedelta(days=delay_days)
-    delivery_method = random.choice(["Truck", "Helicopter", "Convoy", "Chartered Freight"])
-    route_risk = random.choices(
-    ["Low", "Medium", "High"],
-    weights=[4, 1, 5], 
-)[0]
-
-    supply_deliveries.append({
-        "order_id": order["order_id"],
-        "vendor": order["vendor"],
-        "base": order["base"],
-        "supply_category": order["supply_category"],
-        "expected_delivery_date": order["expected_delivery_date"],
-        "actual_delivery_date": actual_delivery,
-        "delay_days": (actual_delivery - order["expected_delivery_date"]).days,
-        "delivery_method": delivery_method,
-        "route_risk_level": route_risk
+    deliveries = pd.DataFrame({
+        "order_id": order_ids,
+        "vendor": vendor,
+        "base": base,
+        "supply_category": category,
+        "expected_delivery_date": as_date(expected_delivery),
+        "actual_delivery_date": as_date(actual_delivery),
+        "delay_days": delay_days,
+        "delivery_method": delivery_methods[rng.integers(0, len(delivery_methods), num_rows)],
+        "route_risk_level": route_risks[rng.choice(len(route_risks), num_rows, p=route_risk_weights)]
+    })
+    return orders, deliveries
+
+def generate_snapshot_tables(bases, seed, today):
+    """Inventory and budget records for every base x supply category, vectorized."""
+    rng = np.random.default_rng([seed, SNAPSHOT_STREAM])
+    num_rows = len(bases) * len(supply_categories)
+    base = np.repeat(bases, len(supply_categories))
+    category = np.tile(np.array(supply_categories), len(bases))
+
+    # Profile per category; the first Food line is the deliberately critical one
+    critical = np.zeros(num_rows, dtype=bool)
+    critical[np.flatnonzero(np.isin(category, ["Food", "Fuel"]))[:1]] = True
+    ammunition = category == "Ammunition"
+    long_lived = np.isin(category, ["Communication Equipment", "Vehicles", "Medical Supplies"]) & ~critical
+    other = ~(critical | ammunition | long_lived)
+
+    daily_consumption = np.select(
+        [critical, ammunition | long_lived], [rng.uniform(80, 120, num_rows), rng.uniform(5, 50, num_rows)],
+        default=rng.uniform(5, 200, num_rows)
+    )
+    days_remaining = np.select(
+        [critical, ammunition, long_lived],
+        [np.round(rng.uniform(5, 25, num_rows), 1), np.round(rng.uniform(10, 45, num_rows), 1), rng.uniform(61, 120, num_rows)],
+        default=0.0
+    )
+    inventory_level = (daily_consumption * days_remaining).astype(int)
+    inventory_level[other] = rng.integers(500, 10001, num_rows)[other]
+    days_remaining[other] = np.round(inventory_level[other] / daily_consumption[other], 1)
+
+    today = np.datetime64(today, "D")
+    inventory = pd.DataFrame({
+        "base": base,
+        "supply_category": category,
+        "inventory_units": inventory_level,
+        "avg_daily_consumption": np.round(daily_consumption, 2),
+        "days_remaining": np.round(days_remaining, 1),
+        "inventory_status": np.where(days_remaining < 30, "Critical", "Stable"),
+        "last_updated": today - rng.integers(0, 11, num_rows)
     })
 
-inventory_records = []
-tragic_supply_added = False 
-
-for base in bases:
-    for category in supply_categories:
-        if category in ["Food","Fuel"] and not tragic_supply_added:
-            daily_consumption = random.uniform(80, 120)
-            days_remaining = round(random.uniform(5, 25), 1)
-            inventory_level = int(daily_consumption * days_remaining)
-            tragic_supply_added = True
-        
-        elif category in ["Ammunition"]:
-            daily_consumption = random.uniform(5, 50)
-            days_remaining = round(random.uniform(10, 45), 1)
-            inventory_level = int(daily_consumption * days_remaining)
-
-        elif category in ["Communication Equipment", "Vehicles", "Medical Supplies"]:
-            daily_consumption = random.uniform(5, 50)
-            days_remaining = random.uniform(61, 120)
-            inventory_level = int(daily_consumption * days_remaining)
-
+    allocated = rng.integers(112300, 534680, num_rows)
+    spent = allocated * rng.uniform(0.6, 1.2, num_rows)
+    budget = pd.DataFrame({
+        "base": base,
+        "supply_category": category,
+        "budget_allocated": allocated,
+        "budget_spent": np.round(spent, 2),
+        "budget_variance": np.round(spent - allocated, 2)
+    })
+    return inventory, budget
+
+class ChunkWriter:
+    """Append DataFrame chunks to a single CSV or Parquet file without buffering them."""
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self._parquet = None
+        self._first = True
+
+    def write(self, df):
+        if self.file_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+            self._parquet.write_table(table)
         else:
-            inventory_level = random.randint(500, 10000)
-            daily_consumption = random.uniform(5, 200)
-            days_remaining = round(inventory_level / daily_consumption, 1)
-
-        status = "Critical" if days_remaining < 30 else "Stable"
-        last_updated = fake.date_between(start_date='-10d', end_date='today')
-
-        inventory_records.append({
-            "base": base,
-            "supply_category": category,
-            "inventory_units": inventory_level,
-            "avg_daily_consumption": round(daily_consumption, 2),
-            "days_remaining": round(days_remaining, 1),
-            "inventory_status": status,
-            "last_updated": last_updated
-        })
-
-budget_records = []
-for base in bases:
-    for category in supply_categories:
-        allocated = random.randint(112300, 534679)
-        spent = allocated * random.uniform(0.6, 1.2)
-        budget_records.append({
-            "base": base,
-            "supply_category": category,
-            "budget_allocated": allocated,
-            "budget_spent": round(spent, 2),
-            "budget_variance": round(spent - allocated, 2)
-        })
-
-pd.DataFrame(supply_orders).to_csv(os.path.join(DATA_DIR, "supply_orders.csv"), index=False)
-pd.DataFrame(supply_deliveries).to_csv(os.path.join(DATA_DIR, "supply_deliveries.csv"), index=False)
-pd.DataFrame(inventory_records).to_csv(os.path.join(DATA_DIR, "base_inventory_supply.csv"), index=False)
-pd.DataFrame(budget_records).to_csv(os.path.join(DATA_DIR, "supply_budget.csv"), index=False)
-
-print("Supply Orders, Deliveries, Inventory, and Budget datasets created in the 'dataset' directory.")
\ No newline at end of file
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+def generate(num_orders=DEFAULT_ORDERS, num_bases=DEFAULT_BASES, num_vendors=DEFAULT_VENDORS,
+             days=DEFAULT_DAYS, seed=DEFAULT_SEED, output_dir=DATA_DIR, file_format="csv",
+             chunk_rows=DEFAULT_CHUNK_ROWS, workers=1, today=None):
+    """Generate all four datasets, streaming orders/deliveries to disk chunk by chunk."""
+    os.makedirs(output_dir, exist_ok=True)
+    today = today or date.today()
+    pools = build_pools(num_bases, num_vendors, seed)
+    _init_worker(pools)
+    as_text = file_format == "csv"
+
+    chunks = [
+        (index, start, min(chunk_rows, num_orders - start), seed, today, days, as_text)
+        for index, start in enumerate(range(0, num_orders, chunk_rows))
+    ]
+    orders_writer = ChunkWriter(os.path.join(output_dir, f"supply_orders.{file_format}"), file_format)
+    deliveries_writer = ChunkWriter(os.path.join(output_dir, f"supply_deliveries.{file_format}"), file_format)
+
+    def write_chunk(result):
+        orders, deliveries = result
+        orders_writer.write(orders)
+        deliveries_writer.write(deliveries)
+
+    if workers > 1:
+        # Submit in bounded windows so finished chunks never pile up in memory
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pools,)) as pool:
+            for window in range(0, len(chunks), workers * 2):
+                futures = [pool.submit(generate_order_chunk, *chunk) for chunk in chunks[window:window + workers * 2]]
+                for future in futures:
+                    write_chunk(future.result())
+    else:
+        for chunk in chunks:
+            write_chunk(generate_order_chunk(*chunk))
+    orders_writer.close()
+    deliveries_writer.close()
+
+    inventory, budget = generate_snapshot_tables(pools["bases"], seed, today)
+    if as_text:
+        inventory["last_updated"] = _dates_to_str(inventory["last_updated"].values.astype("datetime64[D]"))
+    for name, df in (("base_inventory_supply", inventory), ("supply_budget", budget)):
+        writer = ChunkWriter(os.path.join(output_dir, f"{name}.{file_format}"), file_format)
+        writer.write(df)
+        writer.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic supply logistics datasets")
+    parser.add_argument("--orders", type=int, default=DEFAULT_ORDERS, help="number of orders (and deliveries)")
+    parser.add_argument("--bases", type=int, default=DEFAULT_BASES, help="number of bases")
+    parser.add_argument("--vendors", type=int, default=DEFAULT_VENDORS, help="number of vendors")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="order date span in days before today")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="random seed (output is deterministic per seed and chunk size)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="output file format")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="orders generated and written per chunk")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes generating chunks in parallel")
+    parser.add_argument("--output-dir", default=DATA_DIR, help="directory to write the datasets to")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    generate(num_orders=args.orders, num_bases=args.bases, num_vendors=args.vendors, days=args.days,
+             seed=args.seed, output_dir=args.output_dir, file_format=args.format,
+             chunk_rows=args.chunk_rows, workers=args.workers)
+    print(f"Supply Orders, Deliveries, Inventory, and Budget datasets created in '{args.output_dir}'.")
@@ -0,0 +1,62 @@
+import os
+import sys
+import csv
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis", "analysis_script"))
+import data_store
+
+TABLE = "supply_deliveries"
+
+def delivery(order_id, date, delay=0):
+    return [order_id, "Vendor", "Base", "Food", date, date, delay, "Truck", "Low"]
+
+def write_deliveries(base_path, rows):
+    with open(data_store.source_file(TABLE, base_path), "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(data_store.TABLE_SCHEMAS[TABLE])
+        writer.writerows(rows)
+
+@pytest.fixture
+def store(tmp_path):
+    """A store whose deliveries watermark lies far ahead of today, as in generated data."""
+    rows = [delivery(f"ORD-{i}", "2026-11-11") for i in range(3)]
+    write_deliveries(tmp_path, rows)
+    con = data_store.connect_store(str(tmp_path / "store.duckdb"))
+    data_store.ingest_incremental(con, TABLE, str(tmp_path))
+    yield con, tmp_path, rows
+    con.close()
+
+def stored(con):
+    return dict(con.execute(f"SELECT order_id, delay_days FROM {TABLE}").fetchall())
+
+def test_late_dated_appends_are_ingested(store):
+    con, base_path, rows = store
+    appended = [delivery("ORD-10", "2025-01-01"), delivery("ORD-11", "2025-01-02", delay=3)]
+    write_deliveries(base_path, rows + appended)
+
+    assert data_store.ingest_incremental(con, TABLE, str(base_path)) == 2
+    assert stored(con) == {"ORD-0": 0, "ORD-1": 0, "ORD-2": 0, "ORD-10": 0, "ORD-11": 3}
+    assert con.execute(f"""
+        SELECT COUNT(*) FROM _change_log WHERE table_name = '{TABLE}' AND change_type = 'insert'
+    """).fetchone()[0] == 2
+
+def test_corrections_outside_the_window_are_ingested(store):
+    con, base_path, rows = store
+    write_deliveries(base_path, rows + [delivery("ORD-10", "2025-01-01")])
+    data_store.ingest_incremental(con, TABLE, str(base_path))
+    write_deliveries(base_path, rows + [delivery("ORD-10", "2025-01-01", delay=5)])
+
+    assert data_store.ingest_incremental(con, TABLE, str(base_path)) == 1
+    assert stored(con)["ORD-10"] == 5
+
+def test_rows_missing_from_the_source_are_not_recorded(store):
+    con, base_path, rows = store
+    manifest = con.execute("SELECT * FROM _ingest_manifest").fetchall()
+    write_deliveries(base_path, rows[1:])
+
+    with pytest.raises(ValueError, match="1 order_ids"):
+        data_store.ingest_incremental(con, TABLE, str(base_path))
+    assert con.execute("SELECT * FROM _ingest_manifest").fetchall() == manifest
+    assert len(stored(con)) == 3